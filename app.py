@@ -19,12 +19,258 @@ import urllib.parse
 import matplotlib.dates as mdates
 import time
 
-# Define available sites and coordinates
-sites = {
-    "Lidcombe": [-33.865, 151.045],
-    "Stockton": [-32.909, 151.784]
-}
+from get_data_api2 import AQMS_API
+from obs_normalize import normalize_observations
+from ghg_loader import DATA_DIR, PICARRO_SITES, GAS_UNITS, day_slice, ensure_sorted, frame_memory, \
+    full_load_bytes, hourly_mean, parse_datetime, read_picarro_csv, site_files, time_slice
+from obs_store import API_DIR, STORE_FILE, ObservationStore, data_fingerprint, load_or_build_store, \
+    read_parameters_json, read_sites_json
+from cube_archive import CubeArchive
+from compare import AlignedSeriesCache, column_name, differences
+from background import DEFAULT_QUANTILE, DEFAULT_WINDOW_DAYS, BackgroundCache
+from climatology import DAY_TYPES, SEASONS, build_cube
+from correlation import build_engine
+from trend import TrendCache, detrend, evaluate, growth_rate
+from polar_stats import PolarStatsCache, grid_to_frame
+from gap_index import GapIndex
+from units import canonical_unit, compatible_units, convert, parameter_units, picarro_unit
+from spatial import day_frames, frame_to_png, grid_from_sites
+from site_catalogue import SiteCatalogue
+from out_of_core import aggregate, rose
+from instrumentation import Tracer, note_cache_miss
+from webgl_chart import DEFAULT_MAX_POINTS, series_trace, time_series_figure
+from prefetch import Prefetcher
+import base64
+
+SPATIAL_PARAMETERS = ["NO2", "OZONE", "PM2.5", "PM10", "NO", "SO2", "CO", "NH3"]
 
+# Define available sites and coordinates
+sites = PICARRO_SITES
+
+
+@st.cache_resource
+def load_store():
+    """
+    Observation store shared by all sessions, seeded with the local Picarro
+    files (from the cache/store.parquet snapshot the query service also uses,
+    when it matches the files), or from a cube archive when GHG_CUBE points at one,
+    plus the AQMS pulls saved under cache/api.
+    """
+    note_cache_miss()
+    cube_path = os.environ.get("GHG_CUBE")
+    if cube_path:
+        store = ObservationStore()
+        store.add_cube(CubeArchive(cube_path))
+        store.add_aqms_sites(read_sites_json())
+    else:
+        store, _ = load_or_build_store(DATA_DIR)
+    store.add_api_dir(API_DIR)
+    return store
+
+
+@st.cache_resource
+def load_comparison_cache(freq):
+    """
+    Aligned comparison matrices, cached per resampling frequency.
+    """
+    return AlignedSeriesCache(load_store(), freq)
+
+
+@st.cache_resource(max_entries=1)
+def load_climatology(fingerprint):
+    """
+    Diurnal/seasonal climatology cube. fingerprint (of the data files)
+    makes a new or changed monthly file trigger the incremental update.
+    """
+    return build_cube(DATA_DIR)
+
+
+@st.cache_resource(max_entries=1)
+def load_correlation_engine(fingerprint):
+    """
+    Monthly correlation statistics. fingerprint (of the data files) makes a
+    new or changed monthly file trigger the incremental update.
+    """
+    return build_engine(DATA_DIR)
+
+
+@st.cache_resource
+def load_trend_cache():
+    """
+    Trend fits, refitted only when a site's data changes.
+    """
+    return TrendCache()
+
+
+@st.cache_resource
+def load_polar_cache():
+    """
+    Polar direction/speed grids, cached per site, gas, period and settings.
+    """
+    return PolarStatsCache(load_store())
+
+
+@st.cache_resource
+def load_background_cache():
+    """
+    Background / enhancement series, cached per site, gas, window and percentile.
+    """
+    return BackgroundCache(load_store())
+
+
+@st.cache_resource
+def load_gap_index():
+    """
+    Gap and completeness index from cache/ (the ETL gaps task), built and
+    saved only when missing or older than the store snapshot; series added
+    to the store afterwards (API pulls) are re-indexed as they arrive.
+    """
+    store = load_store()
+    return GapIndex.load_or_build(store, newer_than=STORE_FILE).follow(store)
+
+
+@st.cache_resource
+def load_idw_grid():
+    """
+    KD-tree neighbours and IDW weights from every AQMS station to the map grid.
+    """
+    return grid_from_sites(read_sites_json())
+
+
+@st.cache_data(ttl=3600, max_entries=8)
+def load_spatial_day(parameter, day):
+    """
+    One get_Observations call for every station, interpolated for all 24 hours at once.
+    """
+    payload = {
+        "Sites": load_idw_grid().site_ids,
+        "Parameters": [parameter],
+        "StartDate": day,
+        "EndDate": day,
+        "Categories": ["Averages"],
+        "SubCategories": ["Hourly"],
+        "Frequency": ["Hourly average"]
+    }
+    response = AQMS_API().get_observations(payload)
+    response.raise_for_status()
+    obs = normalize_observations(response.json(), parameters=[parameter])
+    return day_frames(load_idw_grid(), obs, day)
+
+
+@st.cache_data(max_entries=256)
+def spatial_png(parameter, day, hour):
+    """
+    PNG overlay for one (parameter, hour), coloured on the whole day's range so frames compare.
+    """
+    note_cache_miss()
+    hours, frames = load_spatial_day(parameter, day)
+    frame = frames[hour - 1]
+    if np.isnan(frame).all():
+        return None, None, None
+    vmin, vmax = np.nanmin(frames), np.nanmax(frames)
+    return frame_to_png(frame, vmin, vmax), vmin, vmax
+
+
+@st.cache_data(max_entries=32)
+def archive_statistics(site, columns, by, workers, signature):
+    """
+    Out-of-core statistics over every file of a site. signature (file
+    names and modification times) makes the cache follow new data.
+    """
+    note_cache_miss()
+    return aggregate(site_files(site), list(columns), by, workers=workers)
+
+
+@st.cache_data(max_entries=32)
+def archive_rose(site, value_col, workers, signature):
+    return rose(site_files(site), value_col, workers=workers)
+
+
+@st.cache_data
+def load_parameter_units():
+    """
+    ParameterCode -> unit of the hourly averages in parameters.json.
+    """
+    return parameter_units(read_parameters_json())
+
+
+@st.cache_resource
+def load_site_catalogue():
+    """
+    AQMS stations and Picarro sites indexed for nearest, radius and region lookups.
+    """
+    return SiteCatalogue.from_files()
+
+
+@st.cache_data(max_entries=256)
+def file_dates(path, mtime_ns):
+    """
+    Dates present in one monthly file; mtime_ns makes the cache follow changes.
+    """
+    # Only the date/time columns are needed to list available dates
+    df = pd.read_csv(path, usecols=lambda c: c in ("Date Time", "DATE", "TIME"))
+    return parse_datetime(df).dt.date.dropna().unique().tolist()
+
+
+def load_month(path, mtime_ns, columns):
+    """
+    One monthly file for the main view: the compact frame of the given
+    columns and its hourly means. Callers must not modify either frame.
+    """
+    note_cache_miss()
+    df = read_picarro_csv(path, columns=list(columns), compact=True)
+    return df, hourly_mean(df)
+
+
+@st.cache_data
+def file_full_load_bytes(path, mtime_ns):
+    """
+    Memory of a plain whole-file read, measured once per file version.
+    """
+    return full_load_bytes(path)
+
+
+@st.cache_resource
+def load_prefetcher():
+    """
+    Monthly loads shared by all sessions; neighbouring months are loaded in
+    the background while the current one is on screen.
+    """
+    return Prefetcher(load_month, workers=2, max_entries=12)
+
+
+@st.cache_resource
+def load_sql_engine():
+    """
+    DuckDB views over the Parquet mirror of the archive and the store snapshot.
+    """
+    from sql_engine import SQLEngine
+
+    return SQLEngine()
+
+
+def month_key(path, columns):
+    return path, os.stat(path).st_mtime_ns, tuple(columns)
+
+
+# ------------------------
+# Performance panel: per-stage spans for this session
+# ------------------------
+if "tracer" not in st.session_state:
+    # GHG_TRACE_LOG=spans.jsonl records every session to one file for later aggregation
+    st.session_state.tracer = Tracer(log_path=os.environ.get("GHG_TRACE_LOG"))
+tracer = st.session_state.tracer
+current_run = tracer.new_run()
+
+perf_panel = st.sidebar.expander("Performance")
+tracer.configure(perf_panel.checkbox("Record stage timings", value=bool(tracer.log_path)),
+                 perf_panel.checkbox("Trace memory (slower)"))
+if tracer.enabled:
+    # Filled in as each span of this run ends, so stages before an st.stop() still show
+    perf_table = perf_panel.empty()
+    tracer.listeners.append(lambda t: perf_table.dataframe(t.summary(current_run), hide_index=True))
+    perf_panel.download_button("Download span log (JSON lines)", tracer.to_jsonl(),
+                               file_name=f"ghg_viewer_spans_{tracer.session}.jsonl", mime="application/json")
 
 # Layout: create 2 columns (left narrow for map)
 col1, col2 = st.columns([1, 3])
@@ -32,11 +278,36 @@ col1, col2 = st.columns([1, 3])
 with col1:
     st.markdown("### NSW Piccarro Site Locations")
 
+    # Optional interpolated AQMS layer for the map
+    map_layer = st.sidebar.expander("AQMS Map Layer")
+    show_layer = map_layer.checkbox("Show interpolated AQMS layer")
+
     # Create the Folium map
     m = folium.Map(location=[-33.5, 151.0], zoom_start=6)
     for name, coords in sites.items():
         folium.Marker(location=coords, popup=name).add_to(m)
 
+    if show_layer:
+        layer_param = map_layer.selectbox("Layer Parameter", SPATIAL_PARAMETERS)
+        layer_date = map_layer.date_input("Layer Date", datetime.now().date() - timedelta(days=1))
+        layer_hour = map_layer.slider("Hour ending", 1, 24, 12)
+        try:
+            with tracer.span("map_layer", cached=True, parameter=layer_param):
+                png, vmin, vmax = spatial_png(layer_param, layer_date.strftime("%Y-%m-%d"), layer_hour)
+        except Exception as e:
+            map_layer.warning(f"Could not build map layer: {e}")
+        else:
+            if png is None:
+                map_layer.info(f"No {layer_param} data for {layer_date} hour {layer_hour}.")
+            else:
+                (south, west), (north, east) = load_idw_grid().bounds
+                folium.raster_layers.ImageOverlay(
+                    image="data:image/png;base64," + base64.b64encode(png).decode(),
+                    bounds=[[south, west], [north, east]],
+                    opacity=1.0,
+                ).add_to(m)
+                map_layer.caption(f"{layer_param}: {vmin:.3g} (dark) to {vmax:.3g} (bright), IDW from AQMS sites")
+
     # Save to a temporary HTML file
     with tempfile.NamedTemporaryFile('w', delete=False, suffix='.html') as f:
         m.save(f.name)
@@ -56,9 +327,9 @@ with col2:
     # -----------------------------
     # Configuration
     # -----------------------------
-    DATA_DIR = "ghg_csv"  # folder with files like Lidcombe_YYYYMMDD.csv
     GASES = ["CH4", "CO2", "H2O", "N2O", "NH3"]
     SITES = ["Lidcombe", "Stockton"]
+    VIEW_COLUMNS = GASES + ["Wind_Speed", "Wind_Direction"]
 
     # -----------------------------
     # Sidebar: Site & Gas Selection
@@ -68,12 +339,13 @@ with col2:
     selected_gas = st.sidebar.selectbox("Select Gas", GASES)
     view_mode = st.sidebar.radio("View Mode", ["Single Day", "Full Month"])
     plot_mode = st.sidebar.radio("Plot Type", ["Line Only", "Bar Only", "Combined"])
+    chart_engine = st.sidebar.radio("Chart Engine", ["Static (matplotlib)", "Interactive (WebGL)"],
+                                    help="Interactive charts zoom and pan in the browser without a rerun")
 
     # -----------------------------
     # Find Available Dates
     # -----------------------------
-    file_pattern = os.path.join(DATA_DIR, f"{selected_site}_*.csv")
-    available_files = sorted(glob.glob(file_pattern))
+    available_files = site_files(selected_site, DATA_DIR)
 
     if not available_files:
         st.warning(f"No files found for site {selected_site} in {DATA_DIR}")
@@ -85,28 +357,15 @@ with col2:
     # Extract all available dates from the contents of all files
 
     available_dates = set()
-    for f in available_files:
-        try:
-            if "Stockton" in os.path.basename(f):
-                df = pd.read_csv(f, usecols=["Date Time"], dayfirst=True)
-                df["datetime"] = pd.to_datetime(df["Date Time"], dayfirst=True, errors='coerce')
-                df.rename(columns={
-                    'CH4_Pic_0': 'CH4',
-                    'CO2_Pic_0': 'CO2',
-                    'N2O_Pic_0': 'N2O',
-                    'NH3_Pic_0': 'NH3',
-                    'H2O_Pic_0': 'H2O',
-                    'WSP_0': 'Wind_Speed',
-                    'WDR_0': 'Wind_Direction'
-                }, inplace=True)
-            else:
-                df = pd.read_csv(f, usecols=["DATE", "TIME"])
-                df["datetime"] = pd.to_datetime(df["DATE"] + " " + df["TIME"], dayfirst=True, errors='coerce')
+    with tracer.span("file_scan", files=len(available_files)) as span:
+        for f in available_files:
+            try:
+                available_dates.update(file_dates(f, os.stat(f).st_mtime_ns))
 
-            available_dates.update(df["datetime"].dt.date.dropna().unique())
-
-        except Exception as e:
-            st.warning(f"Failed to parse dates in {f}: {e}")
+            except Exception as e:
+                st.warning(f"Failed to parse dates in {f}: {e}")
+        if tracer.enabled:
+            span.set(rows=len(available_dates), bytes=sum(os.path.getsize(f) for f in available_files))
 
 
     available_dates = sorted(available_dates)
@@ -136,57 +395,39 @@ with col2:
         st.stop()
 
 
-    df = pd.read_csv(monthly_file, dayfirst=True)
-    #st.write("Original columns:", df.columns.tolist())  # Debug output
-
-    # Detect and harmonize file format BEFORE column cleaning
-    if "Date Time" in df.columns:
-        # Stockton format
-        df.rename(columns={
-            'CH4_Pic_0': 'CH4',
-            'CO2_Pic_0': 'CO2',
-            'N2O_Pic_0': 'N2O',
-            'NH3_Pic_0': 'NH3',
-            'H2O_Pic_0': 'H2O',
-            'WSP_0': 'Wind_Speed',
-            'WDR_0': 'Wind_Direction'
-        }, inplace=True)
-
-        df["datetime"] = pd.to_datetime(df["Date Time"], dayfirst=True, errors='coerce')
-        if df["datetime"].isnull().any():
-            st.warning("Some datetime parsing errors detected in Stockton data.")
-
-        # Set datetime index and resample to hourly mean
-        df = df.dropna(subset=["datetime"])
-        #df = df.set_index("datetime")
-        #df = df.set_index("datetime", inplace=True)
-        #df = df.resample('H').mean().reset_index()
-
-    elif "DATE" in df.columns and "TIME" in df.columns:
-        # Lidcombe format
-        df["datetime"] = pd.to_datetime(df["DATE"] + " " + df["TIME"], dayfirst=True, errors='coerce')
-
-    else:
-        st.error("Unknown file format. Required columns not found.")
+    # Load the file, harmonize Lidcombe/Stockton layouts and clean column names
+    # Only the gases and wind columns are used below; they are read as float32 / categoricals
+    # and resampled to hourly means, usually already prefetched while the previous view was shown
+    prefetcher = load_prefetcher()
+    try:
+        with tracer.span("read_csv", cached=True, file=os.path.basename(monthly_file)) as span:
+            df, hourly = prefetcher.get(*month_key(monthly_file, VIEW_COLUMNS))
+            if tracer.enabled:
+                span.set(rows=len(df), bytes=os.path.getsize(monthly_file), memory=frame_memory(df))
+    except ValueError as e:
+        st.error(str(e))
         st.stop()
 
-    # Now clean column names
-    df.columns = df.columns.str.replace(r"\s*\(.*\)", "", regex=True).str.strip()
-    #st.write("Cleaned columns:", df.columns.tolist())  # Debug output
-
-    # Set index and resample
-    df.set_index("datetime", inplace=True)
-    #df = df.resample("H").mean().reset_index()
+    # Warm the neighbouring months (all gases are in the same frame) for the next step;
+    # this session's earlier requests that have not started are cancelled
+    position = available_files.index(monthly_file)
+    prefetcher.prefetch([month_key(f, VIEW_COLUMNS) for f in available_files[max(position - 1, 0):position + 2]
+                         if f != monthly_file], owner=tracer.session)
+    if tracer.enabled:
+        perf_panel.caption("Month cache: " + ", ".join(f"{k} {v}" for k, v in prefetcher.stats.items()))
 
-    # Separate numeric and non-numeric columns
-    numeric_df = df.select_dtypes(include=["number"])
+    loaded_bytes = frame_memory(df)
+    full_bytes = file_full_load_bytes(monthly_file, os.stat(monthly_file).st_mtime_ns)
+    st.sidebar.caption(f"Loaded {len(df.columns) - 1} columns, {loaded_bytes / 2 ** 20:.2f} MB in memory "
+                       f"({full_bytes / 2 ** 20:.2f} MB for all columns as float64/strings, "
+                       f"{100 * (1 - loaded_bytes / full_bytes):.0f}% saved)")
 
-    # Resample numeric columns only
-    numeric_df = numeric_df.resample("H").mean()
+    # Full-resolution samples, kept for the interactive chart's detail window
+    samples = df
 
-    # Reset index to bring datetime back as a column
-    numeric_df = numeric_df.reset_index()
-    df = numeric_df
+    # Hourly means of the numeric columns, datetime as a column; a shallow copy
+    # so the columns changed below never reach the cached frame
+    df = hourly.copy(deep=False)
 
     # Process selected gas
     if selected_gas in df.columns:
@@ -195,9 +436,16 @@ with col2:
         st.error(f"Selected gas column '{selected_gas}' not found in file.")
         st.stop()
 
-    # Filter by single day if required
+    # Convert the whole gas column to the chosen display unit
+    native_unit = picarro_unit(selected_gas)
+    unit_options = compatible_units(native_unit)
+    display_unit = st.sidebar.selectbox("Display Unit", unit_options,
+                                        index=unit_options.index(canonical_unit(native_unit)))
+    df[selected_gas] = convert(df[selected_gas], native_unit, display_unit)
+
+    # Filter by single day if required (binary search on the sorted hourly frame)
     if view_mode == "Single Day":
-        df = df[df["datetime"].dt.date == selected_date]
+        df = day_slice(df, selected_date)
 
     # Rename columns to remove units and match expected gas names
     # Clean column names: remove units (if any)
@@ -225,7 +473,7 @@ with col2:
 
     # Drop NA datetime or selected_gas
     df = df.dropna(subset=["datetime", selected_gas])
-    df = df.sort_values("datetime")
+    df = ensure_sorted(df)
 
     # Plotting
     st.title("GHG Analysis dashboard")
@@ -275,6 +523,7 @@ with col2:
 
         show_windrose = st.sidebar.checkbox("Show Wind Rose")
         show_pollution_rose = st.sidebar.checkbox("Show Pollution Rose")
+        show_polar_plot = st.sidebar.checkbox("Show Polar Plot (CPF / Mean)")
 
         # Prepare wind data
         wind_df = df.dropna(subset=["Wind_Speed", "Wind_Direction"])
@@ -419,69 +668,159 @@ with col2:
 
                             st.plotly_chart(fig)
 
-    # Plotting setup
-    fig, ax = plt.subplots(figsize=(10, 4))
+        if show_polar_plot:
+            import plotly.graph_objects as go
+
+            st.sidebar.markdown("### Polar Plot Options")
+            polar_gas = st.sidebar.selectbox("Polar Plot Gas", [g for g in GASES if g in df.columns])
+            polar_stat = st.sidebar.radio("Statistic", ["Mean concentration", "CPF"])
+            cpf_percentile = st.sidebar.slider("CPF percentile", 50, 99, 75)
+            polar_smooth = st.sidebar.slider("Smoothing (cells)", 0.0, 3.0, 1.0, step=0.5)
+
+            if view_mode == "Single Day":
+                polar_start = pd.Timestamp(selected_date)
+                polar_end = polar_start + pd.Timedelta(hours=23, minutes=59)
+            else:
+                polar_start = pd.Timestamp(selected_date).replace(day=1)
+                polar_end = polar_start + pd.offsets.MonthBegin(1) - pd.Timedelta(minutes=1)
+
+            grid = load_polar_cache().get(selected_site, polar_gas, polar_start, polar_end, dir_bin=10,
+                                          speed_bin=1.0, percentile=cpf_percentile, smooth=polar_smooth)
+            statistic = "mean" if polar_stat == "Mean concentration" else "cpf"
+            cells = grid_to_frame(grid, statistic)
+
+            if cells.empty:
+                st.warning("Not enough wind data for a polar plot.")
+            else:
+                if statistic == "cpf":
+                    st.markdown(f"### CPF – {polar_gas} above p{cpf_percentile} "
+                                f"({grid['threshold']:.3g} {GAS_UNITS.get(polar_gas, '')})")
+                    colorbar_title = "CPF"
+                else:
+                    st.markdown(f"### Mean {polar_gas} by Wind Direction and Speed")
+                    colorbar_title = f"{polar_gas} ({GAS_UNITS.get(polar_gas, '')})"
+
+                # One bar segment per (direction, speed) cell, radius = wind speed
+                fig = go.Figure(go.Barpolar(
+                    r=cells["speed_width"],
+                    base=cells["speed_lo"],
+                    theta=cells["direction"],
+                    width=10,
+                    marker=dict(color=cells[statistic], colorscale="Viridis", line_width=0,
+                                colorbar=dict(title=colorbar_title)),
+                    customdata=np.column_stack([cells["count"], cells["speed_lo"] + cells["speed_width"]]),
+                    hovertemplate="Dir %{theta}°<br>Speed %{base}–%{customdata[1]}<br>"
+                                  "Value %{marker.color:.3g}<br>Hours %{customdata[0]:.0f}<extra></extra>",
+                ))
+                fig.update_layout(
+                    polar=dict(angularaxis=dict(direction="clockwise", rotation=90),
+                               radialaxis=dict(title="Wind speed")),
+                    template="plotly_white",
+                    height=600,
+                )
+                st.plotly_chart(fig)
 
     if view_mode == "Full Month":
         df["date"] = df["datetime"].dt.date
         daily_avg = df.groupby("date")[selected_gas].mean().reset_index()
 
-        if plot_mode in ["Line Only", "Combined"]:
-            ax.plot(df["datetime"], df[selected_gas], marker="o", linestyle="-", label="Hourly")
+    if chart_engine == "Interactive (WebGL)":
+        # Overview of the whole view at a fixed point budget; the detail window is
+        # re-sliced from the full-resolution samples only when it changes
+        chart_options = st.sidebar.expander("Interactive Chart", expanded=True)
+        max_points = chart_options.number_input("Points per series", 500, 50_000, DEFAULT_MAX_POINTS, step=500)
+
+        detail = ensure_sorted(samples[["datetime", selected_gas]].dropna())
+        if view_mode == "Single Day":
+            detail = day_slice(detail, selected_date)
+        if detail.empty:
+            st.warning("No data available for the selected period.")
+            st.stop()
+        detail = detail.assign(**{selected_gas: convert(detail[selected_gas], native_unit, display_unit)})
+
+        first = detail["datetime"].iloc[0].to_pydatetime()
+        last = detail["datetime"].iloc[-1].to_pydatetime()
+        window = (first, last)
+        if last > first:
+            window = chart_options.slider("Detail window", min_value=first, max_value=last, value=(first, last),
+                                          step=timedelta(minutes=10), format="DD MMM HH:mm")
+        window = (window[0], window[1] + timedelta(microseconds=1))  # inclusive end
+        detail = time_slice(detail, *window)
+
+        with tracer.span("webgl_chart", rows=len(detail)) as span:
+            traces = []
+            if plot_mode in ["Line Only", "Combined"]:
+                traces.append(series_trace(detail, selected_gas, "Samples", max_points))
+                traces.append(series_trace(time_slice(df, *window), selected_gas, "Hourly", max_points,
+                                           line=dict(width=3), opacity=0.6))
+            bars = None
+            if view_mode == "Full Month" and plot_mode in ["Bar Only", "Combined"]:
+                bars = (pd.to_datetime(daily_avg["date"]) + pd.Timedelta(hours=12), daily_avg[selected_gas],
+                        "Daily Avg")
+            elif view_mode == "Single Day" and plot_mode == "Bar Only":
+                bars = ([pd.Timestamp(selected_date) + pd.Timedelta(hours=12)], [df[selected_gas].mean()], "Daily Avg")
+            fig = time_series_figure(traces, f"{selected_gas} at {selected_site}", f"{selected_gas} ({display_unit})",
+                                     bars=bars, revision=f"{monthly_file}|{selected_gas}|{view_mode}|{window}")
+            st.plotly_chart(fig, config={"scrollZoom": True})
+            span.set(points=sum(len(t.x) for t in traces))
+        chart_options.caption(f"Sent {sum(len(t.x) for t in traces):,} line points for {len(detail):,} samples "
+                              f"in the window; use the plot toolbar to export a PNG")
 
-        if plot_mode in ["Bar Only", "Combined"]:
-            ax.bar(daily_avg["date"], daily_avg[selected_gas], width=0.6, alpha=0.3, label="Daily Avg")
+    else:
+        # Plotting setup
+        fig, ax = plt.subplots(figsize=(10, 4))
 
-        ax.set_title(f"{selected_gas} for {selected_date.strftime('%B %Y')}")
+        if view_mode == "Full Month":
+            if plot_mode in ["Line Only", "Combined"]:
+                ax.plot(df["datetime"], df[selected_gas], marker="o", linestyle="-", label="Hourly")
 
-        ax.xaxis.set_major_locator(mdates.DayLocator(interval=3))  # spacing ticks every 3 days
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d %b'))
+            if plot_mode in ["Bar Only", "Combined"]:
+                ax.bar(daily_avg["date"], daily_avg[selected_gas], width=0.6, alpha=0.3, label="Daily Avg")
 
-    else:  # Single Day
-        # Filter data to selected date only
-        day_data = df[df["datetime"].dt.date == selected_date]
-        if day_data.empty:
-            st.warning("No data available for the selected day.")
-            st.stop()
+            ax.set_title(f"{selected_gas} for {selected_date.strftime('%B %Y')}")
 
-        if plot_mode in ["Line Only", "Combined"]:
-            ax.plot(day_data["datetime"], day_data[selected_gas], marker="o", linestyle="-", label="Hourly")
-
-        if plot_mode == "Bar Only":
-            avg_val = day_data[selected_gas].mean()
-            bar_time = datetime.combine(selected_date, datetime.min.time())
-            ax.bar([bar_time], [avg_val], width=0.03, alpha=0.5, label="Daily Avg")
-
-        ax.set_title(f"{selected_gas} on {selected_date.strftime('%Y-%m-%d')}")
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-
-    # Labels and formatting
-    ax.set_xlabel("Time")
-    #ax.set_ylabel(f"{selected_gas} concentration")
-    # Define gas units
-    GAS_UNITS = {
-        "CH4": "ppm",
-        "CO2": "ppm",
-        "N2O": "ppm",
-        "NH3": "ppb",
-        "H2O": "%",
-    }
+            ax.xaxis.set_major_locator(mdates.DayLocator(interval=3))  # spacing ticks every 3 days
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d %b'))
 
-    unit = GAS_UNITS.get(selected_gas, "")
-    ax.set_ylabel(f"{selected_gas} ({unit})")
+        else:  # Single Day
+            # Filter data to selected date only
+            day_data = day_slice(df, selected_date)
+            if day_data.empty:
+                st.warning("No data available for the selected day.")
+                st.stop()
 
-    ax.grid(True)
-    ax.legend()
-    fig.autofmt_xdate(rotation=30)
-    fig.autofmt_xdate()
+            if plot_mode in ["Line Only", "Combined"]:
+                ax.plot(day_data["datetime"], day_data[selected_gas], marker="o", linestyle="-", label="Hourly")
 
-    # Show plot
-    st.pyplot(fig)
+            if plot_mode == "Bar Only":
+                avg_val = day_data[selected_gas].mean()
+                bar_time = datetime.combine(selected_date, datetime.min.time())
+                ax.bar([bar_time], [avg_val], width=0.03, alpha=0.5, label="Daily Avg")
+
+            ax.set_title(f"{selected_gas} on {selected_date.strftime('%Y-%m-%d')}")
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+
+        # Labels and formatting
+        ax.set_xlabel("Time")
+        #ax.set_ylabel(f"{selected_gas} concentration")
+        unit = display_unit
+        ax.set_ylabel(f"{selected_gas} ({unit})")
+
+        ax.grid(True)
+        ax.legend()
+        fig.autofmt_xdate(rotation=30)
+        fig.autofmt_xdate()
+
+        # Show plot
+        with tracer.span("render", rows=len(df)):
+            st.pyplot(fig)
 
-    # Export plot
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches='tight')
-    st.download_button("Download Plot as PNG", buf.getvalue(), file_name=f"{selected_site}_{selected_gas}_{selected_date.strftime('%Y%m%d')}.png", mime="image/png")
+        # Export plot
+        with tracer.span("png_export") as span:
+            buf = io.BytesIO()
+            fig.savefig(buf, format="png", bbox_inches='tight')
+            span.set(bytes=buf.tell())
+        st.download_button("Download Plot as PNG", buf.getvalue(), file_name=f"{selected_site}_{selected_gas}_{selected_date.strftime('%Y%m%d')}.png", mime="image/png")
 
     # CSV downloads
     st.download_button("Download Full CSV", data=df.to_csv(index=False), file_name=os.path.basename(monthly_file))
@@ -490,11 +829,313 @@ with col2:
         daily_avg_csv = daily_avg.rename(columns={selected_gas: f"{selected_gas}_daily_avg"})
         st.download_button("Download Daily Averages", data=daily_avg_csv.to_csv(index=False), file_name=f"{selected_site}_{selected_gas}_daily_avg_{selected_month}.csv")
 
+    # ------------------------
+    # Background / enhancement separation
+    # ------------------------
+    st.sidebar.markdown("### Background & Enhancement")
+    if st.sidebar.checkbox("Show Background / Enhancement"):
+        bg_window = st.sidebar.slider("Background window (days)", 1, 30, DEFAULT_WINDOW_DAYS)
+        bg_percentile = st.sidebar.slider("Background percentile", 1, 50, int(DEFAULT_QUANTILE * 100))
+
+        # Computed over the site's whole record and cached beside the store, which is left untouched
+        bg_df = load_background_cache().get(selected_site, selected_gas, bg_window, bg_percentile / 100)
+
+        if view_mode == "Single Day":
+            bg_start = pd.Timestamp(selected_date)
+            bg_end = bg_start + pd.Timedelta(days=1)
+        else:
+            bg_start = pd.Timestamp(selected_date).replace(day=1)
+            bg_end = bg_start + pd.offsets.MonthBegin(1)
+        bg_df = bg_df[(bg_df.index >= bg_start) & (bg_df.index < bg_end)]
+
+        if bg_df["background"].isnull().all():
+            st.info("Not enough data to estimate a background for this period.")
+        else:
+            st.markdown(f"### {selected_gas} Background & Enhancement "
+                        f"(p{bg_percentile}, {bg_window}-day window)")
+            fig, (ax, ax_enh) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+            ax.plot(bg_df.index, bg_df["value"], label=selected_gas)
+            ax.plot(bg_df.index, bg_df["background"], label="Background", linewidth=2)
+            ax.set_ylabel(f"{selected_gas} ({GAS_UNITS.get(selected_gas, '')})")
+            ax.grid(True)
+            ax.legend()
+            ax_enh.fill_between(bg_df.index, bg_df["enhancement"], 0, alpha=0.5, label="Enhancement")
+            ax_enh.set_ylabel("Enhancement")
+            ax_enh.grid(True)
+            ax_enh.legend()
+            fig.autofmt_xdate()
+            st.pyplot(fig)
+
+            st.download_button("Download Background CSV", data=bg_df.to_csv(),
+                               file_name=f"{selected_site}_{selected_gas}_background_{selected_month}.csv")
+
+    # ------------------------
+    # Diurnal cycle from the climatology cube
+    # ------------------------
+    st.sidebar.markdown("### Diurnal Cycle")
+    if st.sidebar.checkbox("Show Diurnal Cycle"):
+        season = st.sidebar.selectbox("Season", list(SEASONS))
+        day_type = st.sidebar.radio("Days", list(DAY_TYPES))
+
+        climatology = load_climatology(data_fingerprint(DATA_DIR))
+        cycle = climatology.diurnal_cycle(selected_site, selected_gas, SEASONS[season], DAY_TYPES[day_type])
+        if cycle.empty or cycle["count"].sum() == 0:
+            st.info(f"No {selected_gas} data at {selected_site} for {season.lower()}.")
+        else:
+            st.markdown(f"### Diurnal Cycle – {selected_gas} at {selected_site} ({season}, {day_type.lower()})")
+            fig, ax = plt.subplots(figsize=(10, 4))
+            ax.fill_between(cycle.index, cycle["q25"], cycle["q75"], alpha=0.3, label="25th–75th percentile")
+            ax.plot(cycle.index, cycle["mean"], marker="o", label="Mean")
+            ax.plot(cycle.index, cycle["q50"], linestyle="--", label="Median")
+            ax.set_xticks(range(0, 24, 2))
+            ax.set_xlabel("Hour of day")
+            ax.set_ylabel(f"{selected_gas} ({GAS_UNITS.get(selected_gas, '')})")
+            ax.grid(True)
+            ax.legend()
+            st.pyplot(fig)
+            st.caption(f"Based on {int(cycle['count'].sum())} hourly values")
+
+    # ------------------------
+    # Long-term trend (Keeling-style curve from our own record)
+    # ------------------------
+    st.sidebar.markdown("### Long-term Trend")
+    if st.sidebar.checkbox("Show Long-term Trend"):
+        daily = load_store().series(selected_site, selected_gas).resample("D").mean().dropna()
+        try:
+            fit = load_trend_cache().get(selected_site, selected_gas, daily)
+        except ValueError as e:
+            st.info(str(e))
+        else:
+            curve = evaluate(fit, pd.date_range(daily.index[0], daily.index[-1], freq="D"))
+            unit = GAS_UNITS.get(selected_gas, "")
+
+            st.markdown(f"### Long-term Trend – {selected_gas} at {selected_site}")
+            fig, ax = plt.subplots(figsize=(10, 4))
+            ax.scatter(daily.index, daily.values, s=6, alpha=0.5, label="Daily mean")
+            ax.plot(curve.index, curve["fit"], color="tab:red", label="Trend + seasonal cycle")
+            ax.plot(curve.index, curve["trend"], color="black", linestyle="--", label="Trend")
+            ax.set_ylabel(f"{selected_gas} ({unit})")
+            ax.grid(True)
+            ax.legend()
+            fig.autofmt_xdate()
+            st.pyplot(fig)
+
+            col_t1, col_t2, col_t3 = st.columns(3)
+            col_t1.metric("Growth rate", f"{growth_rate(fit):.3g} {unit}/yr")
+            col_t2.metric("Fit RMSE", f"{fit['rmse']:.3g} {unit}")
+            col_t3.metric("Days fitted", f"{fit['n']}")
+            if fit["harmonics"] == 0:
+                st.caption("Record shorter than a year: seasonal harmonics are not fitted.")
+
+            detrended = pd.DataFrame({selected_gas: daily, "detrended": detrend(daily, fit)})
+            st.download_button("Download Detrended CSV", data=detrended.to_csv(),
+                               file_name=f"{selected_site}_{selected_gas}_detrended.csv")
+
+    # ------------------------
+    # Correlation matrix from monthly sufficient statistics
+    # ------------------------
+    st.sidebar.markdown("### Correlations")
+    if st.sidebar.checkbox("Show Correlation Matrix"):
+        import plotly.express as px
+
+        engine = load_correlation_engine(data_fingerprint(DATA_DIR))
+        months = engine.months(selected_site)
+        all_vars = engine.variables(selected_site)
+        if not months:
+            st.info(f"No correlation statistics for {selected_site}.")
+        else:
+            if len(months) > 1:
+                month_from, month_to = st.sidebar.select_slider("Months", options=months,
+                                                                value=(months[0], months[-1]))
+            else:
+                month_from = month_to = months[0]
+            default_vars = [v for v in GASES + ["Wind_Speed", "Wind_Direction"] if v in all_vars]
+            corr_vars = st.sidebar.multiselect("Variables", all_vars, default=default_vars)
+
+            corr = engine.correlation(selected_site, month_from, month_to, corr_vars)
+            st.markdown(f"### Correlation Matrix – {selected_site} ({month_from} to {month_to})")
+            fig = px.imshow(corr, zmin=-1, zmax=1, color_continuous_scale="RdBu_r", text_auto=".2f",
+                            aspect="auto", height=max(400, 40 * len(corr_vars)))
+            st.plotly_chart(fig)
+
+            # CH4:CO2 enhancement ratio as the regression slope over the same months
+            slope, r, n = engine.ratio(selected_site, "CH4", "CO2", month_from, month_to)
+            if n > 1 and not np.isnan(slope):
+                col_r1, col_r2, col_r3 = st.columns(3)
+                col_r1.metric("ΔCH4/ΔCO2", f"{slope * 1000:.2f} ppb/ppm")
+                col_r2.metric("r (CH4, CO2)", f"{r:.2f}")
+                col_r3.metric("Paired hours", f"{n}")
+
+            st.download_button("Download Correlation CSV", data=corr.to_csv(),
+                               file_name=f"{selected_site}_correlation_{month_from}_{month_to}.csv")
+
+    # ------------------------
+    # Data completeness from the gap index
+    # ------------------------
+    st.sidebar.markdown("### Data Completeness")
+    if st.sidebar.checkbox("Show Data Completeness"):
+        import plotly.express as px
+
+        gap_index = load_gap_index()
+        calendar = gap_index.calendar(selected_site, selected_gas)
+        if calendar.empty:
+            st.info(f"No completeness information for {selected_gas} at {selected_site}.")
+        else:
+            st.markdown(f"### Data Completeness – {selected_gas} at {selected_site}")
+            fig = px.imshow(calendar, zmin=0, zmax=100, color_continuous_scale="RdYlGn", aspect="auto",
+                            labels=dict(x="Day of month", y="Month", color="% complete"),
+                            height=max(300, 40 * len(calendar)))
+            st.plotly_chart(fig)
+
+            monthly = gap_index.completeness_for(selected_site, selected_gas, "month")
+            st.dataframe(monthly[["period_start", "samples", "expected", "percent_complete"]]
+                         .rename(columns={"period_start": "month"}), hide_index=True)
+
+            min_gap_hours = st.sidebar.number_input("Minimum gap to list (hours)", 1, 24 * 30, 3)
+            gaps = gap_index.missing_intervals(selected_site, selected_gas,
+                                               min_duration=pd.Timedelta(hours=min_gap_hours))
+            st.markdown(f"**{len(gaps)} gaps of {min_gap_hours} h or longer**")
+            st.dataframe(gaps[["start", "end", "duration"]], hide_index=True)
+
+    # ------------------------
+    # Whole-archive statistics, computed out of core
+    # ------------------------
+    st.sidebar.markdown("### Archive Analysis")
+    if st.sidebar.checkbox("Analyse Whole Archive (out-of-core)"):
+        archive_by = st.sidebar.selectbox("Group archive by", ["month", "day", "hour", "weekday", "year"])
+        archive_workers = int(st.sidebar.number_input("Worker processes", 1, 64, os.cpu_count() or 1))
+        signature = tuple((p, os.path.getmtime(p)) for p in site_files(selected_site))
+
+        with tracer.span("archive_statistics", cached=True, workers=archive_workers) as span:
+            stats = archive_statistics(selected_site, (selected_gas,), archive_by, archive_workers, signature)
+            if tracer.enabled:
+                span.set(bytes=sum(os.path.getsize(p) for p, _ in signature))
+        if stats.empty:
+            st.info(f"No archived {selected_gas} data for {selected_site}.")
+        else:
+            st.markdown(f"### {selected_gas} at {selected_site} – all files by {archive_by}")
+            summary = pd.DataFrame({stat: stats[(stat, selected_gas)] for stat in ["count", "mean", "std", "min", "max"]})
+
+            fig, ax = plt.subplots(figsize=(10, 4))
+            ax.plot(summary.index, summary["mean"], marker="o", label="Mean")
+            ax.fill_between(summary.index, summary["min"], summary["max"], alpha=0.2, label="Min–max")
+            ax.set_xlabel(archive_by.capitalize())
+            ax.set_ylabel(f"{selected_gas} ({GAS_UNITS.get(selected_gas, '')})")
+            ax.grid(True)
+            ax.legend()
+            st.pyplot(fig)
+            st.dataframe(summary)
+
+            if "Wind_Direction" in df.columns:
+                import plotly.express as px
+
+                counts = archive_rose(selected_site, selected_gas, archive_workers, signature)
+                st.markdown(f"### Pollution Rose – {selected_gas} (all files)")
+                fig = px.bar_polar(counts, r="Count", theta="direction", color="bin",
+                                   color_discrete_sequence=px.colors.sequential.Plasma_r,
+                                   template="plotly_white", height=600)
+                fig.update_layout(polar=dict(angularaxis=dict(direction="clockwise", rotation=90)))
+                st.plotly_chart(fig)
+
+    # ------------------------
+    # Multi-site comparison
+    # ------------------------
+    st.sidebar.markdown("### Site Comparison")
+    if st.sidebar.checkbox("Compare Sites"):
+        store = load_store()
+        compare_sites = st.sidebar.multiselect("Sites to compare", SITES, default=SITES)
+        compare_gases = st.sidebar.multiselect("Gases to compare", GASES, default=[selected_gas])
+        compare_freq = st.sidebar.radio("Comparison resolution", ["Hourly", "Daily"])
+
+        month_start = pd.Timestamp(selected_date).replace(day=1)
+        compare_range = st.sidebar.date_input(
+            "Comparison range",
+            value=(month_start.date(), (month_start + pd.offsets.MonthEnd(0)).date()),
+        )
+
+        pairs = [(site, gas) for gas in compare_gases for site in compare_sites]
+        if len(compare_range) != 2 or not pairs:
+            st.info("Choose a start and end date and at least one site and gas to compare.")
+        else:
+            start_ts = pd.Timestamp(compare_range[0])
+            end_ts = pd.Timestamp(compare_range[1]) + pd.Timedelta(hours=23)
+            cache = load_comparison_cache("h" if compare_freq == "Hourly" else "D")
+            aligned = cache.get(pairs, start_ts, end_ts)
+
+            st.markdown(f"### Site Comparison ({compare_freq})")
+            for gas in compare_gases:
+                cols = [column_name(site, gas) for site in compare_sites]
+                fig, (ax, ax_diff) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+                for col in cols:
+                    ax.plot(aligned.index, aligned[col], label=col)
+                ax.set_ylabel(f"{gas} ({GAS_UNITS.get(gas, '')})")
+                ax.set_title(f"{gas} overlay")
+                ax.grid(True)
+                ax.legend()
+
+                # Differences relative to the first selected site
+                if len(cols) > 1:
+                    diff = differences(aligned[cols], cols[0])
+                    for col in diff.columns:
+                        ax_diff.plot(diff.index, diff[col], label=f"{col} - {cols[0]}")
+                    ax_diff.axhline(0, color="black", linewidth=0.8)
+                    ax_diff.legend()
+                ax_diff.set_ylabel("Difference")
+                ax_diff.grid(True)
+                fig.autofmt_xdate()
+                st.pyplot(fig)
+
+            st.download_button("Download Comparison CSV", data=aligned.to_csv(),
+                               file_name=f"comparison_{start_ts:%Y%m%d}_{end_ts:%Y%m%d}.csv")
+
+    # ------------------------
+    # Ad-hoc SQL over the archive and the observation store
+    # ------------------------
+    st.sidebar.markdown("### SQL Query")
+    if st.sidebar.checkbox("Show SQL Query Box"):
+        from sql_engine import DEFAULT_LIMIT, EXAMPLE_QUERY, QueryError
+
+        engine = load_sql_engine()
+        with tracer.span("sql_refresh") as span:
+            # Mirrors new or changed CSVs to Parquet; a stat per file otherwise
+            span.set(rows=engine.refresh())
+
+        st.markdown("### SQL Query")
+        with st.expander("Views and columns"):
+            st.dataframe(engine.describe(), hide_index=True)
+        sql = st.text_area("SQL (SELECT only)", EXAMPLE_QUERY, height=160)
+        sql_limit = int(st.number_input("Row limit", 1, 1_000_000, DEFAULT_LIMIT))
+
+        # The result is kept in the session so the download button's rerun does not lose it
+        if st.button("Run Query"):
+            try:
+                with tracer.span("sql_query") as span:
+                    st.session_state.sql_result = (sql, engine.query(sql, sql_limit))
+                    span.set(rows=len(st.session_state.sql_result[1]))
+            except QueryError as e:
+                st.session_state.pop("sql_result", None)
+                st.error(f"Query failed: {e}")
+
+        if "sql_result" in st.session_state:
+            result_sql, result = st.session_state.sql_result
+            if result_sql != sql:
+                st.caption("Showing the result of the previous query")
+            st.dataframe(result)
+            st.caption(f"{len(result):,} rows" + (" (limit reached)" if len(result) == sql_limit else ""))
+            st.download_button("Download Query Result CSV", data=result.to_csv(index=False),
+                               file_name="ghg_query.csv", mime="text/csv")
+            if st.checkbox("Show query plan"):
+                st.code(engine.explain(result_sql))
+
     # ------------------------
     # Sidebar: Parameter & Date Selection
     # ------------------------
     st.sidebar.markdown("### API Aquisnet Parameter & Date Selection")
 
+    # Keep the Picarro selection; selected_site is reused for the AQMS site below
+    picarro_site = selected_site
+    picarro_gas = selected_gas
+
     # Parameter and date selection
     parameter = st.sidebar.selectbox("Select Parameter", ["CH4", "CO2", "NH3", "N2O", "NO2", "NO"])
     start_date = st.sidebar.date_input("Start Date", datetime(2025, 1, 1))
@@ -504,9 +1145,8 @@ with col2:
         st.sidebar.error("End Date must be after Start Date")
         st.stop()
 
-    # API configuration
-    API_URL = "https://data.airquality.nsw.gov.au/api/Data/get_Observations"
-    HEADERS = {'Content-Type': 'application/json', 'accept': 'application/json'}
+    # API configuration (set AQMS_API_URL to use mock_aqms_server.py instead of the live API)
+    aqms = AQMS_API(tracer=tracer)
 
     # Helper function to check data existence
     def parameter_exists_api(site_id, parameter_id, start_date, end_date):
@@ -526,7 +1166,7 @@ with col2:
                 # Simulate a slow API call
                 #time.sleep(5)  # Replace this with your real API request
 
-                response = requests.post(API_URL, headers=HEADERS, json=payload, timeout=20)
+                response = aqms.get_observations(payload)
                 if response.status_code == 200:
                     data = response.json()
                     return len(data) > 0
@@ -538,11 +1178,8 @@ with col2:
 
     # Load available sites and parameter IDs
     def load_sites_and_params():
-        sites_url = "https://data.airquality.nsw.gov.au/api/Data/get_SiteDetails"
-        params_url = "https://data.airquality.nsw.gov.au/api/Data/get_ParameterDetails"
-
-        sites = requests.get(sites_url, headers=HEADERS).json()
-        params = requests.get(params_url, headers=HEADERS).json()
+        sites = aqms.get_site_details().json()
+        params = aqms.get_parameter_details().json()
 
         # Map: Site name -> Site ID
         site_map = {site["SiteName"]: site["Site_Id"] for site in sites}
@@ -567,14 +1204,39 @@ with col2:
         st.error(f"Parameter '{parameter}' not found in API.")
         st.stop()
 
+    # Limit the availability probes to relevant stations using the site catalogue
+    catalogue = load_site_catalogue()
+    station_filter = st.sidebar.radio("Stations to check",
+                                      [f"Nearest to {picarro_site}", f"Within radius of {picarro_site}", "Region",
+                                       "All"])
+    if station_filter.startswith("Nearest"):
+        n_stations = st.sidebar.slider("Number of stations", 1, 20, 5)
+        candidates = catalogue.near_site(picarro_site, n_stations)
+    elif station_filter.startswith("Within radius"):
+        radius_km = st.sidebar.slider("Radius (km)", 5, 300, 50)
+        candidates = catalogue.within_radius(*catalogue.location(picarro_site), radius_km, source="aqms")
+    elif station_filter == "Region":
+        region = st.sidebar.selectbox("Region", catalogue.regions())
+        candidates = catalogue.in_region(region)
+    else:
+        candidates = None
+
+    if candidates is not None:
+        candidate_names = set(candidates["SiteName"])
+        probe_sites = {name: site_id for name, site_id in site_map.items() if name in candidate_names}
+    else:
+        probe_sites = site_map
+
     # Check which sites have the parameter data
-    available_sites = [
-        site_name for site_name, site_id in site_map.items()
-        if parameter_exists_api(site_id, parameter_id, start_date, end_date)
-    ]
+    with tracer.span("api_probe", sites=len(probe_sites)) as span:
+        available_sites = [
+            site_name for site_name, site_id in probe_sites.items()
+            if parameter_exists_api(site_id, parameter_id, start_date, end_date)
+        ]
+        span.set(rows=len(available_sites))
 
     if not available_sites:
-        st.warning(f"No data found for {parameter} between {start_date} and {end_date} at any site.")
+        st.warning(f"No data found for {parameter} between {start_date} and {end_date} at the selected stations.")
         st.stop()
 
     # Let user select from available sites
@@ -606,7 +1268,7 @@ with col2:
             # Simulate a slow API call
             #time.sleep(5)  # Replace this with your real API request
 
-            response = requests.post(API_URL, headers=HEADERS, json=payload, timeout=30)
+            response = aqms.get_observations(payload)
             response.raise_for_status()
             data = response.json()
         st.success("Data loaded successfully!")
@@ -614,38 +1276,34 @@ with col2:
         st.error(f"Failed to fetch data: {e}")
         st.stop()
 
-    records = []
-    units = None  # store the units
-
-    for rec in data:
-        # Convert everything to correct type before comparison
-        rec_site_id = int(rec.get("Site_Id", -1))
-        rec_param_code = str(rec.get("Parameter", {}).get("ParameterCode", "")).upper()
-
-        if rec_site_id == selected_site_id and rec_param_code == parameter_id.upper():
-            date_str = rec["Date"]
-            hour = rec["Hour"]
-            dt = datetime.strptime(date_str, "%Y-%m-%d") + timedelta(hours=hour)
-            value = rec["Value"]
-
-            if value is not None:
-                if units is None:
-                    units = rec["Parameter"].get("Units", "")
-                records.append({"datetime": dt, "value": value})
+    # Flatten, filter and timestamp all records in one vectorized pass
+    with tracer.span("normalize_observations", records=len(data)) as span:
+        df = normalize_observations(data, sites=[selected_site_id], parameters=[parameter_id])
+        span.set(rows=len(df))
+    units = df["units"].iloc[0] if not df.empty else None
+
+    # Add the API data to the shared observation store next to the Picarro data; the same
+    # pull on a rerun is recognised and leaves the store (and its version-keyed caches) alone;
+    # new pulls are also saved under cache/api for the next start and the SQL observations view
+    with tracer.span("load_store", cached=True):
+        store = load_store()
+    try:
+        store.add_api_observations(df, {site_id: name for name, site_id in site_map.items()}, persist_dir=API_DIR,
+                                   units=load_parameter_units())
+    except ValueError as e:
+        st.warning(f"Observations not added to the store: {e}")
 
     #st.write(f"Total records returned by API: {len(data)}")
     st.write(f"selected_site_id: {selected_site_id} ({type(selected_site_id)})")
     st.write(f"parameter_id: {parameter_id} ({type(parameter_id)})")
 
-    df = pd.DataFrame(records)
-
     #st.write("Preview of retrieved data:")
     #st.dataframe(df.head())
 
-    # Assuming df contains 'datetime' and 'value' columns
+    # df contains 'timestamp' and 'value' columns
     fig, ax = plt.subplots(figsize=(12, 5))
 
-    ax.plot(df["datetime"], df["value"], marker="o", linestyle="-", label=parameter)
+    ax.plot(df["timestamp"], df["value"], marker="o", linestyle="-", label=parameter)
 
     # Set axis titles
     ax.set_title(f"{parameter} Time Series at {selected_site}", fontsize=14)
@@ -668,4 +1326,48 @@ with col2:
     # Show in Streamlit
     st.pyplot(fig)
 
+    # ------------------------
+    # Cross-source comparison from the observation store
+    # ------------------------
+    if st.sidebar.checkbox(f"Compare with {picarro_site} {picarro_gas}"):
+        start_ts = pd.Timestamp(start_date)
+        end_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+
+        # Same gas from both sources: read both in the display unit and share one axis
+        same_gas = parameter_id.upper() == picarro_gas
+        compare_unit = display_unit if same_gas else None
+
+        # Default to the AQMS site closest to the Picarro site among those with this parameter in the store
+        nearest = store.nearest_site(picarro_site, parameter_id, source="aqms")
+        compare_sites = [nearest] if nearest else []
+        if selected_site not in compare_sites:
+            compare_sites.append(selected_site)
+        compare_site = st.sidebar.selectbox(
+            "AQMS site to compare", compare_sites,
+            format_func=lambda s: f"{s} (nearest to {picarro_site})" if s == nearest else s)
+
+        # One indexed read covering both sources
+        both = store.query_many([(picarro_site, picarro_gas), (compare_site, parameter_id)], start_ts, end_ts,
+                                unit=compare_unit)
+        picarro_col, aqms_col = both.columns
+
+        if both[picarro_col].isnull().all():
+            st.info(f"No {picarro_gas} data at {picarro_site} between {start_date} and {end_date}.")
+        else:
+            fig, ax = plt.subplots(figsize=(12, 5))
+            series = both[picarro_col].dropna()
+            ax.plot(series.index, series.values, color="tab:blue", label=picarro_col)
+            ax.set_ylabel(f"{picarro_gas} ({compare_unit or GAS_UNITS.get(picarro_gas, '')})")
+
+            ax2 = ax if same_gas else ax.twinx()
+            series = both[aqms_col].dropna()
+            ax2.plot(series.index, series.values, color="tab:red", label=aqms_col)
+            ax2.set_ylabel(f"{parameter} ({compare_unit or units})")
+
+            ax.set_title(f"{picarro_col} vs {aqms_col}")
+            ax.grid(True)
+            fig.legend(loc="upper right")
+            fig.autofmt_xdate()
+            st.pyplot(fig)
+
 
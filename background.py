@@ -0,0 +1,81 @@
+"""
+Background / enhancement separation for GHG series.
+
+The regional background is estimated as a rolling low quantile of the
+concentration over a window of N days; the enhancement is what is left
+above it. pandas' rolling quantile keeps a sorted window that is updated
+as samples enter and leave, so each step costs O(log window) rather than a
+re-sort of the whole window, which keeps months of minute data cheap.
+"""
+
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_QUANTILE = 0.05
+
+
+def rolling_baseline(series, window_days=DEFAULT_WINDOW_DAYS, quantile=DEFAULT_QUANTILE, center=True,
+                     min_fraction=0.1):
+    """
+    Rolling quantile of a time-indexed series over a window of window_days.
+
+    The window is time based, so irregular timestamps and gaps are handled.
+    Windows holding fewer than min_fraction of the samples expected from the
+    median sampling interval give NaN.
+    """
+    series = series.dropna().sort_index()
+    if series.empty:
+        return series.copy()
+
+    window = pd.Timedelta(days=window_days)
+    step = series.index.to_series().diff().median()
+    expected = window / step if pd.notna(step) and step > pd.Timedelta(0) else 1
+    min_periods = max(int(expected * min_fraction), 1)
+
+    return series.rolling(window, min_periods=min_periods, center=center).quantile(quantile)
+
+
+def separate_background(series, window_days=DEFAULT_WINDOW_DAYS, quantile=DEFAULT_QUANTILE, center=True):
+    """
+    Split a series into background and enhancement.
+    Returns a frame with columns value, background and enhancement.
+    """
+    series = series.dropna().sort_index()
+    background = rolling_baseline(series, window_days, quantile, center)
+    return pd.DataFrame({
+        "value": series,
+        "background": background,
+        "enhancement": series - background,
+    })
+
+
+class BackgroundCache:
+    """
+    Background / enhancement of store series, cached per (site, variable,
+    window, quantile). Results live beside the store and are never written
+    into it; entries from older store versions are not reused.
+    """
+
+    def __init__(self, store, max_entries=16):
+        self.store = store
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, site, variable, window_days=DEFAULT_WINDOW_DAYS, quantile=DEFAULT_QUANTILE):
+        key = (self.store.version, site, variable, float(window_days), float(quantile))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = separate_background(self.store.query(site, variable)["value"], window_days, quantile)
+
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
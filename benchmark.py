@@ -0,0 +1,289 @@
+"""
+Benchmarks for the load -> harmonize -> resample -> render pipeline.
+
+Every stage the viewer runs on a Picarro file is timed on its own, at
+several input sizes, for both file layouts:
+
+  read_csv        pd.read_csv of the raw file
+  parse_datetime  "DATE"+"TIME" (Lidcombe) or "Date Time" (Stockton) parsing
+  clean_columns   unit-stripping regex on the column names
+  hourly_resample hourly_mean
+  daily_groupby   daily means of one gas, as in the Full Month view
+  rose_binning    pollution rose binning (pd.cut + direction bins + counts)
+  render          matplotlib line + daily bar plot
+  png_export      savefig of that plot to PNG
+
+Inputs of the requested sizes are built by repeating a shipped file with
+shifted timestamps, or generated with synthetic_data (--source synthetic).
+Each stage reports the median of several runs and, in a separate run
+under tracemalloc, its peak allocated memory. Results
+can be saved as a baseline; later runs are compared against it and any
+stage slower or hungrier than the tolerance is flagged.
+
+    python benchmark.py --sizes 1000 10000 100000 --save-baseline
+    python benchmark.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from ghg_loader import DATA_DIR, STOCKTON_RENAME, clean_columns, hourly_mean, parse_datetime
+
+BASELINE_FILE = "bench_baseline.json"
+OUTPUT_FILE = "bench_output.txt"
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+# Layout -> (sample file, datetime columns, datetime format used when writing)
+LAYOUTS = {
+    "lidcombe": (os.path.join(DATA_DIR, "Lidcombe_20231201.csv"), None, None),
+    "stockton": (os.path.join(DATA_DIR, "minutedata", "Stockton_20240901.csv"), "Date Time", "%d/%m/%Y %H:%M"),
+}
+
+
+# -----------------------------
+# Inputs
+# -----------------------------
+def scaled_csv(layout, rows, directory):
+    """
+    Write a CSV of the given layout with `rows` rows by repeating the sample
+    file, shifting each copy past the end of the previous one.
+    """
+    sample_path, _, fmt = LAYOUTS[layout]
+    sample = pd.read_csv(sample_path)
+    times = parse_datetime(sample)
+    span = (times.max() - times.min()) + pd.Timedelta(minutes=1)
+
+    copies = -(-rows // len(sample))
+    frame = pd.concat([sample] * copies, ignore_index=True).iloc[:rows]
+    shift = np.repeat(np.arange(copies), len(sample))[:rows] * span
+    shifted = pd.concat([times] * copies, ignore_index=True).iloc[:rows] + shift
+
+    if layout == "lidcombe":
+        frame["DATE"] = shifted.dt.strftime("%d/%m/%Y")
+        frame["TIME"] = shifted.dt.strftime("%H:%M:%S")
+        frame["EPOCH_TIME"] = (shifted - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+    else:
+        frame["Date Time"] = shifted.dt.strftime(fmt)
+
+    path = os.path.join(directory, f"{layout}_{rows}.csv")
+    frame.to_csv(path, index=False)
+    return path
+
+
+def synthetic_csv(layout, rows, directory, seed=0):
+    """
+    Write a CSV of the given layout with `rows` minutes of synthetic data
+    (see synthetic_data), for sizes well beyond the shipped files.
+    """
+    from synthetic_data import GeneratorConfig, lidcombe_frame, stockton_frame
+
+    config = GeneratorConfig(seed=seed)
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(config.start, periods=rows, freq="min")
+    if layout == "lidcombe":
+        frame = lidcombe_frame(index, rng, config)
+    else:
+        frame, _ = stockton_frame(index, rng, config, minute=True)
+
+    path = os.path.join(directory, f"{layout}_{rows}.csv")
+    frame.to_csv(path, index=False)
+    return path
+
+
+# -----------------------------
+# Stages
+# -----------------------------
+def pollution_rose_bins(df, gas):
+    """
+    Binning step of the app's pollution rose: five equal-width
+    concentration bins, 30° direction bins, counts per cell.
+    """
+    data = df.dropna(subset=["Wind_Speed", "Wind_Direction", gas])
+    bins = np.linspace(data[gas].min(), data[gas].max(), 6)
+    labels = [f"{round(bins[i], 1)}–{round(bins[i + 1], 1)}" for i in range(len(bins) - 1)]
+    binned = pd.cut(data[gas], bins=bins, labels=labels, include_lowest=True, ordered=False)
+    direction = (data["Wind_Direction"] // 30) * 30
+    return data.groupby([direction, binned], observed=True).size()
+
+
+def render(hourly, daily, gas):
+    fig, ax = plt.subplots(figsize=(10, 4))
+    ax.plot(hourly["datetime"], hourly[gas], marker="o", linestyle="-", label="Hourly")
+    ax.bar(daily.index, daily.to_numpy(), width=0.6, alpha=0.3, label="Daily Avg")
+    ax.grid(True)
+    ax.legend()
+    fig.autofmt_xdate()
+    fig.canvas.draw()
+    return fig
+
+
+def png_export(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def stages(path, gas="CH4"):
+    """
+    (name, callable) for every stage; each callable takes the previous
+    stage's output, so the pipeline is timed stage by stage.
+    """
+    state = {}
+
+    def read():
+        state["raw"] = pd.read_csv(path)
+
+    def parse():
+        df = state["raw"].copy()
+        df["datetime"] = parse_datetime(df)
+        state["parsed"] = df.dropna(subset=["datetime"])
+
+    def clean():
+        state["clean"] = clean_columns(state["parsed"].rename(columns=STOCKTON_RENAME))
+
+    def resample():
+        state["hourly"] = hourly_mean(state["clean"])
+
+    def daily():
+        df = state["clean"]
+        state["daily"] = df.groupby(df["datetime"].dt.date)[gas].mean()
+
+    def rose():
+        if "Wind_Direction" not in state["clean"]:
+            return None
+        return pollution_rose_bins(state["clean"], gas)
+
+    def draw():
+        state["fig"] = render(state["hourly"], state["daily"], gas)
+
+    def export():
+        png_export(state["fig"])
+
+    return [("read_csv", read), ("parse_datetime", parse), ("clean_columns", clean),
+            ("hourly_resample", resample), ("daily_groupby", daily), ("rose_binning", rose),
+            ("render", draw), ("png_export", export)]
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+def measure(path, repeats=5):
+    """
+    Median seconds and tracemalloc peak bytes per stage for one input file.
+    """
+    times = {}
+    for _ in range(repeats):
+        for name, func in stages(path):
+            start = time.perf_counter()
+            func()
+            times.setdefault(name, []).append(time.perf_counter() - start)
+
+    peaks = {}
+    for name, func in stages(path):
+        tracemalloc.start()
+        func()
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {name: {"seconds": statistics.median(times[name]), "peak_bytes": peaks[name]} for name in times}
+
+
+def run(sizes, repeats=5, layouts=tuple(LAYOUTS), source="tiled"):
+    make_input = synthetic_csv if source == "synthetic" else scaled_csv
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in layouts:
+            for rows in sizes:
+                path = make_input(layout, rows, directory)
+                results[f"{layout}/{rows}"] = measure(path, repeats)
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(current, baseline, time_tolerance=1.25, memory_tolerance=1.25, min_seconds=1e-3):
+    """
+    Rows of (case, stage, seconds, baseline seconds, peak, baseline peak,
+    flag). A stage is flagged when it is more than time_tolerance times
+    slower (ignoring stages under min_seconds in both runs) or its memory
+    peak grew by more than memory_tolerance.
+    """
+    rows = []
+    for case, stage_results in current["results"].items():
+        for stage, now in stage_results.items():
+            before = baseline.get("results", {}).get(case, {}).get(stage) if baseline else None
+            flag = ""
+            if before:
+                if max(now["seconds"], before["seconds"]) >= min_seconds and \
+                        now["seconds"] > time_tolerance * before["seconds"]:
+                    flag = "SLOWER"
+                if now["peak_bytes"] > memory_tolerance * before["peak_bytes"] + 1024:
+                    flag = (flag + " MEMORY").strip()
+            rows.append((case, stage, now["seconds"], before["seconds"] if before else None,
+                         now["peak_bytes"], before["peak_bytes"] if before else None, flag))
+    return rows
+
+
+def format_report(rows):
+    lines = [f"{'case':<18}{'stage':<17}{'ms':>10}{'base ms':>10}{'peak MB':>10}{'base MB':>10}  flag"]
+    for case, stage, sec, base_sec, peak, base_peak, flag in rows:
+        base_ms = f"{base_sec * 1e3:10.2f}" if base_sec is not None else f"{'-':>10}"
+        base_mb = f"{base_peak / 2 ** 20:10.2f}" if base_peak is not None else f"{'-':>10}"
+        lines.append(f"{case:<18}{stage:<17}{sec * 1e3:10.2f}{base_ms}{peak / 2 ** 20:10.2f}{base_mb}  {flag}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and profile each stage of the viewer pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="rows per input file")
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--source", choices=["tiled", "synthetic"], default="tiled",
+                        help="repeat the shipped files or generate synthetic data")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown / memory growth ratio")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    current = run(args.sizes, args.repeats, args.layouts, args.source)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    rows = compare(current, baseline, args.tolerance, args.tolerance)
+    report = format_report(rows)
+    print(report)
+    with open(args.output, "w") as f:
+        f.write(report + "\n")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    regressions = [r for r in rows if r[-1]]
+    if regressions:
+        print(f"{len(regressions)} stage(s) regressed against {args.baseline}")
+        sys.exit(1)
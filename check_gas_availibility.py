@@ -1,11 +1,15 @@
+import os
 import requests
 import json
 from datetime import date
 import urllib.parse
 import time
+import argparse
+
+from site_catalogue import SiteCatalogue
 
 # Base API setup
-BASE_URL = "https://data.airquality.nsw.gov.au/"
+BASE_URL = os.environ.get("AQMS_API_URL", "https://data.airquality.nsw.gov.au/")
 GET_OBSERVATIONS = "api/Data/get_Observations"
 FULL_URL = urllib.parse.urljoin(BASE_URL, GET_OBSERVATIONS)
 
@@ -15,18 +19,41 @@ HEADERS = {
     "Accept": "application/json"
 }
 
-# Date range
-start_date = date(2024, 1, 1).strftime("%Y-%m-%d")
-end_date = date(2025, 3, 31).strftime("%Y-%m-%d")
-
-# Parameters to check
+# Optional station filters so we only probe relevant sites
+parser = argparse.ArgumentParser(description="Check which AQMS sites have data for the pollutants")
+parser.add_argument("--start", default=date(2024, 1, 1).strftime("%Y-%m-%d"), help="first date, YYYY-MM-DD")
+parser.add_argument("--end", default=date(2025, 3, 31).strftime("%Y-%m-%d"), help="last date, YYYY-MM-DD")
 #pollutants = ["CH4", "CO2", "NH3"]
-pollutants = ["NH3"]
+parser.add_argument("--pollutants", nargs="+", default=["NH3"])
+parser.add_argument("--output", default="available_parameters_2025_Q1.csv")
+parser.add_argument("--delay", type=float, default=0.3, help="seconds between requests")
+parser.add_argument("--near", help="only check stations closest to this site, e.g. Stockton")
+parser.add_argument("--k", type=int, default=5, help="number of stations to check with --near")
+parser.add_argument("--radius", type=float, help="with --near, check every station within this many km instead")
+parser.add_argument("--region", help="only check stations in this region, e.g. 'Sydney East'")
+args = parser.parse_args()
+
+# Date range and parameters to check
+start_date = args.start
+end_date = args.end
+pollutants = args.pollutants
 
 # Load previously fetched site list
 with open("sites.json", "r") as f:
     sites = json.load(f)
 
+if args.near or args.region:
+    catalogue = SiteCatalogue.from_files()
+    if args.near and args.radius:
+        candidates = catalogue.within_radius(*catalogue.location(args.near), args.radius, source="aqms")
+    elif args.near:
+        candidates = catalogue.near_site(args.near, args.k)
+    else:
+        candidates = catalogue.in_region(args.region)
+    wanted = set(candidates["SiteName"])
+    sites = [site for site in sites if site["SiteName"] in wanted]
+    print(f"Checking {len(sites)} stations")
+
 available_data = []
 
 for site in sites:
@@ -64,13 +91,13 @@ for site in sites:
         except Exception as e:
             print(f"  ❌ Error for {param} at site {site_name}: {e}")
 
-        time.sleep(0.3)  # Avoid overloading API
+        time.sleep(args.delay)  # Avoid overloading API
 
 # Save results
-with open("available_parameters_2025_Q1.csv", "w") as f:
+with open(args.output, "w") as f:
     f.write("Site_Id,SiteName,Parameter\n")
     for entry in available_data:
         f.write(f"{entry['Site_Id']},{entry['SiteName']},{entry['Parameter']}\n")
 
-print("\n✅ Done. Results saved to available_parameters_2025_Q1.csv")
+print(f"\n✅ Done. Results saved to {args.output}")
 
@@ -0,0 +1,232 @@
+"""
+Diurnal / seasonal climatology cube built at ingest time.
+
+For every (site, gas) the cube holds, per (month-of-year, hour-of-day,
+weekday/weekend) cell, the count, sum, sum of squares, min, max and a
+histogram of the hourly values. All of these are mergeable, so new monthly
+files are added without touching old ones, and any season or day-type view
+is a sum over cells. Quantiles are read off the merged histogram.
+
+The histogram edges of a (site, gas) are taken from its first values. When
+later values fall outside them the range is doubled towards that side and
+adjacent bins are summed in pairs, which keeps every count exact, so no
+value is ever clipped into an end bin.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from ghg_loader import CACHE_DIR, DATA_DIR, PICARRO_SITES, hourly_mean, read_picarro_csv, site_files
+
+GASES = ["CH4", "CO2", "H2O", "N2O", "NH3"]
+CUBE_FILE = os.path.join(CACHE_DIR, "climatology.npz")
+
+N_BINS = 230  # must stay even, bins are merged in pairs
+
+SEASONS = {
+    "All year": list(range(1, 13)),
+    "Summer (DJF)": [12, 1, 2],
+    "Autumn (MAM)": [3, 4, 5],
+    "Winter (JJA)": [6, 7, 8],
+    "Spring (SON)": [9, 10, 11],
+}
+DAY_TYPES = {"All days": [0, 1], "Weekdays": [0], "Weekends": [1]}
+
+CELL_SHAPE = (12, 24, 2)  # month-of-year, hour-of-day, weekday(0)/weekend(1)
+
+
+def initial_edges(values):
+    """
+    Histogram edges around the first values of a series, with half the
+    span again on either side so small excursions do not need a rebin.
+    """
+    lo, hi = float(np.min(values)), float(np.max(values))
+    pad = (hi - lo) / 2 or max(abs(lo) * 0.01, 1e-6)
+    return np.linspace(lo - pad, hi + pad, N_BINS + 1)
+
+
+def widen(edges, hist, upwards):
+    """
+    Double the histogram range towards one side, summing adjacent bins.
+    hist holds the bins on its last axis; returns the new edges and counts.
+    """
+    span = edges[-1] - edges[0]
+    lo = edges[0] if upwards else edges[0] - span
+    merged = hist[..., 0::2] + hist[..., 1::2]
+    wider = np.zeros_like(hist)
+    half = N_BINS // 2
+    if upwards:
+        wider[..., :half] = merged
+    else:
+        wider[..., half:] = merged
+    return np.linspace(lo, lo + 2 * span, N_BINS + 1), wider
+
+
+class ClimatologyCube:
+    """
+    Mergeable per-cell statistics for every (site, gas).
+    """
+
+    def __init__(self):
+        self.cells = {}      # (site, gas) -> dict of arrays
+        self.ingested = {}   # file path -> modification time when it was added
+
+    def _arrays(self, site, gas, values=None):
+        key = (site, gas)
+        if key not in self.cells:
+            self.cells[key] = {
+                "edges": initial_edges(values) if values is not None else np.linspace(0, 1, N_BINS + 1),
+                "count": np.zeros(CELL_SHAPE, dtype=np.int64),
+                "sum": np.zeros(CELL_SHAPE),
+                "sumsq": np.zeros(CELL_SHAPE),
+                "min": np.full(CELL_SHAPE, np.inf),
+                "max": np.full(CELL_SHAPE, -np.inf),
+                "hist": np.zeros(CELL_SHAPE + (N_BINS,), dtype=np.int64),
+            }
+        return self.cells[key]
+
+    def add(self, site, gas, series):
+        """
+        Add hourly values (a Series indexed by timestamp) for one site and gas.
+        """
+        series = series.dropna()
+        if series.empty:
+            return
+        idx = pd.DatetimeIndex(series.index)
+        values = series.to_numpy(dtype=float)
+
+        # Flat cell index for every value, then scatter-add in one call per statistic
+        month = idx.month.to_numpy() - 1
+        hour = idx.hour.to_numpy()
+        weekend = (idx.dayofweek.to_numpy() >= 5).astype(int)
+        cell = np.ravel_multi_index((month, hour, weekend), CELL_SHAPE)
+
+        arrays = self._arrays(site, gas, values)
+        while values.min() < arrays["edges"][0]:
+            arrays["edges"], arrays["hist"] = widen(arrays["edges"], arrays["hist"], upwards=False)
+        while values.max() > arrays["edges"][-1]:
+            arrays["edges"], arrays["hist"] = widen(arrays["edges"], arrays["hist"], upwards=True)
+        # The top edge belongs to the last bin
+        bins = np.clip(np.searchsorted(arrays["edges"], values, side="right") - 1, 0, N_BINS - 1)
+
+        np.add.at(arrays["count"].reshape(-1), cell, 1)
+        np.add.at(arrays["sum"].reshape(-1), cell, values)
+        np.add.at(arrays["sumsq"].reshape(-1), cell, values ** 2)
+        np.minimum.at(arrays["min"].reshape(-1), cell, values)
+        np.maximum.at(arrays["max"].reshape(-1), cell, values)
+        np.add.at(arrays["hist"].reshape(-1, N_BINS), (cell, bins), 1)
+
+    def update_from_files(self, data_dir=DATA_DIR, sites=None):
+        """
+        Add any monthly file that has not been ingested yet. If an ingested
+        file has changed on disk the cube is rebuilt from scratch.
+        Returns the list of files added.
+        """
+        paths = [p for site in (sites or PICARRO_SITES) for p in site_files(site, data_dir)]
+        mtimes = {p: os.path.getmtime(p) for p in paths}
+
+        if any(p in mtimes and mtimes[p] != t for p, t in self.ingested.items()):
+            self.cells, self.ingested = {}, {}
+
+        added = []
+        for path in paths:
+            if path in self.ingested:
+                continue
+            site = os.path.basename(path).split("_")[0]
+            hourly = hourly_mean(read_picarro_csv(path)).set_index("datetime")
+            for gas in GASES:
+                if gas in hourly.columns:
+                    self.add(site, gas, hourly[gas])
+            self.ingested[path] = mtimes[path]
+            added.append(path)
+        return added
+
+    def diurnal_cycle(self, site, gas, months=None, day_types=(0, 1), quantiles=(0.25, 0.5, 0.75)):
+        """
+        Hour-of-day statistics for a site and gas, merged over the given
+        months (1-12) and day types (0 weekday, 1 weekend).
+        Returns a frame indexed by hour with count, mean, std, min, max and
+        one column per quantile (q25, q50, ...).
+        """
+        if (site, gas) not in self.cells:
+            return pd.DataFrame()
+        arrays = self.cells[(site, gas)]
+        m = np.asarray(months or range(1, 13)) - 1
+        d = np.asarray(day_types)
+
+        def merged(name, reduce=np.sum):
+            block = arrays[name][m][:, :, d]
+            return reduce(block, axis=(0, 2))
+
+        count = merged("count")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = merged("sum") / count
+            std = np.sqrt(np.maximum(merged("sumsq") / count - mean ** 2, 0))
+
+        df = pd.DataFrame({
+            "count": count,
+            "mean": mean,
+            "std": std,
+            "min": merged("min", np.min),
+            "max": merged("max", np.max),
+        }, index=pd.RangeIndex(24, name="hour"))
+        df.loc[df["count"] == 0, ["min", "max"]] = np.nan
+
+        # Quantiles from the merged histogram, interpolating inside the bin
+        # and kept within the observed min and max of each hour
+        hist = arrays["hist"][m][:, :, d].sum(axis=(0, 2))
+        cum = np.cumsum(hist, axis=1)
+        edges = arrays["edges"]
+        for q in quantiles:
+            target = q * count
+            b = np.array([np.searchsorted(cum[h], target[h]) for h in range(24)]).clip(0, N_BINS - 1)
+            below = np.where(b > 0, cum[np.arange(24), b - 1], 0)
+            in_bin = hist[np.arange(24), b]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                frac = np.where(in_bin > 0, (target - below) / in_bin, 0.0)
+            value = edges[b] + frac * (edges[b + 1] - edges[b])
+            value = np.clip(value, df["min"].to_numpy(), df["max"].to_numpy())
+            df[f"q{int(round(q * 100))}"] = np.where(count > 0, value, np.nan)
+        return df
+
+    def save(self, path=CUBE_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {f"{site}|{gas}|{name}": arr
+                  for (site, gas), stats in self.cells.items() for name, arr in stats.items()}
+        arrays["ingested"] = np.array(json.dumps(self.ingested))
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path=CUBE_FILE):
+        cube = cls()
+        if not os.path.exists(path):
+            return cube
+        with np.load(path) as data:
+            for key in data.files:
+                if key == "ingested":
+                    cube.ingested = json.loads(str(data[key]))
+                    continue
+                site, gas, name = key.split("|")
+                cube._arrays(site, gas)[name] = data[key]
+            if any(f"{site}|{gas}|edges" not in data.files for site, gas in cube.cells):
+                # Saved with fixed histogram ranges: start again from the files
+                return cls()
+        return cube
+
+
+def build_cube(data_dir=DATA_DIR, path=CUBE_FILE):
+    """
+    Load the saved cube, add any new monthly files and save it again.
+    """
+    cube = ClimatologyCube.load(path)
+    if cube.update_from_files(data_dir):
+        cube.save(path)
+    return cube
+
+
+if __name__ == "__main__":
+    cube = build_cube()
+    print(f"Climatology cube holds {len(cube.cells)} (site, gas) series from {len(cube.ingested)} files")
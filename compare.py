@@ -0,0 +1,88 @@
+"""
+Multi-site / multi-gas comparison on a common time grid.
+
+Series are read from the observation store, resampled onto one grid in a
+single groupby, and the aligned matrix is cached. Asking for one more
+(site, variable) pair over the same range only reads and resamples that
+column and joins it to the cached matrix.
+"""
+
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def column_name(site, variable):
+    return f"{site} {variable}"
+
+
+def resample_pairs(store, pairs, start, end, freq="h"):
+    """
+    Read each (site, variable) from the store and resample all of them onto
+    the freq grid with one groupby. Returns a wide frame, one column per pair.
+    """
+    parts = {column_name(site, variable): store.query(site, variable, start, end)["value"]
+             for site, variable in pairs}
+    parts = {name: values for name, values in parts.items() if not values.empty}
+    if not parts:
+        return pd.DataFrame(columns=[column_name(s, v) for s, v in pairs], dtype="float64")
+
+    stacked = pd.concat(parts, names=["column", "timestamp"])
+    bins = stacked.index.get_level_values("timestamp").floor(freq)
+    columns = stacked.index.get_level_values("column")
+    aligned = stacked.groupby([bins, columns]).mean().unstack("column")
+    aligned.index.name = "timestamp"
+    return aligned
+
+
+class AlignedSeriesCache:
+    """
+    Cache of aligned comparison matrices keyed on (store version, freq, start, end).
+    """
+
+    def __init__(self, store, freq="h", max_entries=16):
+        self.store = store
+        self.freq = freq
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pairs, start, end):
+        """
+        Aligned frame for pairs over [start, end] on a regular grid, columns
+        in the order of pairs.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        key = (self.store.version, self.freq, start, end)
+        wanted = [column_name(site, variable) for site, variable in pairs]
+
+        with self._lock:
+            aligned = self._cache.get(key)
+            if aligned is None:
+                grid = pd.date_range(start.floor(self.freq), end, freq=self.freq, name="timestamp")
+                aligned = pd.DataFrame(index=grid)
+            self._cache[key] = aligned
+            self._cache.move_to_end(key)
+
+            # Only the pairs we have not seen for this key are read and resampled
+            missing = [(site, variable) for (site, variable), name in zip(pairs, wanted)
+                       if name not in aligned.columns]
+            if missing:
+                new_cols = resample_pairs(self.store, missing, start, end, self.freq)
+                new_cols = new_cols.reindex(aligned.index)
+                for site, variable in missing:
+                    name = column_name(site, variable)
+                    aligned[name] = new_cols[name] if name in new_cols.columns else float("nan")
+
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+            return aligned[wanted].copy()
+
+
+def differences(aligned, reference):
+    """
+    Every column minus the reference column (which is dropped).
+    """
+    return aligned.drop(columns=reference).sub(aligned[reference], axis=0)
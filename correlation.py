@@ -0,0 +1,201 @@
+"""
+Correlation / covariance engine over co-located variables.
+
+For every (site, month) we keep pairwise sufficient statistics of the
+hourly values: for each pair of variables (i, j) the number of rows where
+both are valid, the sums of x_i and x_j over those rows, their sums of
+squares and the sum of cross-products. These add up across months, so the
+correlation or covariance matrix for any range of months is assembled from
+the stored sums without reading the raw files again.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from ghg_loader import CACHE_DIR, DATA_DIR, PICARRO_SITES, hourly_mean, measurement_columns, \
+    read_picarro_csv, site_files, site_from_path
+
+STATS_FILE = os.path.join(CACHE_DIR, "correlation.npz")
+STAT_NAMES = ["n", "sx", "sxx", "sxy"]
+
+
+def sufficient_stats(frame):
+    """
+    Pairwise sufficient statistics of the columns of frame, as k x k arrays:
+      n[i, j]   rows where both i and j are valid
+      sx[i, j]  sum of x_i over those rows
+      sxx[i, j] sum of x_i**2 over those rows
+      sxy[i, j] sum of x_i * x_j over those rows
+    """
+    x = frame.to_numpy(dtype=float)
+    valid = ~np.isnan(x)
+    m = valid.astype(float)
+    x0 = np.where(valid, x, 0.0)
+    return {
+        "n": m.T @ m,
+        "sx": x0.T @ m,
+        "sxx": (x0 ** 2).T @ m,
+        "sxy": x0.T @ x0,
+    }
+
+
+def covariance_from_stats(stats):
+    n, sx, sxx, sxy = (stats[k] for k in STAT_NAMES)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (sxy - sx * sx.T / n) / (n - 1)
+    return np.where(n > 1, cov, np.nan)
+
+
+def correlation_from_stats(stats):
+    n, sx, sxx, sxy = (stats[k] for k in STAT_NAMES)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        num = n * sxy - sx * sx.T
+        var_i = n * sxx - sx ** 2
+        corr = num / np.sqrt(var_i * var_i.T)
+    return np.where(n > 1, np.clip(corr, -1, 1), np.nan)
+
+
+class CorrelationEngine:
+    """
+    Monthly sufficient statistics per site, mergeable over any month range.
+    """
+
+    def __init__(self):
+        self.stats = {}      # (site, "YYYY-MM") -> (variables, dict of k x k arrays)
+        self.ingested = {}   # file path -> modification time when it was added
+
+    def add(self, site, frame):
+        """
+        Add an hourly frame (timestamp index, one column per variable),
+        split by calendar month.
+        """
+        frame = frame.dropna(how="all")
+        for period, month in frame.groupby(frame.index.to_period("M")):
+            variables = list(month.columns)
+            new = sufficient_stats(month)
+            key = (site, str(period))
+            if key in self.stats:
+                variables, new = merge_stats([self.stats[key], (variables, new)])
+            self.stats[key] = (variables, new)
+
+    def update_from_files(self, data_dir=DATA_DIR, sites=None):
+        """
+        Add monthly files that have not been ingested yet; rebuild if an
+        ingested file changed. Returns the list of files added.
+        """
+        paths = [p for site in (sites or PICARRO_SITES) for p in site_files(site, data_dir)]
+        mtimes = {p: os.path.getmtime(p) for p in paths}
+        if any(p in mtimes and mtimes[p] != t for p, t in self.ingested.items()):
+            self.stats, self.ingested = {}, {}
+
+        added = []
+        for path in paths:
+            if path in self.ingested:
+                continue
+            hourly = hourly_mean(read_picarro_csv(path)).set_index("datetime")
+            self.add(site_from_path(path), hourly[measurement_columns(hourly)])
+            self.ingested[path] = mtimes[path]
+            added.append(path)
+        return added
+
+    def months(self, site):
+        return sorted(period for s, period in self.stats if s == site)
+
+    def variables(self, site):
+        names = set()
+        for (s, _), (variables, _) in self.stats.items():
+            if s == site:
+                names.update(variables)
+        return sorted(names)
+
+    def merged(self, site, start=None, end=None, variables=None):
+        """
+        Statistics for site summed over months start..end ("YYYY-MM", inclusive).
+        """
+        parts = [self.stats[(site, m)] for m in self.months(site)
+                 if (start is None or m >= start) and (end is None or m <= end)]
+        names, stats = merge_stats(parts)
+        if variables is not None:
+            keep = [names.index(v) for v in variables if v in names]
+            names = [names[i] for i in keep]
+            stats = {k: a[np.ix_(keep, keep)] for k, a in stats.items()}
+        return names, stats
+
+    def correlation(self, site, start=None, end=None, variables=None):
+        names, stats = self.merged(site, start, end, variables)
+        return pd.DataFrame(correlation_from_stats(stats), index=names, columns=names)
+
+    def covariance(self, site, start=None, end=None, variables=None):
+        names, stats = self.merged(site, start, end, variables)
+        return pd.DataFrame(covariance_from_stats(stats), index=names, columns=names)
+
+    def counts(self, site, start=None, end=None, variables=None):
+        names, stats = self.merged(site, start, end, variables)
+        return pd.DataFrame(stats["n"].astype(int), index=names, columns=names)
+
+    def ratio(self, site, y, x, start=None, end=None):
+        """
+        Regression slope of y on x (e.g. CH4 on CO2 for the enhancement
+        ratio), the correlation and the number of paired values.
+        """
+        names, stats = self.merged(site, start, end, [y, x])
+        if names != [y, x]:
+            return np.nan, np.nan, 0
+        cov = covariance_from_stats(stats)
+        corr = correlation_from_stats(stats)
+        slope = cov[0, 1] / cov[1, 1] if cov[1, 1] > 0 else np.nan
+        return slope, corr[0, 1], int(stats["n"][0, 1])
+
+    def save(self, path=STATS_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays, index = {}, []
+        for i, ((site, month), (variables, stats)) in enumerate(self.stats.items()):
+            index.append([site, month, variables])
+            arrays.update({f"{i}|{k}": a for k, a in stats.items()})
+        arrays["index"] = np.array(json.dumps(index))
+        arrays["ingested"] = np.array(json.dumps(self.ingested))
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path=STATS_FILE):
+        engine = cls()
+        if not os.path.exists(path):
+            return engine
+        with np.load(path) as data:
+            engine.ingested = json.loads(str(data["ingested"]))
+            for i, (site, month, variables) in enumerate(json.loads(str(data["index"]))):
+                engine.stats[(site, month)] = (variables, {k: data[f"{i}|{k}"] for k in STAT_NAMES})
+        return engine
+
+
+def merge_stats(parts):
+    """
+    Sum (variables, stats) pairs, aligning them on the union of variable names.
+    """
+    names = sorted({v for variables, _ in parts for v in variables})
+    pos = {v: i for i, v in enumerate(names)}
+    k = len(names)
+    total = {s: np.zeros((k, k)) for s in STAT_NAMES}
+    for variables, stats in parts:
+        idx = np.array([pos[v] for v in variables], dtype=int)
+        for s in STAT_NAMES:
+            total[s][np.ix_(idx, idx)] += stats[s]
+    return names, total
+
+
+def build_engine(data_dir=DATA_DIR, path=STATS_FILE):
+    """
+    Load the saved statistics, add any new monthly files and save them again.
+    """
+    engine = CorrelationEngine.load(path)
+    if engine.update_from_files(data_dir):
+        engine.save(path)
+    return engine
+
+
+if __name__ == "__main__":
+    engine = build_engine()
+    print(f"Correlation statistics for {len(engine.stats)} site-months from {len(engine.ingested)} files")
@@ -0,0 +1,328 @@
+"""
+Chunked, compressed (site, variable, time) archive of the observation record.
+
+Every series is kept on a regular time grid (hourly by default) and cut
+into one chunk per calendar month, Zarr-style:
+
+  <archive>/meta.json                          grid, sites, variables, units, chunk list
+  <archive>/<site>/<variable>/<YYYY-MM>.npz    float32 values of one month, NaN where missing
+
+A chunk's position on the grid follows from its month, so reading any
+slice only opens the chunks it overlaps, and appending a new month writes
+new chunk files without touching the others. A month that already exists
+is merged (new values replace old ones) and only that chunk is rewritten.
+meta.json is replaced atomically after the chunks are written, so readers
+never see a chunk list that points at missing files.
+
+    python cube_archive.py export cache/cube                 # whole observation store
+    python cube_archive.py export cache/cube --start 2024-11 # append / refresh from a month on
+    python cube_archive.py update cache/cube                 # append what is new since the last export
+    python cube_archive.py info cache/cube
+"""
+
+import argparse
+import json
+import os
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+FORMAT = "ghg-cube"
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+DEFAULT_FREQ = "h"
+
+
+class CubeArchive:
+    """
+    Reader and writer for one archive directory. Decompressed chunks are
+    kept in a small LRU cache, so repeated slices of the same months do not
+    touch the disk again.
+    """
+
+    def __init__(self, path, freq=DEFAULT_FREQ, max_cached_chunks=64):
+        self.path = path
+        self.max_cached_chunks = max_cached_chunks
+        self._chunks = OrderedDict()
+        self._lock = threading.RLock()
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta.get("format") != FORMAT:
+                raise ValueError(f"{path} is not a {FORMAT} archive")
+        else:
+            self.meta = {"format": FORMAT, "version": FORMAT_VERSION, "freq": freq, "block": "month",
+                         "dtype": "float32", "sites": {}, "variables": {}, "chunks": {}}
+        self.step = pd.Timedelta(pd.tseries.frequencies.to_offset(self.meta["freq"]))
+
+    # -----------------------------
+    # Layout
+    # -----------------------------
+    @property
+    def sites(self):
+        return sorted(self.meta["sites"])
+
+    @property
+    def variables(self):
+        return sorted(self.meta["variables"])
+
+    def unit(self, variable):
+        return self.meta["variables"].get(variable, {}).get("unit")
+
+    def source(self, site):
+        return self.meta["sites"].get(site, {}).get("source")
+
+    def months(self, site, variable):
+        return sorted(self.meta["chunks"].get(site, {}).get(variable, []))
+
+    def has(self, site, variable):
+        return bool(self.months(site, variable))
+
+    def chunk_path(self, site, variable, month):
+        return os.path.join(self.path, urllib.parse.quote(site, safe=""), urllib.parse.quote(variable, safe=""),
+                            f"{month}.npz")
+
+    def month_grid(self, month):
+        """
+        Grid times of one month block.
+        """
+        start = pd.Timestamp(month + "-01")
+        return pd.date_range(start, start + pd.offsets.MonthBegin(1), freq=self.step, inclusive="left")
+
+    def time_range(self, site=None, variable=None):
+        """
+        First and last month start with any data, over the given site/variable or all.
+        """
+        months = [m for s, variables in self.meta["chunks"].items() if site in (None, s)
+                  for v, ms in variables.items() if variable in (None, v) for m in ms]
+        if not months:
+            return None, None
+        return pd.Timestamp(min(months) + "-01"), pd.Timestamp(max(months) + "-01")
+
+    # -----------------------------
+    # Chunks
+    # -----------------------------
+    def load_chunk(self, site, variable, month):
+        """
+        Values of one month block, or None when the chunk does not exist.
+        """
+        key = (site, variable, month)
+        with self._lock:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+                return self._chunks[key]
+        if month not in self.months(site, variable):
+            return None
+        with np.load(self.chunk_path(site, variable, month)) as npz:
+            values = npz["values"]
+        values.setflags(write=False)
+        with self._lock:
+            self._chunks[key] = values
+            while len(self._chunks) > self.max_cached_chunks:
+                self._chunks.popitem(last=False)
+        return values
+
+    def write_chunk(self, site, variable, month, values):
+        path = self.chunk_path(site, variable, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, values=np.asarray(values, dtype=np.float32))
+        os.replace(tmp, path)
+        with self._lock:
+            self._chunks.pop((site, variable, month), None)
+
+    def save_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    # -----------------------------
+    # Write
+    # -----------------------------
+    def append(self, site, variable, series, unit=None, source=None, save=True):
+        """
+        Add one series (indexed by timestamp). Values are averaged onto the
+        archive grid; months not in the archive become new chunks, existing
+        months are merged. Returns the months written.
+        """
+        series = pd.to_numeric(series, errors="coerce").dropna()
+        if series.empty:
+            return []
+        series.index = pd.DatetimeIndex(series.index)
+        gridded = series.groupby(series.index.floor(self.step)).mean()
+
+        written = []
+        for month, values in gridded.groupby(gridded.index.to_period("M")):
+            key = month.strftime("%Y-%m")
+            grid = self.month_grid(key)
+            positions = grid.get_indexer(values.index)
+            existing = self.load_chunk(site, variable, key)
+            block = np.array(existing, dtype=np.float32) if existing is not None \
+                else np.full(len(grid), np.nan, dtype=np.float32)
+            block[positions] = values.to_numpy(dtype=np.float32)
+            self.write_chunk(site, variable, key, block)
+            written.append(key)
+
+        self.meta["sites"].setdefault(site, {})
+        if source is not None:
+            self.meta["sites"][site]["source"] = source
+        self.meta["variables"].setdefault(variable, {})
+        if unit is not None:
+            self.meta["variables"][variable]["unit"] = unit
+        months = self.meta["chunks"].setdefault(site, {}).setdefault(variable, [])
+        months[:] = sorted(set(months) | set(written))
+        if save:
+            self.save_meta()
+        return written
+
+    # -----------------------------
+    # Read
+    # -----------------------------
+    def read(self, sites=None, variables=None, start=None, end=None):
+        """
+        Lazy slice of the cube: a float32 array of shape (sites, variables,
+        times) over the grid times in [start, end), with the sites,
+        variables and times it covers. Only overlapping chunks are read.
+        """
+        sites = self.sites if sites is None else list(sites)
+        variables = self.variables if variables is None else list(variables)
+        first, last = self.time_range()
+        if first is None:
+            return np.empty((len(sites), len(variables), 0), dtype=np.float32), sites, variables, \
+                pd.DatetimeIndex([])
+        start = pd.Timestamp(start) if start is not None else first
+        end = pd.Timestamp(end) if end is not None else last + pd.offsets.MonthBegin(1)
+        times = pd.date_range(start.ceil(self.step), end, freq=self.step, inclusive="left")
+
+        cube = np.full((len(sites), len(variables), len(times)), np.nan, dtype=np.float32)
+        if len(times) == 0:
+            return cube, sites, variables, times
+        for month in pd.period_range(times[0], times[-1], freq="M"):
+            key = month.strftime("%Y-%m")
+            grid = self.month_grid(key)
+            lo, hi = times.searchsorted(grid[0]), times.searchsorted(grid[-1], side="right")
+            offset = grid.searchsorted(times[lo])
+            for i, site in enumerate(sites):
+                for j, variable in enumerate(variables):
+                    values = self.load_chunk(site, variable, key)
+                    if values is not None:
+                        cube[i, j, lo:hi] = values[offset:offset + hi - lo]
+        return cube, sites, variables, times
+
+    def series(self, site, variable, start=None, end=None, dropna=True):
+        """
+        One (site, variable) as a Series indexed by timestamp.
+        """
+        cube, _, _, times = self.read([site], [variable], start, end)
+        series = pd.Series(cube[0, 0], index=times, name=f"{site} {variable}")
+        return series.dropna() if dropna else series
+
+    def frame(self, site, variables=None, start=None, end=None):
+        """
+        Several variables of one site as a wide frame on the grid.
+        """
+        cube, _, variables, times = self.read([site], variables, start, end)
+        return pd.DataFrame(cube[0].T, index=pd.DatetimeIndex(times, name="timestamp"), columns=variables)
+
+    def to_long(self, sites=None, variables=None, start=None, end=None):
+        """
+        Observation store rows (see obs_store.STORE_COLUMNS) for a slice.
+        """
+        frames = []
+        for site in sites or self.sites:
+            for variable in variables or self.variables:
+                if not self.has(site, variable):
+                    continue
+                values = self.series(site, variable, start, end)
+                if values.empty:
+                    continue
+                frames.append(pd.DataFrame({
+                    "source": self.source(site) or "cube",
+                    "site": site,
+                    "variable": variable,
+                    "timestamp": values.index,
+                    "value": values.to_numpy(dtype=np.float64),
+                    "unit": self.unit(variable),
+                    "flag": None,
+                }))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def info(self):
+        """
+        One row per (site, variable): first and last month, chunks and unit.
+        """
+        rows = []
+        for site in self.sites:
+            for variable in self.variables:
+                months = self.months(site, variable)
+                if months:
+                    rows.append({"site": site, "variable": variable, "first": months[0], "last": months[-1],
+                                 "chunks": len(months), "unit": self.unit(variable)})
+        return pd.DataFrame(rows)
+
+
+def export_store(store, path, freq=DEFAULT_FREQ, start=None, end=None, sites=None, variables=None,
+                 incremental=False):
+    """
+    Write (or append) the observation store's series between start and end
+    to the archive at path. Each series is stored in its most common unit;
+    rows without a unit are left out of a series that has one, and a series
+    with no unit at all is stored as it is, with no unit in the metadata.
+    incremental: only export each series from its last archived month on,
+    so that month is merged and later months are appended as new chunks.
+    Returns the archive.
+    """
+    from units import canonical_unit, convert_mixed
+
+    archive = CubeArchive(path, freq)
+    table = store.table
+    for (site, variable), rows in table.groupby(level=["site", "variable"], sort=False):
+        if (sites and site not in sites) or (variables and variable not in variables):
+            continue
+        rows = rows.droplevel(["site", "variable"])
+        units = rows["unit"].astype("object").map(canonical_unit)
+        unit = archive.unit(variable) if archive.has(site, variable) else None
+        if unit is None:
+            unit = units[units != ""].mode()
+            unit = unit.iloc[0] if not unit.empty else None
+        since = start
+        if incremental and archive.has(site, variable):
+            last = pd.Timestamp(archive.months(site, variable)[-1] + "-01")
+            since = last if since is None else max(pd.Timestamp(since), last)
+        keep = np.ones(len(rows), dtype=bool) if unit is None else np.array(units != "")
+        if since is not None:
+            keep &= rows.index >= pd.Timestamp(since)
+        if end is not None:
+            keep &= rows.index < pd.Timestamp(end)
+        rows = rows[keep]
+        values = rows["value"] if unit is None else convert_mixed(rows["value"], rows["unit"], unit)
+        archive.append(site, variable, values, unit, store.site_sources.get(site), save=False)
+    archive.save_meta()
+    return archive
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or inspect the (site, variable, time) cube archive")
+    parser.add_argument("command", choices=["export", "update", "info"],
+                        help="export the store, append only what is new, or list the archive")
+    parser.add_argument("path")
+    parser.add_argument("--freq", default=DEFAULT_FREQ, help="grid step of a new archive")
+    parser.add_argument("--start", help="first month or date to export")
+    parser.add_argument("--end", help="export up to (not including) this date")
+    args = parser.parse_args()
+
+    if args.command in ("export", "update"):
+        from obs_store import load_or_build_store
+
+        store, _ = load_or_build_store()
+        archive = export_store(store, args.path, args.freq, args.start, args.end,
+                               incremental=args.command == "update")
+    else:
+        archive = CubeArchive(args.path)
+    print(archive.info().to_string(index=False))
@@ -0,0 +1,426 @@
+"""
+Local task runner for the data refresh.
+
+The refresh used to be a manual sequence of scripts with hard-coded dates
+and file names. Here each step is a task with declared inputs, outputs and
+dependencies:
+
+  sites, parameters          AQMS site and parameter lists (sites.json, parameters.json)
+  availability               which AQMS stations have the pollutants (check_gas_availibility.py)
+  observations               hourly AQMS observations for those stations (get_csv_api.py)
+  api_rows                   those observations as store rows under cache/api (app store, SQL view)
+  hourly:<file>              minute Picarro file -> hourly means (minute_to_hour_csv.py), one per file
+  store, gaps, correlation,  observation store snapshot and pre-aggregated caches under cache/
+  climatology
+  cube                       new months appended to the cube archive (cube_archive.py)
+
+Tasks whose dependencies are done run in parallel on a thread pool (scripts
+run as subprocesses, so they use separate cores). A task is skipped when
+its outputs exist, are newer than its inputs and were written by a run
+with the same parameters; API tasks also have a maximum age. A failed task
+blocks its dependents but not unrelated tasks. Outputs are touched after a
+successful run, so a task that found nothing to rewrite is not rerun. Every task of every run is
+appended to cache/etl_history.jsonl with its status and duration, and
+script output goes to cache/etl_logs/<task>.log.
+
+    python etl.py                      # nightly refresh: last 7 days up to yesterday
+    python etl.py --start 2024-12-01 --end 2024-12-31 --workers 4
+    python etl.py --only store gaps    # those tasks and what they depend on
+    python etl.py --dry-run            # show what would run
+    python etl.py --history 10         # last runs with durations
+
+For a nightly schedule, a crontab line such as
+    30 2 * * * cd /path/to/ghg_viewer && python etl.py >> cache/etl_cron.log 2>&1
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from ghg_loader import CACHE_DIR, DATA_DIR, PICARRO_SITES, site_files
+
+HISTORY_FILE = os.path.join(CACHE_DIR, "etl_history.jsonl")
+STATE_FILE = os.path.join(CACHE_DIR, "etl_state.json")
+LOG_DIR = os.path.join(CACHE_DIR, "etl_logs")
+MINUTE_DIR = os.path.join(DATA_DIR, "minutedata")
+CUBE_DIR = os.path.join(CACHE_DIR, "cube")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class Task:
+    """
+    One step of the pipeline. action() does the work; params are everything
+    besides the input files that changes its result, and go into the
+    signature that decides whether existing outputs are up to date.
+    """
+
+    name: str
+    action: object
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    deps: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    max_age: timedelta = None  # refresh outputs older than this even if the inputs did not change
+
+    def signature(self):
+        text = json.dumps({"params": self.params, "outputs": sorted(self.outputs)}, sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+
+def script(name, *args):
+    """
+    Action that runs one of the repo's scripts with the current interpreter,
+    logging its output to cache/etl_logs/<task>.log.
+    """
+    # A single callable argument builds the argument list when the task runs
+    build_args = args[0] if len(args) == 1 and callable(args[0]) else (lambda task: args)
+
+    def run(task):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        log_path = os.path.join(LOG_DIR, task.name.replace(":", "_").replace(os.sep, "_") + ".log")
+        command = [sys.executable, os.path.join(REPO_DIR, name), *map(str, build_args(task))]
+        with open(log_path, "w", encoding="utf-8") as log:
+            log.write(" ".join(command) + "\n")
+            log.flush()
+            result = subprocess.run(command, cwd=REPO_DIR, stdout=log, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} exited with status {result.returncode}, see {log_path}")
+
+    return run
+
+
+def call(func, *args, **kwargs):
+    """
+    Action that calls a Python function in this process.
+    """
+    return lambda task: func(*args, **kwargs)
+
+
+class Pipeline:
+    """
+    Tasks and their dependencies, run in dependency order.
+    """
+
+    def __init__(self, tasks=(), state_path=STATE_FILE, history_path=HISTORY_FILE):
+        self.tasks = {}
+        self.state_path = state_path
+        self.history_path = history_path
+        for task in tasks:
+            self.add(task)
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise ValueError(f"Duplicate task {task.name!r}")
+        self.tasks[task.name] = task
+        return task
+
+    def order(self, only=None):
+        """
+        Task names in dependency order; with only, just those tasks and
+        everything they depend on.
+        """
+        for task in self.tasks.values():
+            missing = [d for d in task.deps if d not in self.tasks]
+            if missing:
+                raise ValueError(f"Task {task.name!r} depends on unknown tasks {missing}")
+
+        ordered, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through {name!r}")
+            visiting.add(name)
+            for dep in self.tasks[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            ordered.append(name)
+
+        for name in only or self.tasks:
+            if name not in self.tasks:
+                raise ValueError(f"Unknown task {name!r}, expected one of {list(self.tasks)}")
+            visit(name)
+        return ordered
+
+    # -----------------------------
+    # Up-to-date check
+    # -----------------------------
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {}
+
+    def save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path, "w") as f:
+            json.dump(state, f, indent=2)
+
+    def input_files(self, task):
+        files = list(task.inputs)
+        for dep in task.deps:
+            files.extend(self.tasks[dep].outputs)
+        return files
+
+    def stale_reason(self, task, state):
+        """
+        Why the task has to run, or None when its outputs are up to date.
+        """
+        if not task.outputs:
+            return "no outputs"
+        missing = [p for p in task.outputs if not os.path.exists(p)]
+        if missing:
+            return f"missing {missing[0]}"
+        previous = state.get(task.name)
+        if previous is None or previous.get("signature") != task.signature():
+            return "parameters changed"
+        if task.max_age is not None and \
+                datetime.now() - datetime.fromisoformat(previous["finished"]) > task.max_age:
+            return "older than max age"
+        inputs = [p for p in self.input_files(task) if os.path.exists(p)]
+        if inputs and max(os.path.getmtime(p) for p in inputs) > min(os.path.getmtime(p) for p in task.outputs):
+            return "inputs changed"
+        return None
+
+    # -----------------------------
+    # Running
+    # -----------------------------
+    def run(self, only=None, force=False, workers=None, dry_run=False, echo=print):
+        """
+        Run the pipeline; returns one record per task with its status
+        ("ran", "skipped", "failed" or "blocked"), reason and seconds.
+        """
+        names = self.order(only)
+        state = self.load_state()
+        run_id = uuid.uuid4().hex[:12]
+        records = {}
+
+        def finish(name, status, reason, seconds=0.0, started=None, error=None):
+            record = {"run": run_id, "task": name, "status": status, "reason": reason, "seconds": seconds,
+                      "started": (started or datetime.now()).isoformat(timespec="seconds")}
+            if error:
+                record["error"] = error
+            records[name] = record
+            echo(f"{status:>8}  {name:<32} {seconds:8.2f}s  {error or reason or ''}")
+
+        def execute(task):
+            started = datetime.now()
+            t0 = time.perf_counter()
+            try:
+                task.action(task)
+            except Exception as e:
+                return started, time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+            return started, time.perf_counter() - t0, None
+
+        pending = list(names)
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            while pending or running:
+                for name in list(pending):
+                    task = self.tasks[name]
+                    deps = [records.get(d) for d in task.deps if d in names]
+                    if any(d is None for d in deps):
+                        continue
+                    pending.remove(name)
+                    if any(d["status"] in ("failed", "blocked") for d in deps):
+                        finish(name, "blocked", "dependency failed")
+                        continue
+                    reason = "forced" if force else self.stale_reason(task, state)
+                    if reason is None:
+                        finish(name, "skipped", "up to date")
+                    elif dry_run:
+                        finish(name, "would run", reason)
+                    else:
+                        running[pool.submit(execute, task)] = (name, reason)
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, reason = running.pop(future)
+                    started, seconds, error = future.result()
+                    if error:
+                        finish(name, "failed", reason, seconds, started, error)
+                    else:
+                        # Tasks may leave an unchanged output alone; mark it current like make's touch
+                        for path in self.tasks[name].outputs:
+                            if os.path.exists(path):
+                                os.utime(path)
+                        finish(name, "ran", reason, seconds, started)
+                        state[name] = {"signature": self.tasks[name].signature(),
+                                       "finished": datetime.now().isoformat(timespec="seconds")}
+
+        results = [records[name] for name in names]
+        if not dry_run:
+            self.save_state(state)
+            os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+            with open(self.history_path, "a", encoding="utf-8") as f:
+                for record in results:
+                    f.write(json.dumps(record) + "\n")
+        return results
+
+
+def read_history(path=HISTORY_FILE):
+    """
+    Every task record written so far, oldest first.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["run", "task", "status", "reason", "seconds", "started"])
+    return pd.read_json(path, lines=True, dtype={"run": str})
+
+
+def run_summary(history, last=10):
+    """
+    One row per run: start, tasks ran/skipped/failed/blocked and the summed task seconds.
+    """
+    if history.empty:
+        return pd.DataFrame()
+    grouped = history.groupby("run", sort=False)
+    summary = pd.DataFrame({
+        "started": grouped["started"].min(),
+        "ran": grouped["status"].agg(lambda s: (s == "ran").sum()),
+        "skipped": grouped["status"].agg(lambda s: (s == "skipped").sum()),
+        "failed": grouped["status"].agg(lambda s: (s == "failed").sum()),
+        "blocked": grouped["status"].agg(lambda s: (s == "blocked").sum()),
+        "task_seconds": grouped["seconds"].sum(),
+    })
+    return summary.sort_values("started").tail(last).reset_index()
+
+
+# -----------------------------
+# The refresh pipeline
+# -----------------------------
+def availability_sites(path):
+    """
+    AQMS Site_Ids and parameters listed by check_gas_availibility.py.
+    """
+    found = pd.read_csv(path)
+    return sorted(found["Site_Id"].unique().tolist()), sorted(found["Parameter"].unique().tolist())
+
+
+def observation_args(availability_path, start, end, output):
+    def args(task):
+        site_ids, parameters = availability_sites(availability_path)
+        if not site_ids:
+            raise RuntimeError(f"No stations with data listed in {availability_path}")
+        return ["--sites", *site_ids, "--parameters", *parameters, "--start", start, "--end", end,
+                "--output", output]
+    return args
+
+
+def save_observations(path, name):
+    from obs_normalize import normalize_observations
+    from obs_store import API_DIR, api_to_long, read_parameters_json, read_sites_json, save_api_rows
+    from units import parameter_units
+    site_names = {s["Site_Id"]: s["SiteName"] for s in read_sites_json()}
+    rows = api_to_long(normalize_observations(pd.read_csv(path)), site_names, parameter_units(read_parameters_json()))
+    save_api_rows(rows, API_DIR, name)
+
+
+def build_store():
+    from obs_store import load_or_build_store
+    load_or_build_store(DATA_DIR)
+
+
+def build_gaps():
+    from gap_index import GapIndex
+    from obs_store import load_or_build_store
+    GapIndex.build(load_or_build_store(DATA_DIR)[0]).save()
+
+
+def update_cube():
+    from cube_archive import export_store
+    from obs_store import load_or_build_store
+    export_store(load_or_build_store(DATA_DIR)[0], CUBE_DIR, incremental=True)
+
+
+def refresh_pipeline(start, end, pollutants=("NH3",), near=None, k=5, api_max_age=timedelta(days=7),
+                     availability_path="available_parameters.csv", observations_path="AQMS_Observations.csv"):
+    """
+    The whole refresh for observations between start and end (YYYY-MM-DD).
+    """
+    from climatology import CUBE_FILE, build_cube
+    from correlation import STATS_FILE, build_engine
+    from gap_index import COMPLETENESS_FILE, GAP_FILE
+    from obs_store import API_DIR, STORE_FILE, STORE_META_FILE
+
+    picarro_files = [p for site in PICARRO_SITES for p in site_files(site, DATA_DIR)]
+    availability = ["--start", start, "--end", end, "--pollutants", *pollutants, "--output", availability_path,
+                    "--delay", 0.1]
+    if near:
+        availability += ["--near", near, "--k", k]
+
+    tasks = [
+        Task("sites", script("get_sites.py"), outputs=["sites.json"], max_age=api_max_age),
+        Task("parameters", script("get_parameters.py"), outputs=["parameters.json"], max_age=api_max_age),
+        Task("availability", script("check_gas_availibility.py", *availability), outputs=[availability_path],
+             deps=["sites"], params={"args": availability}, max_age=api_max_age),
+        Task("observations", script("get_csv_api.py", observation_args(availability_path, start, end,
+                                                                        observations_path)),
+             outputs=[observations_path], deps=["availability"], params={"start": start, "end": end}),
+        # One file per window, so earlier nightly pulls stay in cache/api
+        Task("api_rows", call(save_observations, observations_path, f"etl_{start}_{end}"),
+             inputs=[observations_path], outputs=[os.path.join(API_DIR, f"etl_{start}_{end}.parquet")],
+             deps=["observations"]),
+    ]
+
+    hourly = []
+    for path in sorted(glob.glob(os.path.join(MINUTE_DIR, "*.csv"))):
+        if path.endswith("_hour.csv"):
+            continue
+        output = path[:-len(".csv")] + "_hour.csv"
+        name = f"hourly:{os.path.basename(path)}"
+        tasks.append(Task(name, script("minute_to_hour_csv.py", path, "-o", output, "--chunked", "--workers", 1),
+                          inputs=[path], outputs=[output]))
+        hourly.append(name)
+
+    tasks += [
+        Task("store", call(build_store), inputs=picarro_files,
+             outputs=[STORE_FILE, STORE_META_FILE]),
+        Task("gaps", call(build_gaps), deps=["store"], outputs=[GAP_FILE, COMPLETENESS_FILE]),
+        Task("correlation", call(build_engine, DATA_DIR), inputs=picarro_files, outputs=[STATS_FILE]),
+        Task("climatology", call(build_cube, DATA_DIR), inputs=picarro_files, outputs=[CUBE_FILE]),
+        Task("cube", call(update_cube), deps=["store"], outputs=[os.path.join(CUBE_DIR, "meta.json")]),
+    ]
+    return Pipeline(tasks)
+
+
+if __name__ == "__main__":
+    yesterday = date.today() - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Refresh AQMS pulls, hourly files and caches")
+    parser.add_argument("--start", default=(yesterday - timedelta(days=6)).isoformat(), help="YYYY-MM-DD")
+    parser.add_argument("--end", default=yesterday.isoformat(), help="YYYY-MM-DD")
+    parser.add_argument("--pollutants", nargs="+", default=["NH3"])
+    parser.add_argument("--near", help="only check AQMS stations near this site, e.g. Stockton")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="run these tasks and their dependencies")
+    parser.add_argument("--force", action="store_true", help="run tasks even when up to date")
+    parser.add_argument("--workers", type=int, help="parallel tasks (default: all cores)")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--history", type=int, metavar="N", help="show the last N runs and exit")
+    args = parser.parse_args()
+
+    if args.history:
+        print(run_summary(read_history(), args.history).to_string(index=False))
+        sys.exit(0)
+
+    pipeline = refresh_pipeline(args.start, args.end, args.pollutants, args.near, args.k)
+    t0 = time.perf_counter()
+    results = pipeline.run(args.only, args.force, args.workers, args.dry_run)
+    print(f"Finished in {time.perf_counter() - t0:.1f}s")
+    if any(r["status"] in ("failed", "blocked") for r in results):
+        sys.exit(1)
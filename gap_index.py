@@ -0,0 +1,269 @@
+"""
+Data completeness and gap index per site, variable and period.
+
+At ingest the valid timestamps of every (site, variable) are snapped to
+the expected sampling interval and turned into a presence vector on a
+regular grid. Run-length encoding of that vector gives the missing
+intervals directly; counts and percent completeness per day and month are
+sums over the same vector. The index is saved under cache/ (by the ETL
+gaps task) so views only read it, and series added to the store later are
+re-indexed as they arrive.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ghg_loader import CACHE_DIR
+
+GAP_FILE = os.path.join(CACHE_DIR, "gaps.parquet")
+COMPLETENESS_FILE = os.path.join(CACHE_DIR, "completeness.parquet")
+SOURCES = ("picarro", "aqms")
+
+
+def run_lengths(present):
+    """
+    Run-length encode a boolean array. Returns (starts, lengths, values).
+    """
+    present = np.asarray(present, dtype=bool)
+    if present.size == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=bool)
+    change = np.flatnonzero(present[1:] != present[:-1]) + 1
+    starts = np.concatenate([[0], change])
+    lengths = np.diff(np.concatenate([starts, [present.size]]))
+    return starts, lengths, present[starts]
+
+
+def freq_step(freq):
+    return pd.to_timedelta(pd.tseries.frequencies.to_offset(freq))
+
+
+def presence_grid(timestamps, freq, start=None, end=None):
+    """
+    Regular grid at freq and a boolean array marking grid slots that have at
+    least one sample. Irregular timestamps (e.g. 22:31:31) are floored onto
+    the grid.
+    """
+    ts = pd.DatetimeIndex(timestamps).dropna().sort_values()
+    step = freq_step(freq)
+    start = pd.Timestamp(start).floor(freq) if start is not None else ts[0].floor(freq)
+    end = pd.Timestamp(end).floor(freq) if end is not None else ts[-1].floor(freq)
+    grid = pd.date_range(start, end, freq=freq)
+
+    present = np.zeros(len(grid), dtype=bool)
+    slots = ((ts.floor(freq) - start) // step).to_numpy(dtype=np.int64)
+    slots = slots[(slots >= 0) & (slots < len(grid))]
+    present[slots] = True
+    return grid, present
+
+
+def infer_freq(timestamps):
+    """
+    Expected sampling interval: the median spacing, rounded to a minute or an hour.
+    """
+    ts = pd.DatetimeIndex(timestamps).dropna().sort_values()
+    step = pd.Series(ts).diff().median()
+    if pd.isna(step) or step >= pd.Timedelta(minutes=30):
+        return "h"
+    return "min"
+
+
+def gaps_and_completeness(timestamps, freq=None, start=None, end=None):
+    """
+    Missing intervals and per-day / per-month completeness for one series.
+
+    Returns (gaps, completeness):
+      gaps         start, end (exclusive) and length of every missing run
+      completeness period type ("day"/"month"), period start, samples,
+                   expected samples and percent complete
+    """
+    freq = freq or infer_freq(timestamps)
+    grid, present = presence_grid(timestamps, freq, start, end)
+    step = freq_step(freq)
+
+    starts, lengths, values = run_lengths(present)
+    missing = ~values
+    gaps = pd.DataFrame({
+        "start": grid[starts[missing]],
+        "end": grid[starts[missing]] + lengths[missing] * step,
+        "missing_steps": lengths[missing],
+    })
+    gaps["duration"] = gaps["end"] - gaps["start"]
+
+    frames = []
+    presence = pd.Series(present, index=grid)
+    for period, code in [("day", "D"), ("month", "MS")]:
+        counts = presence.resample(code).agg(["sum", "size"])
+        # Expected slots count the whole calendar period, not just the part inside the grid
+        period_start = counts.index
+        period_end = period_start + (pd.Timedelta(days=1) if code == "D" else pd.offsets.MonthBegin(1))
+        expected = ((period_end - period_start) / step).astype(int)
+        frames.append(pd.DataFrame({
+            "period": period,
+            "period_start": period_start,
+            "samples": counts["sum"].astype(int).to_numpy(),
+            "expected": expected,
+        }))
+    completeness = pd.concat(frames, ignore_index=True)
+    completeness["percent_complete"] = 100.0 * completeness["samples"] / completeness["expected"]
+    completeness["freq"] = freq
+    return gaps, completeness
+
+
+class GapIndex:
+    """
+    Gap and completeness tables for every (site, variable) in the observation store.
+    """
+
+    def __init__(self, gaps=None, completeness=None):
+        self.gaps = gaps if gaps is not None else pd.DataFrame(
+            columns=["site", "variable", "start", "end", "missing_steps", "duration"])
+        self.completeness = completeness if completeness is not None else pd.DataFrame(
+            columns=["site", "variable", "period", "period_start", "samples", "expected",
+                     "percent_complete", "freq"])
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def index_table(table, sources=SOURCES):
+        """
+        Gap and completeness rows for every (site, variable) of a store table.
+        """
+        table = table[table["source"].isin(sources)].dropna(subset=["value"])
+
+        gap_parts, comp_parts = [], []
+        for (site, variable), rows in table.groupby(level=["site", "variable"], sort=False):
+            gaps, completeness = gaps_and_completeness(rows.index.get_level_values("timestamp"))
+            for part, parts in [(gaps, gap_parts), (completeness, comp_parts)]:
+                part.insert(0, "variable", variable)
+                part.insert(0, "site", site)
+                parts.append(part)
+        return gap_parts, comp_parts
+
+    @classmethod
+    def build(cls, store, sources=SOURCES):
+        """
+        Index every (site, variable) whose rows come from the given sources.
+        """
+        gap_parts, comp_parts = cls.index_table(store.table, sources)
+        return cls(
+            pd.concat(gap_parts, ignore_index=True) if gap_parts else None,
+            pd.concat(comp_parts, ignore_index=True) if comp_parts else None,
+        )
+
+    def update(self, store, pairs, sources=SOURCES):
+        """
+        Re-index the given (site, variable) series from the store, replacing their rows.
+        """
+        pairs = set(pairs)
+        table = store.table
+        keys = table.index.droplevel("timestamp")
+        gap_parts, comp_parts = self.index_table(table[keys.isin(pairs)], sources)
+
+        with self._lock:
+            gaps, completeness = self.gaps, self.completeness
+            gap_parts.insert(0, gaps[~pd.MultiIndex.from_frame(gaps[["site", "variable"]]).isin(pairs)])
+            comp_parts.insert(0, completeness[
+                ~pd.MultiIndex.from_frame(completeness[["site", "variable"]]).isin(pairs)])
+            # Readers take a reference to the whole table, so swap in finished frames
+            self.gaps = pd.concat(gap_parts, ignore_index=True)
+            self.completeness = pd.concat(comp_parts, ignore_index=True)
+
+    def follow(self, store):
+        """
+        Keep the index current: re-index the series of every batch later
+        added to store, and catch up on series the store gained before the
+        index was saved or loaded.
+        """
+        store.listeners.append(lambda rows: self.update(store, zip(rows["site"], rows["variable"])))
+        indexed = set(zip(self.gaps["site"], self.gaps["variable"])) \
+            | set(zip(self.completeness["site"], self.completeness["variable"]))
+        missing = set(store.table.index.droplevel("timestamp").unique()) - indexed
+        if missing:
+            self.update(store, missing)
+        return self
+
+    def save(self, gap_path=GAP_FILE, completeness_path=COMPLETENESS_FILE):
+        os.makedirs(os.path.dirname(gap_path) or ".", exist_ok=True)
+        self.gaps.to_parquet(gap_path, index=False)
+        self.completeness.to_parquet(completeness_path, index=False)
+
+    @classmethod
+    def load(cls, gap_path=GAP_FILE, completeness_path=COMPLETENESS_FILE):
+        if not (os.path.exists(gap_path) and os.path.exists(completeness_path)):
+            return None
+        return cls(pd.read_parquet(gap_path), pd.read_parquet(completeness_path))
+
+    @classmethod
+    def load_or_build(cls, store, newer_than=None, gap_path=GAP_FILE, completeness_path=COMPLETENESS_FILE):
+        """
+        The saved index (written by the ETL gaps task) when it is not older
+        than the file newer_than, e.g. the store snapshot it was built from;
+        otherwise built from the store and saved.
+        """
+        index = cls.load(gap_path, completeness_path)
+        if index is not None and newer_than is not None and os.path.exists(newer_than):
+            saved = min(os.path.getmtime(gap_path), os.path.getmtime(completeness_path))
+            if saved < os.path.getmtime(newer_than):
+                index = None
+        if index is None:
+            index = cls.build(store)
+            index.save(gap_path, completeness_path)
+        return index
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def missing_intervals(self, site, variable, start=None, end=None, min_duration=None):
+        """
+        Missing runs for one series overlapping [start, end].
+        """
+        g = self.gaps
+        g = g[(g["site"] == site) & (g["variable"] == variable)]
+        if start is not None:
+            g = g[g["end"] > pd.Timestamp(start)]
+        if end is not None:
+            g = g[g["start"] < pd.Timestamp(end)]
+        if min_duration is not None:
+            g = g[g["duration"] >= pd.Timedelta(min_duration)]
+        return g.reset_index(drop=True)
+
+    def completeness_for(self, site, variable=None, period="day", start=None, end=None):
+        """
+        Completeness rows for a site (and optionally one variable) at "day" or "month" level.
+        """
+        c = self.completeness
+        c = c[(c["site"] == site) & (c["period"] == period)]
+        if variable is not None:
+            c = c[c["variable"] == variable]
+        if start is not None:
+            c = c[c["period_start"] >= pd.Timestamp(start)]
+        if end is not None:
+            c = c[c["period_start"] <= pd.Timestamp(end)]
+        return c.reset_index(drop=True)
+
+    def calendar(self, site, variable):
+        """
+        Daily percent completeness as a (month x day-of-month) table for a calendar heatmap.
+        """
+        daily = self.completeness_for(site, variable, "day")
+        if daily.empty:
+            return pd.DataFrame()
+        days = pd.DatetimeIndex(daily["period_start"])
+        table = pd.DataFrame({
+            "month": days.strftime("%Y-%m"),
+            "day": days.day,
+            "percent_complete": daily["percent_complete"].to_numpy(),
+        })
+        return table.pivot(index="month", columns="day", values="percent_complete")
+
+
+if __name__ == "__main__":
+    from obs_store import ObservationStore
+
+    store = ObservationStore()
+    store.add_picarro_dir()
+    index = GapIndex.build(store)
+    index.save()
+    print(f"Gap index: {len(index.gaps)} missing intervals, {len(index.completeness)} completeness rows")
@@ -1,20 +1,32 @@
+import argparse
+import os
 import requests
 import json
 import pandas as pd
 import datetime as dt
 import urllib.parse
 
+from obs_normalize import flatten_observations
+
 # API base and endpoint
-url_api = "https://data.airquality.nsw.gov.au"
+url_api = os.environ.get("AQMS_API_URL", "https://data.airquality.nsw.gov.au")
 get_observations = "api/Data/get_Observations"
 headers = {'Content-Type': 'application/json', 'accept': 'application/json'}
 
+parser = argparse.ArgumentParser(description="Download hourly AQMS observations to CSV")
+parser.add_argument("--parameters", nargs="+", default=["NO2"])   # e.g. CH4
+parser.add_argument("--sites", type=int, nargs="+", default=[39])  # AQMS Site IDs
+parser.add_argument("--start", default="2024-12-05", help="first date, YYYY-MM-DD")
+parser.add_argument("--end", default="2024-12-15", help="last date, YYYY-MM-DD")
+parser.add_argument("--output", default="AQMS_Observations.csv")
+args = parser.parse_args()
+
 # Setup request payload
 ObsRequest = {
-    "Parameters": ["NO2"],          # Replace with "CH4" if needed
-    "Sites": [39],                  # Replace with desired Site ID
-    "StartDate": "2024-12-05",
-    "EndDate": "2024-12-15",
+    "Parameters": args.parameters,
+    "Sites": args.sites,
+    "StartDate": args.start,
+    "EndDate": args.end,
     "Categories": ["Averages"],
     "SubCategories": ["Hourly"],
     "Frequency": ["Hourly average"]
@@ -27,20 +39,8 @@ response = requests.post(query_url, data=json.dumps(ObsRequest), headers=headers
 # Parse response
 data = response.json()
 
-# Filter non-null values and flatten
-flat_data = []
-for entry in data:
-    if entry.get("Value") is not None:
-        flat_data.append({
-            "Site_Id": entry["Site_Id"],
-            "Date": entry["Date"],
-            "Hour": entry["Hour"],
-            "Value": entry["Value"],
-            "ParameterCode": entry["Parameter"]["ParameterCode"],
-            "Units": entry["Parameter"]["Units"]
-        })
-
-# Convert to DataFrame and save to CSV
-df = pd.DataFrame(flat_data)
-df.to_csv("AQMS_Observations.csv", index=False)
-print("Saved to AQMS_Observations.csv")
+# Flatten and drop null values in one pass
+df = flatten_observations(data).dropna(subset=["Value"])
+df = df[["Site_Id", "Date", "Hour", "Value", "ParameterCode", "Units"]]
+df.to_csv(args.output, index=False)
+print(f"Saved to {args.output}")
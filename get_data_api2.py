@@ -5,26 +5,62 @@ import urllib.parse
 import datetime as dt
 import json
 
+from instrumentation import NULL_TRACER
+
+DEFAULT_API_URL = "https://data.airquality.nsw.gov.au/"
+
+
 class AQMS_API:
     """
     This class defines and configures the API to query the AQMS database.
     """
 
-    def __init__(self):
+    def __init__(self, url_api=None, timeout=30, tracer=None):
         self.logger = logging.getLogger(__name__)
-        self.url_api = "https://data.airquality.nsw.gov.au/"
+        # AQMS_API_URL lets us point at mock_aqms_server.py for offline runs
+        self.url_api = url_api or os.environ.get("AQMS_API_URL", DEFAULT_API_URL)
+        if not self.url_api.endswith("/"):
+            self.url_api += "/"
+        self.timeout = timeout
+        # Spans for every request when an enabled instrumentation.Tracer is passed in
+        self.tracer = tracer or NULL_TRACER
         self.headers = {
             'content-type': 'application/json',
             'accept': 'application/json'
         }
         self.get_observations_endpoint = 'api/Data/get_Observations'
+        self.get_sites_endpoint = 'api/Data/get_SiteDetails'
+        self.get_parameters_endpoint = 'api/Data/get_ParameterDetails'
+
+    def get_site_details(self):
+        """
+        Send a GET request for the list of AQMS sites.
+        """
+        query_url = urllib.parse.urljoin(self.url_api, self.get_sites_endpoint)
+        with self.tracer.span("api.get_site_details") as span:
+            response = requests.get(url=query_url, headers=self.headers, timeout=self.timeout)
+            span.set(bytes=len(response.content), status=response.status_code)
+        return response
+
+    def get_parameter_details(self):
+        """
+        Send a GET request for the list of AQMS parameters.
+        """
+        query_url = urllib.parse.urljoin(self.url_api, self.get_parameters_endpoint)
+        with self.tracer.span("api.get_parameter_details") as span:
+            response = requests.get(url=query_url, headers=self.headers, timeout=self.timeout)
+            span.set(bytes=len(response.content), status=response.status_code)
+        return response
 
     def get_observations(self, obs_request):
         """
         Send a POST request to fetch observation data.
         """
         query_url = urllib.parse.urljoin(self.url_api, self.get_observations_endpoint)
-        response = requests.post(url=query_url, data=json.dumps(obs_request), headers=self.headers)
+        with self.tracer.span("api.get_observations") as span:
+            response = requests.post(url=query_url, data=json.dumps(obs_request), headers=self.headers,
+                                     timeout=self.timeout)
+            span.set(bytes=len(response.content), status=response.status_code)
         return response
 
     def build_obs_request(self):
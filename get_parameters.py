@@ -1,9 +1,11 @@
+import os
 import requests
 import urllib.parse
 import json
 
 # Define API URL and endpoint
-url_api = "https://data.airquality.nsw.gov.au"
+# AQMS_API_URL points the script at another server, e.g. mock_aqms_server.py
+url_api = os.environ.get("AQMS_API_URL", "https://data.airquality.nsw.gov.au")
 get_parameters = "api/Data/get_ParameterDetails"
 headers = {'Content-Type': 'application/json', 'accept': 'application/json'}
 
@@ -1,8 +1,10 @@
+import os
 import requests
 import urllib.parse
 import json  # Needed to save to JSON
 
-url_api = "https://data.airquality.nsw.gov.au"
+# AQMS_API_URL points the script at another server, e.g. mock_aqms_server.py
+url_api = os.environ.get("AQMS_API_URL", "https://data.airquality.nsw.gov.au")
 get_sites = "api/Data/get_SiteDetails"
 headers = {'Content-Type': 'application/json', 'accept': 'application/json'}
 
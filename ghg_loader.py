@@ -0,0 +1,225 @@
+"""
+Loading of the local Picarro CSV files in ghg_csv.
+
+Two layouts exist:
+  - Lidcombe: DATE, TIME, EPOCH_TIME, CH4, CO2, H2O, N2O, NH3
+  - Stockton: "Date Time" plus station columns, Picarro gases as *_Pic_0 and,
+    in the minute files, a "<column>-Flag" column next to every measurement
+"""
+
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = "ghg_csv"  # folder with files like Lidcombe_YYYYMMDD.csv
+CACHE_DIR = "cache"   # derived data (cubes, indexes, fits) that can be rebuilt at any time
+
+# Picarro sites and coordinates
+PICARRO_SITES = {
+    "Lidcombe": [-33.865, 151.045],
+    "Stockton": [-32.909, 151.784]
+}
+
+# Stockton column names -> names used throughout the viewer
+STOCKTON_RENAME = {
+    'CH4_Pic_0': 'CH4',
+    'CO2_Pic_0': 'CO2',
+    'N2O_Pic_0': 'N2O',
+    'NH3_Pic_0': 'NH3',
+    'H2O_Pic_0': 'H2O',
+    'WSP_0': 'Wind_Speed',
+    'WDR_0': 'Wind_Direction'
+}
+
+# Define gas units
+GAS_UNITS = {
+    "CH4": "ppm",
+    "CO2": "ppm",
+    "N2O": "ppm",
+    "NH3": "ppb",
+    "H2O": "%",
+}
+
+FLAG_SUFFIX = "-Flag"
+
+DATE_COLUMNS = ("Date Time", "DATE", "TIME")
+
+# float64 -> float32 is only applied when every value round-trips within this relative error
+FLOAT32_RTOL = 1e-6
+
+
+def site_files(site, data_dir=DATA_DIR):
+    """
+    Sorted list of the monthly CSV files for a site.
+    """
+    return sorted(glob.glob(os.path.join(data_dir, f"{site}_*.csv")))
+
+
+def site_from_path(path):
+    """
+    Site name from a file name such as Lidcombe_20231201.csv.
+    """
+    return os.path.basename(path).split("_")[0]
+
+
+def month_from_path(path):
+    """
+    YYYYMM month key from a file name such as Lidcombe_20231201.csv.
+    """
+    return os.path.basename(path).split("_")[1][:6]
+
+
+def parse_datetime(df):
+    """
+    Build a datetime Series for either file layout.
+    """
+    if "Date Time" in df.columns:
+        return pd.to_datetime(df["Date Time"], dayfirst=True, errors='coerce')
+    if "DATE" in df.columns and "TIME" in df.columns:
+        return pd.to_datetime(df["DATE"] + " " + df["TIME"], dayfirst=True, errors='coerce')
+    raise ValueError("Unknown file format. Required columns not found.")
+
+
+def clean_columns(df):
+    """
+    Remove units in brackets from column names, e.g. "CH4 (ppm)" -> "CH4".
+    """
+    df.columns = df.columns.str.replace(r"\s*\(.*\)", "", regex=True).str.strip()
+    return df
+
+
+def harmonized_name(raw):
+    """
+    Name a raw file column gets after harmonize(), e.g. "CH4_Pic_0" -> "CH4",
+    "CH4 (ppm)" -> "CH4", "WSP_0-Flag" -> "Wind_Speed-Flag".
+    """
+    suffix = FLAG_SUFFIX if raw.endswith(FLAG_SUFFIX) else ""
+    base = raw[:-len(suffix)] if suffix else raw
+    base = STOCKTON_RENAME.get(base, base)
+    return re.sub(r"\s*\(.*\)", "", base).strip() + suffix
+
+
+def read_picarro_csv(path, columns=None, compact=False):
+    """
+    Read one Picarro CSV in either layout and return a frame with a
+    'datetime' column, harmonized gas/wind names and cleaned column names.
+    Flag columns are kept as strings. Rows with unparseable dates are dropped.
+
+    columns: harmonized measurement names to keep (with their flags); other
+    columns are never parsed. compact: drop the raw date strings and shrink
+    dtypes (see compact_frame).
+    """
+    usecols = None
+    if columns is not None:
+        wanted = set(columns) | {f"{c}{FLAG_SUFFIX}" for c in columns}
+
+        def usecols(c):
+            return c in DATE_COLUMNS or harmonized_name(c) in wanted
+
+    df = harmonize(pd.read_csv(path, usecols=usecols))
+    if compact:
+        # The raw date strings are redundant once 'datetime' is parsed
+        df = compact_frame(df.drop(columns=[c for c in DATE_COLUMNS if c in df.columns]))
+    return df
+
+
+def compact_frame(df, rtol=FLOAT32_RTOL):
+    """
+    float64 columns to float32 where every value round-trips within rtol,
+    and string columns with few distinct values (flags) to categoricals.
+    """
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == np.float64:
+            x = values.to_numpy()
+            x32 = x.astype(np.float32)
+            with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+                err = np.abs(x32.astype(np.float64) - x) / np.maximum(np.abs(x), np.finfo(np.float32).tiny)
+            if not np.any(err > rtol):
+                df[col] = x32
+        elif values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            if values.nunique(dropna=True) <= max(len(values) // 2, 1):
+                df[col] = values.astype("category")
+    return df
+
+
+def frame_memory(df):
+    """
+    Bytes held by a frame, including string contents.
+    """
+    return int(df.memory_usage(deep=True).sum())
+
+
+def full_load_bytes(path):
+    """
+    Bytes held by a plain read of the whole file (every column, float64 and
+    string dtypes), measured by loading it once.
+    """
+    return frame_memory(read_picarro_csv(path))
+
+
+def harmonize(df):
+    """
+    Parse dates and harmonize column names of a raw frame (a whole file or
+    one chunk of it) the same way read_picarro_csv does.
+    """
+    df["datetime"] = parse_datetime(df)
+    df = df.dropna(subset=["datetime"])
+
+    # Rename flag columns together with the measurement they belong to
+    rename = dict(STOCKTON_RENAME)
+    rename.update({f"{k}{FLAG_SUFFIX}": f"{v}{FLAG_SUFFIX}" for k, v in STOCKTON_RENAME.items()})
+    df = df.rename(columns=rename)
+
+    return clean_columns(df)
+
+
+def hourly_mean(df):
+    """
+    Resample the numeric columns of a loaded file to hourly means.
+    Returns a frame with 'datetime' as a column.
+    """
+    numeric_df = df.set_index("datetime").select_dtypes(include=["number"])
+    return numeric_df.resample("h").mean().reset_index()
+
+
+def ensure_sorted(df, column="datetime"):
+    """
+    df ordered by its datetime column (or DatetimeIndex when column is None).
+    Already-sorted frames, the normal case, are returned as they are.
+    """
+    times = df.index if column is None else df[column]
+    if times.is_monotonic_increasing:
+        return df
+    return df.sort_index(kind="stable") if column is None else df.sort_values(column, kind="stable")
+
+
+def time_slice(df, start=None, end=None, column="datetime"):
+    """
+    Rows with start <= time < end of a frame sorted on its datetime column
+    (or DatetimeIndex when column is None), found by binary search and
+    returned as a positional slice instead of a boolean scan over every row.
+    """
+    times = (df.index if column is None else df[column]).to_numpy()
+    lo = 0 if start is None else times.searchsorted(np.datetime64(pd.Timestamp(start)), side="left")
+    hi = len(times) if end is None else times.searchsorted(np.datetime64(pd.Timestamp(end)), side="left")
+    return df.iloc[lo:hi]
+
+
+def day_slice(df, day, column="datetime"):
+    """
+    The rows of one calendar day, see time_slice.
+    """
+    start = pd.Timestamp(day).normalize()
+    return time_slice(df, start, start + pd.Timedelta(days=1), column)
+
+
+def measurement_columns(df):
+    """
+    Numeric measurement columns, excluding time bookkeeping columns.
+    """
+    skip = {"datetime", "EPOCH_TIME"}
+    return [c for c in df.select_dtypes(include=["number"]).columns if c not in skip]
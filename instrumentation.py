@@ -0,0 +1,292 @@
+"""
+Lightweight timing and memory spans for the viewer and the API client.
+
+    tracer = Tracer(enabled=True)
+    with tracer.span("read_csv", path=f) as span:
+        df = pd.read_csv(f)
+        span.set(rows=len(df), bytes=os.path.getsize(f))
+
+Each finished span becomes one record: stage, run, start time, wall
+seconds, rows, bytes, cache ("hit"/"miss" for spans opened with
+cached=True), optional tracemalloc peak and any extra attributes. Records
+can be summarised per stage or written as JSON lines, one object per span,
+for aggregation across sessions.
+
+A disabled tracer hands out a shared no-op span, so instrumented code
+costs one method call and an attribute check per span; attributes that are
+costly to compute should be set under "if tracer.enabled".
+
+tracemalloc is process-global: it runs while at least one tracer has
+memory tracing on, and peaks are process-wide, so they include allocations
+made by other sessions' threads during the span. The peak is only reset
+when no other span is measuring; a span opened while another is measuring
+(nested or concurrent) reports an upper bound.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+RECORD_FIELDS = ["session", "run", "stage", "start", "seconds", "rows", "bytes", "cache", "peak_bytes"]
+
+_local = threading.local()
+
+# Process-wide tracemalloc state shared by all tracers
+_memory_lock = threading.Lock()
+_memory = {"users": 0, "started": False, "open_spans": 0}
+
+
+def _start_memory():
+    with _memory_lock:
+        if _memory["users"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memory["started"] = True
+        _memory["users"] += 1
+
+
+def _stop_memory():
+    """
+    Drop one user; tracing stops with the last one, unless it was already
+    running (started by someone else) before the first tracer needed it.
+    """
+    with _memory_lock:
+        _memory["users"] -= 1
+        if _memory["users"] == 0 and _memory["started"]:
+            tracemalloc.stop()
+            _memory["started"] = False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed stage; use as a context manager and attach counts with set().
+    """
+
+    def __init__(self, tracer, stage, cached, attrs):
+        self.tracer = tracer
+        self.stage = stage
+        self.cached = cached
+        self.attrs = attrs
+        self.missed = False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.memory_start = None
+        if self.tracer.trace_memory:
+            with _memory_lock:
+                if tracemalloc.is_tracing():
+                    if _memory["open_spans"] == 0:
+                        tracemalloc.reset_peak()
+                    _memory["open_spans"] += 1
+                    self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.started = datetime.now()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.t0
+        _local.stack.pop()
+        peak = None
+        if self.memory_start is not None:
+            with _memory_lock:
+                _memory["open_spans"] -= 1
+                if tracemalloc.is_tracing():
+                    peak = tracemalloc.get_traced_memory()[1] - self.memory_start
+        record = {
+            "session": self.tracer.session,
+            "run": self.tracer.run,
+            "stage": self.stage,
+            "start": self.started.isoformat(timespec="milliseconds"),
+            "seconds": seconds,
+            "rows": self.attrs.pop("rows", None),
+            "bytes": self.attrs.pop("bytes", None),
+            "cache": ("miss" if self.missed else "hit") if self.cached else None,
+            "peak_bytes": peak,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.attrs)
+        self.tracer.add(record)
+        return False
+
+
+class Tracer:
+    """
+    Collects span records for one session. log_path, when set, receives
+    every record as a JSON line as soon as the span ends.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False, session=None, log_path=None, max_records=10_000):
+        self.session = session or uuid.uuid4().hex[:12]
+        self.log_path = log_path
+        self.records = deque(maxlen=max_records)
+        self.run = 0
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._memory_release = None
+        self.trace_memory = False
+        self.configure(enabled, trace_memory)
+
+    def configure(self, enabled, trace_memory=False):
+        """
+        Turn recording and memory tracing on or off. Memory tracing holds a
+        reference on the process-wide tracemalloc, released when it is
+        turned off or the tracer is garbage collected.
+        """
+        self.enabled = enabled
+        trace_memory = enabled and trace_memory
+        if trace_memory and self._memory_release is None:
+            _start_memory()
+            self._memory_release = weakref.finalize(self, _stop_memory)
+        elif not trace_memory and self._memory_release is not None:
+            self._memory_release()
+            self._memory_release = None
+        self.trace_memory = trace_memory
+
+    def span(self, stage, cached=False, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, cached, attrs)
+
+    def new_run(self):
+        """
+        Start a new run (one script execution); returns its number.
+        """
+        self.run += 1
+        self.listeners = []
+        return self.run
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+        for listener in self.listeners:
+            listener(self)
+
+    # -----------------------------
+    # Views and export
+    # -----------------------------
+    def to_frame(self, run=None):
+        with self._lock:
+            records = list(self.records)
+        frame = pd.DataFrame(records)
+        if frame.empty:
+            return pd.DataFrame(columns=RECORD_FIELDS)
+        if run is not None:
+            frame = frame[frame["run"] == run]
+        return frame.reset_index(drop=True)
+
+    def summary(self, run=None):
+        """
+        Per stage: calls, total/mean/max seconds, rows, bytes, cache hits and misses, max peak.
+        """
+        return summarize(self.to_frame(run))
+
+    def to_jsonl(self, run=None):
+        frame = self.to_frame(run)
+        return "".join(json.dumps({k: v for k, v in r.items() if not _missing(v)}, default=str) + "\n"
+                       for r in frame.to_dict("records"))
+
+    def export(self, path, run=None):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_jsonl(run))
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def summarize(frame):
+    """
+    Per-stage summary of a frame of span records (from Tracer.to_frame or
+    read back from JSON-lines logs of many sessions).
+    """
+    if frame.empty:
+        return pd.DataFrame(columns=["stage", "calls", "total_s", "mean_s", "max_s", "rows", "bytes", "hits",
+                                     "misses", "peak_MB"])
+    frame = frame.copy()
+    for column in ["rows", "bytes", "peak_bytes"]:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce") if column in frame else float("nan")
+    cache = frame["cache"] if "cache" in frame else pd.Series(None, index=frame.index)
+    frame["hit"] = cache.eq("hit")
+    frame["miss"] = cache.eq("miss")
+
+    grouped = frame.groupby("stage", sort=False)
+    summary = pd.DataFrame({
+        "calls": grouped.size(),
+        "total_s": grouped["seconds"].sum(),
+        "mean_s": grouped["seconds"].mean(),
+        "max_s": grouped["seconds"].max(),
+        "rows": grouped["rows"].sum(min_count=1),
+        "bytes": grouped["bytes"].sum(min_count=1),
+        "hits": grouped["hit"].sum(),
+        "misses": grouped["miss"].sum(),
+        "peak_MB": grouped["peak_bytes"].max() / 2 ** 20,
+    })
+    return summary.sort_values("total_s", ascending=False).reset_index()
+
+
+def note_cache_miss():
+    """
+    Call from inside a cached function body: the body only runs on a miss,
+    so the innermost cached span open in this thread is marked as a miss.
+    """
+    for span in reversed(getattr(_local, "stack", ())):
+        if span.cached:
+            span.missed = True
+            return
+
+
+def read_logs(paths):
+    """
+    Span records from one or more JSON-lines logs, for cross-session summaries.
+    """
+    records = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+    return pd.DataFrame(records)
+
+
+NULL_TRACER = Tracer(enabled=False)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise span logs written by the viewer")
+    parser.add_argument("logs", nargs="+")
+    args = parser.parse_args()
+    print(summarize(read_logs(args.logs)).to_string(index=False))
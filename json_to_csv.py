@@ -1,22 +1,14 @@
 import json
 import pandas as pd
 
+from obs_normalize import flatten_observations
+
 with open("HistoricalObs.json", "r") as f:
     data = json.load(f)
 
-flat_data = []
-for entry in data:
-    row = {
-        "Site_Id": entry["Site_Id"],
-        "Parameter": entry["Parameter"]["ParameterCode"],
-        "Date": entry["Date"],
-        "Hour": entry["Hour"],
-        "Value": entry["Value"],
-        "Units": entry["Parameter"]["Units"]
-    }
-    flat_data.append(row)
-
-df = pd.DataFrame(flat_data)
+# Flatten all records at once; null values are kept
+df = flatten_observations(data).rename(columns={"ParameterCode": "Parameter"})
+df = df[["Site_Id", "Parameter", "Date", "Hour", "Value", "Units"]]
 df.to_csv("HistoricalObs.csv", index=False)
 print("Saved as HistoricalObs.csv")
 
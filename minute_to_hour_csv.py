@@ -1,5 +1,10 @@
+import argparse
+
 import pandas as pd
 
+from ghg_loader import STOCKTON_RENAME
+from out_of_core import DEFAULT_CHUNKSIZE, resample_mean
+
 def aggregate_minute_to_hourly(input_file, output_file):
     # Load CSV
     df = pd.read_csv(input_file)
@@ -29,7 +34,35 @@ def aggregate_minute_to_hourly(input_file, output_file):
     hourly_df.to_csv(output_file, index=False)
     print(f"Hourly aggregated data saved to: {output_file}")
 
+def aggregate_minute_to_hourly_chunked(input_files, output_file, chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    """
+    Same hourly means for archives too large to load at once: the files are
+    read in chunks, in parallel, and only per-hour sums and counts are kept.
+    Flag columns are dropped; column names are written as in the input.
+    """
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    hourly_df = resample_mean(input_files, freq="h", chunksize=chunksize, workers=workers)
+    hourly_df = hourly_df.rename(columns={v: k for k, v in STOCKTON_RENAME.items()})
+
+    hourly_df.index = hourly_df.index.strftime('%d-%m-%Y %H:%M')
+    hourly_df.index.name = "Date Time"
+    hourly_df.reset_index().to_csv(output_file, index=False)
+    print(f"Hourly aggregated data saved to: {output_file}")
+
+
 # Example usage
 if __name__ == "__main__":
-    aggregate_minute_to_hourly("Stockton_20241101.csv", "Stockton_20241101_hour.csv")
+    parser = argparse.ArgumentParser(description="Aggregate minute Picarro/station CSV files to hourly means")
+    parser.add_argument("inputs", nargs="*", default=["Stockton_20241101.csv"])
+    parser.add_argument("-o", "--output", default="Stockton_20241101_hour.csv")
+    parser.add_argument("--chunked", action="store_true", help="out-of-core mode for archives larger than memory")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.chunked or len(args.inputs) > 1:
+        aggregate_minute_to_hourly_chunked(args.inputs, args.output, args.chunksize, args.workers)
+    else:
+        aggregate_minute_to_hourly(args.inputs[0], args.output)
 
@@ -0,0 +1,314 @@
+"""
+Local stand-in for the NSW AQMS API (data.airquality.nsw.gov.au).
+
+Serves get_SiteDetails, get_ParameterDetails and get_Observations with
+synthetic records in the same schema as HistoricalObs.json, so the API path
+can be benchmarked and regression-tested offline.
+
+Usage:
+    python mock_aqms_server.py --port 8765 --latency 0.2 --error-rate 0.05
+    AQMS_API_URL=http://127.0.0.1:8765/ streamlit run app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+SITES_FILE = "sites.json"
+PARAMETERS_FILE = "parameters.json"
+
+# Rough typical hourly levels so synthetic series look plausible
+TYPICAL_LEVELS = {
+    "NO": 0.5,
+    "NO2": 1.0,
+    "OZONE": 2.5,
+    "SO2": 0.1,
+    "CO": 0.2,
+    "NH3": 0.5,
+    "PM10": 18.0,
+    "PM2.5": 7.0,
+    "HUMID": 65.0,
+    "TEMP": 18.0,
+    "WSP": 3.0,
+    "WDR": 180.0,
+    "SD1": 30.0,
+    "RAIN": 0.1,
+    "SOLAR": 250.0,
+    "NEPH": 0.2,
+}
+
+
+class MockConfig:
+    """
+    Knobs controlling how the mock server behaves.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, throughput=0, error_rate=0.0,
+                 error_status=500, null_rate=0.05, max_records=0, site_multiplier=1, seed=0):
+        self.latency = latency              # seconds added to every response
+        self.jitter = jitter                # +/- seconds of random extra latency
+        self.throughput = throughput        # bytes per second, 0 = unlimited
+        self.error_rate = error_rate        # fraction of requests that fail
+        self.error_status = error_status    # HTTP status used for injected failures
+        self.null_rate = null_rate          # fraction of observations with Value = null
+        self.max_records = max_records      # cap on get_Observations payload, 0 = no cap
+        self.site_multiplier = site_multiplier  # clone the site list N times for bigger payloads
+        self.seed = seed
+
+
+def load_templates():
+    """
+    Load sites and parameters from the JSON snapshots shipped with the repo.
+    """
+    with open(SITES_FILE, "r") as f:
+        sites = json.load(f)
+    with open(PARAMETERS_FILE, "r") as f:
+        parameters = json.load(f)
+    return sites, parameters
+
+
+def expand_sites(sites, multiplier):
+    """
+    Return the site list, cloned with new ids when multiplier > 1.
+    """
+    if multiplier <= 1:
+        return list(sites)
+
+    max_id = max(s["Site_Id"] for s in sites)
+    expanded = list(sites)
+    for n in range(1, multiplier):
+        for s in sites:
+            clone = dict(s)
+            clone["Site_Id"] = s["Site_Id"] + n * (max_id + 1)
+            clone["SiteName"] = f"{s['SiteName']} {n}"
+            expanded.append(clone)
+    return expanded
+
+
+def hour_description(hour):
+    """
+    Hour 1 covers 12 am - 1 am, Hour 24 covers 11 pm - 12 am.
+    """
+    def label(h):
+        h = h % 24
+        suffix = "am" if h < 12 else "pm"
+        return f"{h % 12 or 12} {suffix}"
+    return f"{label(hour - 1)} - {label(hour)}"
+
+
+def as_list(value):
+    # The app sometimes sends scalars instead of lists for Sites/Parameters
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def hourly_parameter(parameters, code):
+    """
+    Find the hourly-average parameter record for a parameter code.
+    """
+    for p in parameters:
+        if p["ParameterCode"] == code and p["Category"] == "Averages" and p["SubCategory"] == "Hourly":
+            return p
+    return None
+
+
+def synthetic_observations(obs_request, sites, parameters, config):
+    """
+    Build a get_Observations response for an observation request payload.
+    """
+    site_ids = {s["Site_Id"] for s in sites}
+    requested_sites = [int(s) for s in as_list(obs_request.get("Sites")) if int(s) in site_ids]
+    requested_params = [str(p).upper() for p in as_list(obs_request.get("Parameters"))]
+
+    start = datetime.strptime(obs_request.get("StartDate", date.today().isoformat()), "%Y-%m-%d").date()
+    end = datetime.strptime(obs_request.get("EndDate", start.isoformat()), "%Y-%m-%d").date()
+
+    records = []
+    for site_id in requested_sites:
+        for code in requested_params:
+            param = hourly_parameter(parameters, code)
+            if param is None:
+                continue
+            level = TYPICAL_LEVELS.get(code, 1.0)
+            day = start
+            while day <= end:
+                # Seed per (site, parameter, day) so repeated requests return identical data
+                rng = random.Random(f"{config.seed}-{site_id}-{code}-{day.isoformat()}")
+                for hour in range(1, 25):
+                    if rng.random() < config.null_rate:
+                        value = None
+                    else:
+                        diurnal = 1.0 + 0.4 * rng.uniform(-1, 1) + 0.3 * ((hour - 12) / 12.0) ** 2
+                        value = round(max(level * diurnal, 0.0), 6)
+                    records.append({
+                        "Site_Id": site_id,
+                        "Parameter": dict(param),
+                        "Date": day.isoformat(),
+                        "Hour": hour,
+                        "HourDescription": hour_description(hour),
+                        "Value": value,
+                        "AirQualityCategory": "GOOD" if value is not None else None,
+                        "DeterminingPollutant": None,
+                    })
+                    if config.max_records and len(records) >= config.max_records:
+                        return records
+                day += timedelta(days=1)
+    return records
+
+
+class MockAQMSHandler(BaseHTTPRequestHandler):
+    """
+    Routes the three AQMS endpoints, applying latency, throughput and failure injection.
+    """
+
+    server_version = "MockAQMS/1.0"
+    # Filled in by make_server
+    config = None
+    sites = None
+    parameters = None
+    rng = None
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _endpoint(self):
+        return urlparse(self.path).path.rstrip("/").split("/")[-1].lower()
+
+    def _inject_delay_and_failure(self):
+        with self.rng_lock:
+            jitter = self.rng.uniform(-self.config.jitter, self.config.jitter) if self.config.jitter else 0.0
+            fail = self.rng.random() < self.config.error_rate
+        delay = max(self.config.latency + jitter, 0.0)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._send_json({"Message": "Injected failure from mock server"}, status=self.config.error_status)
+            return True
+        return False
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if not self.config.throughput:
+            self.wfile.write(body)
+            return
+
+        # Throttle by writing fixed-size chunks and sleeping in between
+        chunk_size = 16 * 1024
+        for i in range(0, len(body), chunk_size):
+            chunk = body[i:i + chunk_size]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / self.config.throughput)
+
+    def do_GET(self):
+        endpoint = self._endpoint()
+        if endpoint not in ("get_sitedetails", "get_parameterdetails"):
+            self._send_json({"Message": f"No endpoint {self.path}"}, status=404)
+            return
+        if self._inject_delay_and_failure():
+            return
+        if endpoint == "get_sitedetails":
+            self._send_json(self.sites)
+        else:
+            self._send_json(self.parameters)
+
+    def do_POST(self):
+        if self._endpoint() != "get_observations":
+            self._send_json({"Message": f"No endpoint {self.path}"}, status=404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            obs_request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json({"Message": "Invalid JSON body"}, status=400)
+            return
+
+        if self._inject_delay_and_failure():
+            return
+        try:
+            records = synthetic_observations(obs_request, self.sites, self.parameters, self.config)
+        except (TypeError, ValueError) as e:
+            self._send_json({"Message": f"Bad request: {e}"}, status=400)
+            return
+        self._send_json(records)
+
+
+def make_server(host="127.0.0.1", port=8765, config=None, quiet=False):
+    """
+    Create (but do not start) a mock AQMS server. Port 0 picks a free port.
+    """
+    config = config or MockConfig()
+    sites, parameters = load_templates()
+
+    handler = type("ConfiguredMockAQMSHandler", (MockAQMSHandler,), {
+        "config": config,
+        "sites": expand_sites(sites, config.site_multiplier),
+        "parameters": parameters,
+        "rng": random.Random(config.seed),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.quiet = quiet
+    return server
+
+
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    """
+    Start a mock server on a background thread and return (server, base_url).
+    Call server.shutdown() when done.
+    """
+    server = make_server(host, port, config, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}/"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the NSW AQMS API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--throughput", type=int, default=0, help="bytes per second, 0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--null-rate", type=float, default=0.05, help="fraction of null observation values")
+    parser.add_argument("--max-records", type=int, default=0, help="cap on records per get_Observations")
+    parser.add_argument("--site-multiplier", type=int, default=1, help="clone sites N times")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        throughput=args.throughput,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        null_rate=args.null_rate,
+        max_records=args.max_records,
+        site_multiplier=args.site_multiplier,
+        seed=args.seed,
+    )
+    server = make_server(args.host, args.port, config, quiet=args.quiet)
+    print(f"Mock AQMS API listening on http://{args.host}:{args.port}/")
+    print(f"Point the app at it with AQMS_API_URL=http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped")
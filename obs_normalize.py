@@ -0,0 +1,95 @@
+"""
+Shared normalization of AQMS get_Observations records.
+
+The API returns one JSON record per (site, parameter, date, hour). Instead of
+looping over records in Python, the records are loaded into a DataFrame once
+and every field is converted with column (array) operations.
+
+AQMS hours run 1-24 and label the END of the averaging period: Hour 1 is
+12 am - 1 am, Hour 24 is 11 pm - 12 am. The timestamp is therefore
+Date + Hour hours, so Hour 24 lands on 00:00 of the following day.
+"""
+
+import numpy as np
+import pandas as pd
+
+FLAT_COLUMNS = ["Site_Id", "ParameterCode", "Date", "Hour", "Value", "Units"]
+OBS_COLUMNS = ["site", "parameter", "timestamp", "value", "units"]
+
+
+def flatten_observations(records):
+    """
+    Flatten raw API records into one row per record with the nested
+    Parameter fields pulled up. Column names follow the API.
+    """
+    if not records:
+        return pd.DataFrame(columns=FLAT_COLUMNS)
+
+    raw = pd.DataFrame.from_records(records, columns=["Site_Id", "Parameter", "Date", "Hour", "Value"])
+
+    # Parameter is a nested dict; expand it as a block rather than per record
+    params = pd.DataFrame(raw["Parameter"].map(lambda p: p if isinstance(p, dict) else {}).tolist(),
+                          index=raw.index)
+    for col in ["ParameterCode", "Units"]:
+        if col not in params.columns:
+            params[col] = None
+
+    flat = raw.drop(columns="Parameter")
+    flat["ParameterCode"] = params["ParameterCode"]
+    flat["Units"] = params["Units"]
+    return flat[FLAT_COLUMNS]
+
+
+def hour_ending_timestamps(dates, hours):
+    """
+    Build timestamps from AQMS Date strings and 1-24 hour-ending values.
+    """
+    days = pd.to_datetime(pd.Series(dates), format="%Y-%m-%d", errors="coerce")
+    offsets = pd.to_timedelta(pd.to_numeric(pd.Series(hours), errors="coerce"), unit="h")
+    return days.values + offsets.values
+
+
+def normalize_observations(records, sites=None, parameters=None, dropna=True):
+    """
+    Turn a batch of get_Observations records into a typed frame with
+    columns site (int), parameter (upper-case categorical), timestamp, value
+    (float) and units (categorical).
+
+    sites / parameters optionally restrict the result to the given site ids
+    and parameter codes. Rows with missing values or timestamps are dropped
+    unless dropna is False. The result is sorted by (site, parameter, timestamp).
+    """
+    flat = records if isinstance(records, pd.DataFrame) else flatten_observations(records)
+    if flat.empty:
+        return pd.DataFrame({
+            "site": pd.Series(dtype="int64"),
+            "parameter": pd.Series(dtype="category"),
+            "timestamp": pd.Series(dtype="datetime64[ns]"),
+            "value": pd.Series(dtype="float64"),
+            "units": pd.Series(dtype="category"),
+        })
+
+    site = pd.to_numeric(flat["Site_Id"], errors="coerce")
+    parameter = flat["ParameterCode"].astype(str).str.upper()
+
+    # Filter with boolean masks before doing any date arithmetic
+    mask = site.notna().to_numpy()
+    if sites is not None:
+        mask = mask & site.isin([int(s) for s in np.atleast_1d(sites)]).to_numpy()
+    if parameters is not None:
+        mask = mask & parameter.isin([str(p).upper() for p in np.atleast_1d(parameters)]).to_numpy()
+
+    flat = flat[mask]
+    df = pd.DataFrame({
+        "site": site[mask].astype("int64").to_numpy(),
+        # A handful of distinct codes and units repeated on every row
+        "parameter": pd.Categorical(parameter[mask].to_numpy()),
+        "timestamp": hour_ending_timestamps(flat["Date"].to_numpy(), flat["Hour"].to_numpy()),
+        "value": pd.to_numeric(flat["Value"], errors="coerce").astype("float64").to_numpy(),
+        "units": pd.Categorical(flat["Units"].to_numpy()),
+    })
+
+    if dropna:
+        df = df.dropna(subset=["timestamp", "value"])
+
+    return df.sort_values(["site", "parameter", "timestamp"], kind="stable").reset_index(drop=True)
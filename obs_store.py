@@ -0,0 +1,417 @@
+"""
+Single local observation store for Picarro CSV data and AQMS API data.
+
+Every observation is one row with the schema
+    source, site, variable, timestamp, value, unit, flag
+and the table is kept sorted on a (site, variable, timestamp) MultiIndex, so
+any series (or several series from different sources) is a binary-search
+slice instead of a separate load pipeline.
+"""
+
+import glob
+import hashlib
+import json
+import math
+import os
+import threading
+
+import pandas as pd
+
+from ghg_loader import CACHE_DIR, DATA_DIR, FLAG_SUFFIX, PICARRO_SITES, measurement_columns, \
+    read_picarro_csv, site_files, site_from_path
+from obs_normalize import normalize_observations
+from units import RELATIVE_HUMIDITY_PARAMETERS, canonical_unit, convert_mixed, dimension, picarro_unit
+
+STORE_COLUMNS = ["source", "site", "variable", "timestamp", "value", "unit", "flag"]
+INDEX_COLUMNS = ["site", "variable", "timestamp"]
+CATEGORY_COLUMNS = ["source", "unit", "flag"]
+
+STORE_FILE = os.path.join(CACHE_DIR, "store.parquet")
+STORE_META_FILE = os.path.join(CACHE_DIR, "store.json")
+# AQMS pulls kept across restarts, one Parquet file of store rows per pull
+API_DIR = os.path.join(CACHE_DIR, "api")
+
+
+def empty_store_frame():
+    return pd.DataFrame({
+        "source": pd.Series(dtype="object"),
+        "site": pd.Series(dtype="object"),
+        "variable": pd.Series(dtype="object"),
+        "timestamp": pd.Series(dtype="datetime64[ns]"),
+        "value": pd.Series(dtype="float64"),
+        "unit": pd.Series(dtype="object"),
+        "flag": pd.Series(dtype="object"),
+    })
+
+
+def read_sites_json(path="sites.json"):
+    """
+    AQMS site table saved by get_sites.py.
+    """
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def read_parameters_json(path="parameters.json"):
+    """
+    AQMS parameter table saved by get_parameters.py.
+    """
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_api_rows(rows, directory=API_DIR, name=None):
+    """
+    Write store rows from an AQMS pull to directory as one Parquet file,
+    named after the content unless name is given, so saving the same pull
+    again rewrites the same file. Returns the path.
+    """
+    rows = rows[STORE_COLUMNS]
+    if name is None:
+        name = hashlib.sha1(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.parquet")
+    tmp = path + ".tmp"
+    rows.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def picarro_to_long(df, site):
+    """
+    Melt a loaded Picarro file (see ghg_loader.read_picarro_csv) into store rows.
+    """
+    cols = measurement_columns(df)
+    values = df.melt(id_vars="datetime", value_vars=cols, var_name="variable", value_name="value")
+
+    # Flags sit in "<column>-Flag" columns in the minute files; melt them in the same order
+    flags = pd.DataFrame(index=df.index)
+    for col in cols:
+        flag_col = f"{col}{FLAG_SUFFIX}"
+        flags[col] = df[flag_col].astype("object") if flag_col in df.columns else None
+    flag_values = flags.melt(value_vars=cols, value_name="flag")["flag"].to_numpy()
+
+    long_df = pd.DataFrame({
+        "source": "picarro",
+        "site": site,
+        "variable": values["variable"].to_numpy(),
+        "timestamp": values["datetime"].to_numpy(),
+        "value": pd.to_numeric(values["value"], errors="coerce").to_numpy(),
+        "unit": values["variable"].map(picarro_unit).to_numpy(),
+        "flag": flag_values,
+    })
+    return long_df.dropna(subset=["value"])
+
+
+def api_to_long(obs, site_names=None, units=None):
+    """
+    Convert a normalized observation frame (see obs_normalize) into store rows.
+    site_names maps AQMS Site_Id -> SiteName; unknown ids keep their number.
+    units maps ParameterCode -> unit (see units.parameter_units): records
+    without a unit get the parameter's, and a unit of a different dimension
+    (e.g. µg/m³ for a gas listed in pphm) raises ValueError.
+    """
+    site_names = site_names or {}
+    site = obs["site"].map(lambda s: site_names.get(int(s), str(s)))
+    # Canonical spelling per distinct unit, then "%" humidity as "%RH" (see units.parameter_unit)
+    unit = obs["units"].astype("object").map(canonical_unit)
+    humidity = obs["parameter"].astype("object").str.upper().isin(RELATIVE_HUMIDITY_PARAMETERS)
+    unit = unit.mask(unit.eq("%") & humidity, "%RH")
+    if units:
+        expected = obs["parameter"].astype("object").map({code.upper(): u for code, u in units.items()})
+        unit = unit.mask(unit.eq("") & expected.notna(), expected)
+        dims, expected_dims = unit.map(dimension), expected.map(dimension, na_action="ignore")
+        clash = dims.notna() & expected_dims.notna() & dims.ne(expected_dims)
+        if clash.any():
+            row = clash.idxmax()
+            raise ValueError(f"{obs['parameter'][row]} reported in {unit[row]}, "
+                             f"but the parameter list gives {expected[row]}")
+    return pd.DataFrame({
+        "source": "aqms",
+        "site": site.to_numpy(),
+        "variable": obs["parameter"].to_numpy(),
+        "timestamp": obs["timestamp"].to_numpy(),
+        "value": obs["value"].to_numpy(),
+        "unit": unit.to_numpy(),
+        "flag": None,
+    })
+
+
+class ObservationStore:
+    """
+    In-memory observation table indexed by (site, variable, timestamp).
+
+    New rows are buffered and merged into the sorted table on the next read.
+    A row with the same (site, variable, timestamp) as an existing one
+    replaces it. `version` increases on every change and can be used as a
+    cache key by anything derived from the store.
+    """
+
+    def __init__(self):
+        self._table = empty_store_frame().set_index(INDEX_COLUMNS)
+        self._pending = []
+        self.site_coords = {name: tuple(coords) for name, coords in PICARRO_SITES.items()}
+        self.site_sources = {name: "picarro" for name in PICARRO_SITES}
+        self.version = 0
+        # Content hashes of the batches added so far, so a repeated pull is not merged again
+        self._digests = set()
+        # Called with each batch that add_rows accepts, e.g. to keep an index current
+        self.listeners = []
+        # The app shares one store between sessions
+        self._lock = threading.RLock()
+
+    # -----------------------------
+    # Ingest
+    # -----------------------------
+    def add_rows(self, rows):
+        """
+        Add rows that already follow STORE_COLUMNS. A batch identical to one
+        added before, or whose values are all in the store already (the same
+        API pull on a rerun), is ignored, so `version` only moves when the
+        data changes. Returns True when rows were added.
+        """
+        if rows is None or rows.empty:
+            return False
+        rows = rows[STORE_COLUMNS]
+        digest = hashlib.sha1(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+        with self._lock:
+            if digest in self._digests or self._already_stored(rows):
+                self._digests.add(digest)
+                return False
+            self._digests.add(digest)
+            self._pending.append(rows)
+            for site, source in rows.groupby("site", sort=False)["source"].first().items():
+                self.site_sources.setdefault(site, source)
+            self.version += 1
+        for listener in self.listeners:
+            listener(rows)
+        return True
+
+    def _already_stored(self, rows):
+        """
+        True when every row's (site, variable, timestamp) is in the table with the same value and unit.
+        Only checked against an already merged table, so bulk ingest is not merged batch by batch.
+        """
+        if self._pending or self._table.empty:
+            return False
+        table = self._table
+        keys = pd.MultiIndex.from_arrays([rows["site"], rows["variable"], pd.to_datetime(rows["timestamp"])],
+                                         names=INDEX_COLUMNS)
+        if keys.has_duplicates or not keys.isin(table.index).all():
+            return False
+        stored = table.loc[keys]
+        return bool((stored["value"].to_numpy() == rows["value"].to_numpy()).all()
+                    and (stored["unit"].astype("object").to_numpy() == rows["unit"].to_numpy()).all())
+
+    def drop(self, site, variable):
+        """
+        Remove every row for one (site, variable).
+        """
+        with self._lock:
+            table = self.table
+            if (site, variable) in table.index.droplevel("timestamp"):
+                self._table = table.drop(index=(site, variable))
+                self._digests.clear()
+                self.version += 1
+
+    def add_picarro_file(self, path, site=None):
+        """
+        Ingest one local Picarro CSV. The site defaults to the file name prefix.
+        """
+        self.add_rows(picarro_to_long(read_picarro_csv(path), site or site_from_path(path)))
+
+    def add_picarro_dir(self, data_dir=DATA_DIR, sites=None):
+        """
+        Ingest every monthly file in data_dir for the given (default: all known) Picarro sites.
+        """
+        for site in sites or PICARRO_SITES:
+            for path in site_files(site, data_dir):
+                self.add_picarro_file(path, site)
+
+    def add_api_observations(self, data, site_names=None, persist_dir=None, units=None):
+        """
+        Ingest get_Observations records, or a frame from normalize_observations.
+        persist_dir: also save the rows there (see add_api_dir) when they are new.
+        units: ParameterCode -> unit to fill and check record units (see api_to_long).
+        """
+        obs = data if isinstance(data, pd.DataFrame) else normalize_observations(data)
+        rows = api_to_long(obs, site_names, units)
+        added = self.add_rows(rows)
+        if added and persist_dir:
+            save_api_rows(rows, persist_dir)
+        return added
+
+    def add_api_dir(self, directory=API_DIR):
+        """
+        Ingest the AQMS pulls saved with save_api_rows.
+        """
+        for path in sorted(glob.glob(os.path.join(directory, "*.parquet"))):
+            self.add_rows(pd.read_parquet(path))
+
+    def add_cube(self, archive, sites=None, variables=None, start=None, end=None):
+        """
+        Ingest a slice of a cube_archive.CubeArchive (hourly grid values, no flags).
+        """
+        self.add_rows(archive.to_long(sites, variables, start, end))
+
+    def add_aqms_sites(self, sites):
+        """
+        Register AQMS site coordinates (records as in sites.json) for nearest-site lookups.
+        """
+        for s in sites:
+            self.site_coords[s["SiteName"]] = (s["Latitude"], s["Longitude"])
+            self.site_sources.setdefault(s["SiteName"], "aqms")
+
+    # -----------------------------
+    # Read
+    # -----------------------------
+    @property
+    def table(self):
+        """
+        The full store, sorted on (site, variable, timestamp).
+        """
+        with self._lock:
+            if self._pending:
+                merged = pd.concat([self._table.reset_index()] + self._pending, ignore_index=True)
+                merged["timestamp"] = pd.to_datetime(merged["timestamp"])
+                merged = merged.drop_duplicates(subset=INDEX_COLUMNS, keep="last")
+                # Few distinct sources, units and flags over millions of rows
+                for col in CATEGORY_COLUMNS:
+                    merged[col] = merged[col].astype("object").astype("category")
+                self._table = merged.set_index(INDEX_COLUMNS).sort_index()
+                self._pending = []
+            return self._table
+
+    def __len__(self):
+        return len(self.table)
+
+    def sites(self, source=None):
+        sites = self.table.index.get_level_values("site").unique()
+        if source is not None:
+            sites = [s for s in sites if self.site_sources.get(s) == source]
+        return sorted(sites)
+
+    def variables(self, site=None):
+        table = self.table
+        if site is not None:
+            if site not in table.index.get_level_values("site"):
+                return []
+            table = table.loc[site]
+        return sorted(table.index.get_level_values("variable").unique())
+
+    def query(self, site, variable, start=None, end=None, unit=None):
+        """
+        Rows for one (site, variable), optionally limited to [start, end],
+        indexed by timestamp. If unit is given the values are converted to it.
+        """
+        table = self.table
+        try:
+            rows = table.loc[(site, variable, slice(start, end)), :]
+        except KeyError:
+            return empty_store_frame().set_index("timestamp").drop(columns=["site", "variable"])
+        rows = rows.droplevel(["site", "variable"])
+        if unit is not None and not rows.empty:
+            rows = rows.assign(value=convert_mixed(rows["value"], rows["unit"], unit), unit=unit)
+        return rows
+
+    def series(self, site, variable, start=None, end=None, unit=None):
+        """
+        Values for one (site, variable) as a Series indexed by timestamp.
+        """
+        return self.query(site, variable, start, end, unit)["value"].rename(f"{site} {variable}")
+
+    def query_many(self, pairs, start=None, end=None, unit=None):
+        """
+        Several (site, variable) series, e.g. from different sources, as one
+        wide frame on the union of their timestamps, optionally all in one unit.
+        """
+        columns = [self.series(site, variable, start, end, unit) for site, variable in pairs]
+        if not columns:
+            return pd.DataFrame()
+        return pd.concat(columns, axis=1).sort_index()
+
+    def nearest_site(self, site, variable, source=None):
+        """
+        The closest other site that has data for variable, or None.
+        """
+        if site not in self.site_coords:
+            return None
+        lat, lon = self.site_coords[site]
+
+        # Sites with the variable, from one pass over the index
+        index = self.table.index
+        with_variable = set(index.get_level_values("site")[index.get_level_values("variable") == variable])
+
+        best, best_dist = None, float("inf")
+        for other in self.sites(source):
+            if other == site or other not in self.site_coords or other not in with_variable:
+                continue
+            dist = haversine_km(lat, lon, *self.site_coords[other])
+            if dist < best_dist:
+                best, best_dist = other, dist
+        return best
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self, path):
+        self.table.reset_index().to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        store.add_rows(pd.read_parquet(path))
+        return store
+
+
+def data_fingerprint(data_dir=DATA_DIR):
+    """
+    Hash of the Picarro file names, sizes and modification times.
+    """
+    h = hashlib.sha1()
+    for site in PICARRO_SITES:
+        for path in site_files(site, data_dir):
+            st = os.stat(path)
+            h.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+def api_fingerprint(directory=API_DIR):
+    """
+    Hash of the saved AQMS pull file names, sizes and modification times.
+    """
+    h = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(directory, "*.parquet"))):
+        st = os.stat(path)
+        h.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+def load_or_build_store(data_dir=DATA_DIR, store_path=STORE_FILE, meta_path=STORE_META_FILE):
+    """
+    Observation store from the parquet snapshot when it matches the files,
+    otherwise built from the CSVs and saved for next time.
+    Returns (store, fingerprint).
+    """
+    fingerprint = data_fingerprint(data_dir)
+    if os.path.exists(store_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                store = ObservationStore.load(store_path)
+                store.add_aqms_sites(read_sites_json())
+                return store, fingerprint
+
+    store = ObservationStore()
+    store.add_picarro_dir(data_dir)
+    store.add_aqms_sites(read_sites_json())
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    store.save(store_path)
+    with open(meta_path, "w") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+    return store, fingerprint
@@ -0,0 +1,288 @@
+"""
+Out-of-core analysis over Picarro archives that do not fit in memory.
+
+Every file is a partition and is read in fixed-size row chunks, so at most
+one chunk per worker is held in memory. Each chunk is reduced to a small
+mergeable partial result:
+
+  filter     matching rows, appended to an output CSV
+  resample   per-bin sums and counts of every column
+  aggregate  per-group count, sum, sum of squares, min and max
+  rose       direction x speed (or x concentration) bin counts
+
+Partitions run in parallel across cores and their partials are added up
+in the parent. Means and standard deviations come from the merged sums,
+so a bin split across chunks or files gives the same value as the
+whole-frame pandas computation (up to floating point summation order).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ghg_loader import FLAG_SUFFIX, harmonize
+
+DEFAULT_CHUNKSIZE = 100_000
+
+# Group keys for aggregate(): name -> function of a DatetimeIndex
+GROUP_KEYS = {
+    "hour": lambda ts: ts.hour,
+    "weekday": lambda ts: ts.dayofweek,
+    "day": lambda ts: ts.normalize(),
+    "month": lambda ts: ts.to_period("M").to_timestamp(),
+    "year": lambda ts: ts.year,
+}
+
+
+def iter_chunks(path, columns=None, chunksize=DEFAULT_CHUNKSIZE, start=None, end=None):
+    """
+    Harmonized chunks of one file (see ghg_loader.harmonize), indexed by
+    datetime. Measurement columns are coerced to numbers; when columns is
+    given only those are kept. Rows outside [start, end) are dropped.
+    """
+    for raw in pd.read_csv(path, chunksize=chunksize):
+        chunk = harmonize(raw).set_index("datetime")
+        if start is not None:
+            chunk = chunk[chunk.index >= pd.Timestamp(start)]
+        if end is not None:
+            chunk = chunk[chunk.index < pd.Timestamp(end)]
+        if columns is not None:
+            chunk = chunk.reindex(columns=columns)
+        else:
+            chunk = chunk[[c for c in chunk.columns if not c.endswith(FLAG_SUFFIX)
+                           and c not in ("Date Time", "DATE", "TIME", "EPOCH_TIME")]]
+        yield chunk.apply(pd.to_numeric, errors="coerce")
+
+
+def run_partitions(func, paths, workers=None, **kwargs):
+    """
+    Apply func(path, **kwargs) to every file, in parallel when workers > 1.
+    """
+    paths = list(paths)
+    workers = min(workers or os.cpu_count() or 1, len(paths)) if paths else 1
+    if workers <= 1:
+        return [func(path, **kwargs) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, path, **kwargs) for path in paths]
+        return [f.result() for f in futures]
+
+
+# -----------------------------
+# Filter
+# -----------------------------
+def part_path(output, path):
+    return f"{output}.{os.path.basename(path)}.part"
+
+
+def _filter_partition(path, output, columns, conditions, chunksize, start, end):
+    """
+    Write the rows of one file that meet every (column, low, high) condition
+    to its part file; returns the number of rows written.
+    """
+    written = 0
+    for chunk in iter_chunks(path, columns, chunksize, start, end):
+        keep = np.ones(len(chunk), dtype=bool)
+        for column, low, high in conditions:
+            values = chunk[column].to_numpy(dtype=float)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+        chunk = chunk[keep]
+        chunk.to_csv(part_path(output, path), mode="a" if written else "w", header=written == 0)
+        written += len(chunk)
+    return written
+
+
+def filter_rows(paths, output, columns=None, conditions=(), start=None, end=None,
+                chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    """
+    Stream the rows matching every (column, low, high) condition into a
+    single CSV, in file order. Each partition writes its own part file and
+    the parts are concatenated at the end. Returns the number of rows written.
+    """
+    paths = list(paths)
+    try:
+        counts = run_partitions(_filter_partition, paths, workers, output=output, columns=columns,
+                                conditions=list(conditions), chunksize=chunksize, start=start, end=end)
+
+        header_written = False
+        with open(output, "w", newline="") as out:
+            for path, count in zip(paths, counts):
+                if not count:
+                    continue
+                with open(part_path(output, path)) as f:
+                    header = f.readline()
+                    if not header_written:
+                        out.write(header)
+                        header_written = True
+                    for line in f:
+                        out.write(line)
+    finally:
+        for path in paths:
+            if os.path.exists(part_path(output, path)):
+                os.remove(part_path(output, path))
+    return sum(counts)
+
+
+# -----------------------------
+# Resample
+# -----------------------------
+def _resample_partition(path, columns, freq, chunksize, start, end):
+    sums, counts = [], []
+    for chunk in iter_chunks(path, columns, chunksize, start, end):
+        if chunk.empty:
+            continue
+        binned = chunk.resample(freq)
+        sums.append(binned.sum(min_count=1))
+        counts.append(binned.count())
+    if not sums:
+        return None
+    return pd.concat(sums), pd.concat(counts)
+
+
+def resample_mean(paths, columns=None, freq="h", start=None, end=None, chunksize=DEFAULT_CHUNKSIZE,
+                  workers=None):
+    """
+    Out-of-core equivalent of frame.resample(freq).mean() over the
+    concatenation of the files. Returns a frame indexed by bin start,
+    including empty bins between the first and last as NaN rows.
+    """
+    partials = [p for p in run_partitions(_resample_partition, paths, workers, columns=columns, freq=freq,
+                                          chunksize=chunksize, start=start, end=end) if p is not None]
+    if not partials:
+        return pd.DataFrame(columns=columns or [])
+
+    sums = pd.concat([s for s, _ in partials]).groupby(level=0).sum(min_count=1)
+    counts = pd.concat([c for _, c in partials]).groupby(level=0).sum()
+    sums, counts = sums.align(counts, join="outer")
+    mean = sums / counts.where(counts > 0)
+
+    full = pd.date_range(mean.index.min(), mean.index.max(), freq=freq)
+    mean = mean.reindex(full)
+    mean.index.name = "datetime"
+    return mean
+
+
+# -----------------------------
+# Aggregate
+# -----------------------------
+def _aggregate_partition(path, columns, by, chunksize, start, end):
+    parts = []
+    for chunk in iter_chunks(path, columns, chunksize, start, end):
+        if chunk.empty:
+            continue
+        grouped = chunk.groupby(GROUP_KEYS[by](chunk.index))
+        parts.append(pd.concat({
+            "count": grouped.count(),
+            "sum": grouped.sum(min_count=1),
+            "sumsq": (chunk ** 2).groupby(GROUP_KEYS[by](chunk.index)).sum(min_count=1),
+            "min": grouped.min(),
+            "max": grouped.max(),
+        }, axis=1))
+    return pd.concat(parts) if parts else None
+
+
+def aggregate(paths, columns=None, by="day", start=None, end=None, chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    """
+    count, mean, std (ddof=1), min and max of every column grouped by
+    "hour", "weekday", "day", "month" or "year". Returns a frame with
+    (statistic, column) columns indexed by group.
+    """
+    if by not in GROUP_KEYS:
+        raise ValueError(f"Unknown grouping {by!r}, expected one of {list(GROUP_KEYS)}")
+    partials = [p for p in run_partitions(_aggregate_partition, paths, workers, columns=columns, by=by,
+                                          chunksize=chunksize, start=start, end=end) if p is not None]
+    if not partials:
+        return pd.DataFrame()
+
+    merged = pd.concat(partials)
+    n = merged["count"].groupby(level=0).sum()
+    total = merged["sum"].groupby(level=0).sum(min_count=1)
+    total_sq = merged["sumsq"].groupby(level=0).sum(min_count=1)
+
+    valid = n.where(n > 0)
+    mean = total / valid
+    with np.errstate(invalid="ignore"):
+        var = (total_sq - total * mean) / (valid - 1)
+    std = np.sqrt(var.clip(lower=0)).where(n > 1)
+
+    result = pd.concat({
+        "count": n,
+        "mean": mean,
+        "std": std,
+        "min": merged["min"].groupby(level=0).min(),
+        "max": merged["max"].groupby(level=0).max(),
+    }, axis=1)
+    result.index.name = by
+    return result
+
+
+# -----------------------------
+# Wind / pollution rose
+# -----------------------------
+def _rose_partition(path, direction_col, value_col, dir_bin, edges, chunksize, start, end):
+    n_dir = int(round(360 / dir_bin))
+    counts = np.zeros((n_dir, len(edges) - 1), dtype=np.int64)
+    for chunk in iter_chunks(path, [direction_col, value_col], chunksize, start, end):
+        counts += rose_counts(chunk[direction_col], chunk[value_col], dir_bin, edges)
+    return counts
+
+
+def rose_counts(direction, values, dir_bin, edges):
+    """
+    (direction bins x value bins) counts. Direction bins start at 0°;
+    values outside [edges[0], edges[-1]] are left out, the last bin includes
+    its upper edge (like pd.cut with include_lowest=True).
+    """
+    direction = np.asarray(direction, dtype=float)
+    values = np.asarray(values, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    n_dir = int(round(360 / dir_bin))
+
+    ok = ~(np.isnan(direction) | np.isnan(values)) & (values >= edges[0]) & (values <= edges[-1])
+    d_idx = np.minimum(((direction[ok] % 360) // dir_bin).astype(int), n_dir - 1)
+    v_idx = np.clip(np.searchsorted(edges, values[ok], side="left") - 1, 0, len(edges) - 2)
+    cell = d_idx * (len(edges) - 1) + v_idx
+    return np.bincount(cell, minlength=n_dir * (len(edges) - 1)).reshape(n_dir, len(edges) - 1)
+
+
+def value_range(paths, column, start=None, end=None, chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    """
+    (min, max) of one column over all files.
+    """
+    stats = aggregate(paths, [column], "year", start, end, chunksize, workers)
+    if stats.empty:
+        return np.nan, np.nan
+    return stats[("min", column)].min(), stats[("max", column)].max()
+
+
+def rose(paths, value_col, direction_col="Wind_Direction", dir_bin=30, edges=None, n_bins=5, start=None,
+         end=None, chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    """
+    Wind rose (value_col = "Wind_Speed") or pollution rose counts over all
+    files. Without edges, n_bins equal-width bins between the archive-wide
+    min and max are used, which takes an extra pass over the data.
+    Returns a long frame of direction bin start, value bin label and Count.
+    """
+    paths = list(paths)
+    if edges is None:
+        low, high = value_range(paths, value_col, start, end, chunksize, workers)
+        if np.isnan(low):
+            return pd.DataFrame(columns=["direction", "bin", "Count"])
+        edges = [low - 0.1, low + 0.1] if low == high else np.linspace(low, high, n_bins + 1)
+    edges = np.asarray(edges, dtype=float)
+
+    counts = sum(run_partitions(_rose_partition, paths, workers, direction_col=direction_col, value_col=value_col,
+                                dir_bin=dir_bin, edges=edges, chunksize=chunksize, start=start, end=end))
+    labels = [f"{round(edges[i], 1)}–{round(edges[i + 1], 1)}" for i in range(len(edges) - 1)]
+    directions = np.arange(counts.shape[0]) * dir_bin
+    frame = pd.DataFrame({
+        "direction": np.repeat(directions, len(labels)),
+        "bin": np.tile(labels, len(directions)),
+        "Count": counts.ravel(),
+    })
+    return frame[frame["Count"] > 0].reset_index(drop=True)
+
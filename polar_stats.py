@@ -0,0 +1,130 @@
+"""
+Polar statistics by wind direction and wind speed for source attribution.
+
+For one gas and period the hourly values are binned on a (direction,
+speed) grid with a single bincount per statistic, giving per cell the
+number of hours, the mean concentration and the conditional probability
+function (CPF): the fraction of hours in the cell with concentration above
+a chosen percentile of the whole period. Optional smoothing convolves the
+cell sums and counts with a small Gaussian kernel, wrapping around in
+direction, before they are divided.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DIRECTION_COL = "Wind_Direction"
+SPEED_COL = "Wind_Speed"
+
+
+def polar_grid(direction, speed, values, dir_bin=10, speed_bin=1.0, max_speed=None, percentile=75,
+               smooth=0.0):
+    """
+    Direction/speed grid statistics for paired arrays of wind direction
+    (degrees), wind speed and concentration.
+
+    Returns a dict with the bin edges and 2-D arrays (direction x speed) of
+    count, mean and cpf, plus the concentration threshold used for the CPF.
+    smooth is the Gaussian kernel width in cells (0 disables smoothing).
+    """
+    direction = np.asarray(direction, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    values = np.asarray(values, dtype=float)
+    ok = ~(np.isnan(direction) | np.isnan(speed) | np.isnan(values))
+    direction, speed, values = direction[ok] % 360, speed[ok], values[ok]
+
+    n_dir = int(round(360 / dir_bin))
+    if max_speed is None:
+        max_speed = np.ceil(np.nanmax(speed) / speed_bin) * speed_bin if len(speed) else speed_bin
+    n_speed = max(int(np.ceil(max_speed / speed_bin)), 1)
+
+    threshold = np.percentile(values, percentile) if len(values) else np.nan
+
+    d_idx = np.minimum((direction // dir_bin).astype(int), n_dir - 1)
+    s_idx = np.minimum((speed // speed_bin).astype(int), n_speed - 1)
+    cell = d_idx * n_speed + s_idx
+    size = n_dir * n_speed
+
+    count = np.bincount(cell, minlength=size).reshape(n_dir, n_speed).astype(float)
+    total = np.bincount(cell, weights=values, minlength=size).reshape(n_dir, n_speed)
+    above = np.bincount(cell, weights=(values > threshold).astype(float), minlength=size).reshape(n_dir, n_speed)
+
+    if smooth > 0:
+        count, total, above = (smooth_grid(a, smooth) for a in (count, total, above))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+        cpf = np.where(count > 0, above / count, np.nan)
+
+    return {
+        "direction_edges": np.arange(n_dir + 1) * dir_bin,
+        "speed_edges": np.arange(n_speed + 1) * speed_bin,
+        "count": count,
+        "mean": mean,
+        "cpf": cpf,
+        "threshold": threshold,
+    }
+
+
+def smooth_grid(grid, sigma):
+    """
+    Separable Gaussian smoothing; wraps around in direction (axis 0),
+    truncates at the speed edges (axis 1).
+    """
+    radius = max(int(np.ceil(3 * sigma)), 1)
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel /= kernel.sum()
+
+    out = sum(w * np.roll(grid, o, axis=0) for o, w in zip(offsets, kernel))
+    padded = np.pad(out, ((0, 0), (radius, radius)))
+    return sum(w * padded[:, radius + o: radius + o + grid.shape[1]] for o, w in zip(offsets, kernel))
+
+
+def grid_to_frame(grid, statistic):
+    """
+    Long frame of one grid statistic with direction/speed bin bounds, for plotting.
+    """
+    d_edges, s_edges = grid["direction_edges"], grid["speed_edges"]
+    d_lo, s_lo = np.meshgrid(d_edges[:-1], s_edges[:-1], indexing="ij")
+    frame = pd.DataFrame({
+        "direction": (d_lo + np.diff(d_edges)[0] / 2).ravel(),
+        "speed_lo": s_lo.ravel(),
+        "speed_width": np.diff(s_edges)[0],
+        "count": grid["count"].ravel(),
+        statistic: grid[statistic].ravel(),
+    })
+    return frame.dropna(subset=[statistic])
+
+
+class PolarStatsCache:
+    """
+    Polar grids from the observation store, cached per (site, gas, period, settings).
+    """
+
+    def __init__(self, store, max_entries=32):
+        self.store = store
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, site, gas, start, end, **settings):
+        key = (self.store.version, site, gas, pd.Timestamp(start), pd.Timestamp(end),
+               tuple(sorted(settings.items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        paired = self.store.query_many([(site, DIRECTION_COL), (site, SPEED_COL), (site, gas)], start, end)
+        paired = paired.dropna()
+        grid = polar_grid(paired.iloc[:, 0], paired.iloc[:, 1], paired.iloc[:, 2], **settings)
+
+        with self._lock:
+            self._cache[key] = grid
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return grid
@@ -0,0 +1,106 @@
+"""
+Background prefetching for the viewer's per-month loads.
+
+A Prefetcher wraps a loader function with a small LRU of results and a
+thread pool. get() returns a cached result, waits for a load already in
+flight, or loads synchronously. After a view is served the app calls
+prefetch() with the keys the user is likely to ask for next (the
+neighbouring months); they are loaded in the background so the next step
+is a cache hit.
+
+Each caller (one browser session) has its own queue: a new prefetch()
+cancels that caller's loads that have not started yet, so only the current
+selection's neighbours are warmed. Loads already running finish and are
+kept, since the user may still step there.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """
+    Cached loader(*key) with background prefetching of other keys.
+    """
+
+    def __init__(self, loader, workers=2, max_entries=16):
+        self.loader = loader
+        self.max_entries = max_entries
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._results = OrderedDict()
+        self._futures = {}    # key -> future of a load queued or running
+        self._queued = {}     # owner -> keys it asked to prefetch
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "waits": 0, "misses": 0, "prefetched": 0, "cancelled": 0}
+
+    def _store(self, key, value):
+        with self._lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            self._futures.pop(key, None)
+
+    def _load(self, key):
+        try:
+            value = self.loader(*key)
+        except Exception:
+            # Let the next get() load (and raise) in the foreground
+            with self._lock:
+                self._futures.pop(key, None)
+            raise
+        self._store(key, value)
+        with self._lock:
+            self.stats["prefetched"] += 1
+        return value
+
+    def get(self, *key):
+        """
+        loader(*key), from the cache when possible.
+        """
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._results[key]
+            future = self._futures.get(key)
+        if future is not None and not future.cancel():
+            # Already being prefetched: wait for it rather than loading twice
+            with self._lock:
+                self.stats["waits"] += 1
+            return future.result()
+
+        with self._lock:
+            self._futures.pop(key, None)
+            self.stats["misses"] += 1
+        value = self.loader(*key)
+        self._store(key, value)
+        return value
+
+    def cached(self, *key):
+        with self._lock:
+            return key in self._results
+
+    def prefetch(self, keys, owner=None):
+        """
+        Load keys in the background, replacing owner's earlier requests:
+        those not started yet are cancelled.
+        """
+        keys = [tuple(k) for k in keys]
+        with self._lock:
+            for key in self._queued.pop(owner, []):
+                future = self._futures.get(key)
+                if key not in keys and future is not None and future.cancel():
+                    del self._futures[key]
+                    self.stats["cancelled"] += 1
+            for key in keys:
+                if key not in self._results and key not in self._futures:
+                    self._futures[key] = self._pool.submit(self._load, key)
+            self._queued[owner] = keys
+
+    def cancel(self, owner=None):
+        self.prefetch([], owner)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,435 @@
+"""
+Read-only HTTP query service for the processed series.
+
+Serves the same harmonized data the Streamlit app works from, out of the
+same observation store and caches, so notebooks and dashboards never parse
+the CSVs themselves:
+
+  GET /sites                                   sites, sources, coordinates, variables
+  GET /series?pair=Lidcombe:CH4&pair=...       aligned series (freq=h|D, start, end, unit)
+  GET /aggregate?site=&variable=&by=hour       count/mean/std/min/max by hour|weekday|day|month|year
+  GET /availability?site=&variable=&period=day completeness per day or month from the gap index
+  GET /gaps?site=&variable=&min_hours=         missing intervals from the gap index
+  GET /rose?site=&gas=&start=&end=             polar (direction x speed) mean and CPF grid
+
+Responses are JSON records by default, or Arrow IPC streams with
+format=arrow or "Accept: application/vnd.apache.arrow.stream". Bodies are
+gzip-compressed when the client accepts it. Every response carries an ETag
+derived from the data version and the request, so If-None-Match requests
+are answered with 304 before any work is done.
+
+The store is loaded from cache/store.parquet when it matches the files in
+ghg_csv, and rebuilt (and saved) otherwise, plus the AQMS pulls saved under
+cache/api, as in the app; new or changed files and new pulls are picked up
+every refresh interval. A site or site/variable pair with no
+data is answered with 404, a malformed request with 400, and anything
+else that fails with a 500 JSON error.
+
+    python query_service.py --port 8080
+    curl -H "Accept-Encoding: gzip" "http://127.0.0.1:8080/series?pair=Lidcombe:CH4&freq=D"
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from compare import AlignedSeriesCache, column_name
+from gap_index import GapIndex
+from ghg_loader import DATA_DIR
+from obs_store import API_DIR, STORE_FILE, api_fingerprint, data_fingerprint, load_or_build_store
+from out_of_core import GROUP_KEYS
+from polar_stats import PolarStatsCache, grid_to_frame
+
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+JSON_TYPE = "application/json"
+MIN_GZIP_BYTES = 1024
+
+
+class QueryError(ValueError):
+    """
+    Bad request parameters; reported to the client as HTTP 400.
+    """
+
+
+class NotFound(QueryError):
+    """
+    A site or (site, variable) the store has no data for; reported as HTTP 404.
+    """
+
+
+# -----------------------------
+# Encoding
+# -----------------------------
+def frame_to_json(frame):
+    return frame.to_json(orient="records", date_format="iso", date_unit="s").encode("utf-8")
+
+
+def frame_to_arrow(frame):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class QueryService:
+    """
+    Query logic, independent of HTTP: each endpoint returns a DataFrame.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, refresh_interval=60.0, max_responses=256, api_dir=API_DIR):
+        self.data_dir = data_dir
+        self.api_dir = api_dir
+        self.refresh_interval = refresh_interval
+        self.max_responses = max_responses
+        self._responses = OrderedDict()
+        self._lock = threading.RLock()
+        self._checked = 0.0
+        self._load()
+
+    def _load(self):
+        fingerprint = self.current_fingerprint()
+        self.store, _ = load_or_build_store(self.data_dir)
+        # The AQMS pulls the app and the SQL observations view also include
+        self.store.add_api_dir(self.api_dir)
+        self.fingerprint = fingerprint
+        self.series_caches = {}
+        self.polar_cache = PolarStatsCache(self.store)
+        self.gap_index = GapIndex.load_or_build(self.store, newer_than=STORE_FILE).follow(self.store)
+        self._responses.clear()
+        self._checked = time.monotonic()
+
+    def maybe_refresh(self):
+        """
+        Reload when the files changed; checked at most every refresh_interval seconds.
+        """
+        with self._lock:
+            if time.monotonic() - self._checked < self.refresh_interval:
+                return
+            self._checked = time.monotonic()
+            if self.current_fingerprint() != self.fingerprint:
+                self._load()
+
+    def current_fingerprint(self):
+        """
+        Hash of the Picarro files and the saved AQMS pulls.
+        """
+        return hashlib.sha1((data_fingerprint(self.data_dir) + api_fingerprint(self.api_dir)).encode()).hexdigest()
+
+    @property
+    def data_version(self):
+        return f"{self.fingerprint[:16]}-{self.store.version}"
+
+    def etag(self, endpoint, params, fmt):
+        key = json.dumps([self.data_version, endpoint, sorted((k, sorted(v)) for k, v in params.items()), fmt])
+        return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+    def cached_body(self, etag, build):
+        """
+        Encoded body for an ETag, computed once and kept in a small LRU.
+        """
+        with self._lock:
+            if etag in self._responses:
+                self._responses.move_to_end(etag)
+                return self._responses[etag]
+        body = build()
+        with self._lock:
+            self._responses[etag] = body
+            while len(self._responses) > self.max_responses:
+                self._responses.popitem(last=False)
+        return body
+
+    # -----------------------------
+    # Endpoints
+    # -----------------------------
+    def sites(self, params):
+        rows = []
+        for site in self.store.sites():
+            lat, lon = self.store.site_coords.get(site, (None, None))
+            rows.append({"site": site, "source": self.store.site_sources.get(site), "latitude": lat,
+                         "longitude": lon, "variables": ",".join(self.store.variables(site))})
+        return pd.DataFrame(rows)
+
+    def series(self, params):
+        pairs = []
+        for pair in params.get("pair", []):
+            site, _, variable = pair.partition(":")
+            if not variable:
+                raise QueryError(f"pair must be site:variable, got {pair!r}")
+            pairs.append((site, variable))
+        if not pairs:
+            raise QueryError("at least one pair=site:variable is required")
+        self.check_series(pairs)
+
+        freq = first(params, "freq", "h")
+        if freq not in ("h", "D"):
+            raise QueryError("freq must be h or D")
+        start, end = self.time_range(params, pairs)
+        unit = first(params, "unit")
+
+        if unit is None:
+            with self._lock:
+                cache = self.series_caches.setdefault(freq, AlignedSeriesCache(self.store, freq))
+            aligned = cache.get(pairs, start, end)
+        else:
+            aligned = pd.concat([self.store.series(site, variable, start, end, unit).resample(freq).mean()
+                                 .rename(column_name(site, variable)) for site, variable in pairs], axis=1)
+        return aligned.rename_axis("timestamp").reset_index()
+
+    def aggregate(self, params):
+        site, variable = required(params, "site"), required(params, "variable")
+        self.check_series([(site, variable)])
+        by = first(params, "by", "hour")
+        if by not in GROUP_KEYS:
+            raise QueryError(f"by must be one of {list(GROUP_KEYS)}")
+        start, end = self.time_range(params, [(site, variable)])
+        values = self.store.series(site, variable, start, end, first(params, "unit")).dropna()
+        stats = values.groupby(GROUP_KEYS[by](values.index)).agg(["count", "mean", "std", "min", "max"])
+        return stats.rename_axis(by).reset_index()
+
+    def availability(self, params):
+        site, variable = required(params, "site"), first(params, "variable")
+        self.check_series([(site, variable)])
+        period = first(params, "period", "day")
+        if period not in ("day", "month"):
+            raise QueryError("period must be day or month")
+        return self.gap_index.completeness_for(site, variable, period, *requested_range(params))
+
+    def gaps(self, params):
+        site, variable = required(params, "site"), required(params, "variable")
+        self.check_series([(site, variable)])
+        min_hours = first(params, "min_hours")
+        gaps = self.gap_index.missing_intervals(
+            site, variable, *requested_range(params), pd.Timedelta(hours=float(min_hours)) if min_hours else None)
+        return gaps.assign(duration=gaps["duration"].dt.total_seconds() / 3600).rename(
+            columns={"duration": "duration_hours"})
+
+    def rose(self, params):
+        site, gas = required(params, "site"), required(params, "gas")
+        self.check_series([(site, gas)])
+        start, end = self.time_range(params, [(site, gas)])
+        settings = {
+            "dir_bin": float(first(params, "dir_bin", 10)),
+            "speed_bin": float(first(params, "speed_bin", 1.0)),
+            "percentile": float(first(params, "percentile", 75)),
+            "smooth": float(first(params, "smooth", 0.0)),
+        }
+        if not 0 < settings["dir_bin"] <= 360:
+            raise QueryError("dir_bin must be above 0 and at most 360 degrees")
+        if not 0 < settings["speed_bin"] < math.inf:
+            raise QueryError("speed_bin must be above 0")
+        if not 0 <= settings["percentile"] <= 100:
+            raise QueryError("percentile must be between 0 and 100")
+        if not 0 <= settings["smooth"] < math.inf:
+            raise QueryError("smooth must be 0 or more")
+        grid = self.polar_cache.get(site, gas, start, end, **settings)
+        mean = grid_to_frame(grid, "mean")
+        cpf = grid_to_frame(grid, "cpf")[["direction", "speed_lo", "cpf"]]
+        frame = mean.merge(cpf, on=["direction", "speed_lo"], how="outer")
+        return frame.assign(threshold=grid["threshold"])
+
+    def check_series(self, pairs):
+        """
+        Raise NotFound for a site, or (site, variable), with no data in the store.
+        A variable of None only checks the site.
+        """
+        sites = set(self.store.sites())
+        for site, variable in pairs:
+            if site not in sites:
+                raise NotFound(f"unknown site {site!r}")
+            if variable is not None and variable not in self.store.variables(site):
+                raise NotFound(f"no {variable!r} data for {site!r}")
+
+    def time_range(self, params, pairs):
+        """
+        start/end parameters, defaulting to the full extent of the requested series.
+        """
+        start, end = requested_range(params)
+        if start is None or end is None:
+            stamps = [self.store.query(site, variable).index for site, variable in pairs]
+            stamps = [s for s in stamps if len(s)]
+            if not stamps:
+                raise QueryError("no data for the requested series")
+            start = start or min(s.min() for s in stamps)
+            end = end or max(s.max() for s in stamps)
+        return pd.Timestamp(start), pd.Timestamp(end)
+
+    ENDPOINTS = {
+        "sites": sites,
+        "series": series,
+        "aggregate": aggregate,
+        "availability": availability,
+        "gaps": gaps,
+        "rose": rose,
+    }
+
+
+def first(params, name, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def timestamp_param(params, name):
+    """
+    A date parameter as a Timestamp, None when absent; QueryError when it does not parse.
+    """
+    value = first(params, name)
+    if value is None:
+        return None
+    try:
+        parsed = pd.Timestamp(value)
+    except (TypeError, ValueError) as e:
+        raise QueryError(f"{name} is not a date: {value!r}") from e
+    if pd.isna(parsed):
+        raise QueryError(f"{name} is not a date: {value!r}")
+    return parsed
+
+
+def requested_range(params):
+    """
+    Parsed start and end parameters (either may be None); start must not be after end.
+    """
+    start, end = timestamp_param(params, "start"), timestamp_param(params, "end")
+    if start is not None and end is not None and start > end:
+        raise QueryError(f"start {start} is after end {end}")
+    return start, end
+
+
+def required(params, name):
+    value = first(params, name)
+    if value is None:
+        raise QueryError(f"missing parameter {name!r}")
+    return value
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET-only routing, content negotiation, gzip and conditional requests.
+    """
+
+    server_version = "GHGQuery/1.0"
+    service = None  # filled in by make_server
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body=b"", content_type=JSON_TYPE, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304 and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"Message": message}).encode("utf-8"))
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip("/").lower()
+        handler = QueryService.ENDPOINTS.get(endpoint)
+        if handler is None:
+            self._error(404, f"No endpoint {url.path}; try one of {sorted(QueryService.ENDPOINTS)}")
+            return
+
+        params = parse_qs(url.query)
+        fmt = first(params, "format") or ("arrow" if ARROW_TYPE in self.headers.get("Accept", "") else "json")
+        params.pop("format", None)
+        if fmt not in ("json", "arrow"):
+            self._error(400, "format must be json or arrow")
+            return
+
+        service = self.service
+        service.maybe_refresh()
+        gzip_ok = "gzip" in self.headers.get("Accept-Encoding", "")
+        etag = service.etag(endpoint, params, fmt)
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept, Accept-Encoding"}
+
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self._send(304, headers=headers)
+            return
+
+        def build():
+            frame = handler(service, params)
+            body = frame_to_arrow(frame) if fmt == "arrow" else frame_to_json(frame)
+            return body, gzip.compress(body, compresslevel=5) if len(body) >= MIN_GZIP_BYTES else None
+
+        try:
+            body, compressed = service.cached_body(etag, build)
+        except NotFound as e:
+            self._error(404, f"Not found: {e}")
+            return
+        except (QueryError, KeyError, ValueError) as e:
+            self._error(400, f"Bad request: {e}")
+            return
+        except ImportError:
+            self._error(406, "Arrow output needs pyarrow installed")
+            return
+        except Exception as e:
+            # Never drop the connection without a response
+            self.log_error("Error serving %s: %r", self.path, e)
+            self._error(500, f"Internal error: {type(e).__name__}")
+            return
+
+        if gzip_ok and compressed is not None:
+            headers["Content-Encoding"] = "gzip"
+            body = compressed
+        self._send(200, body, ARROW_TYPE if fmt == "arrow" else JSON_TYPE, headers)
+
+
+def make_server(host="127.0.0.1", port=8080, service=None, quiet=False):
+    """
+    Create (but do not start) a query server. Port 0 picks a free port.
+    """
+    handler = type("ConfiguredQueryHandler", (QueryHandler,), {"service": service or QueryService()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.quiet = quiet
+    return server
+
+
+def start_in_thread(service=None, host="127.0.0.1", port=0):
+    """
+    Start a query server on a background thread and return (server, base_url).
+    Call server.shutdown() when done.
+    """
+    server = make_server(host, port, service, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}/"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only HTTP query service for processed GHG series")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--refresh", type=float, default=60.0, help="seconds between checks for new files")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, QueryService(args.data_dir, args.refresh), quiet=args.quiet)
+    print(f"GHG query service listening on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped")
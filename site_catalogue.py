@@ -0,0 +1,111 @@
+"""
+Indexed catalogue of AQMS stations and Picarro sites.
+
+Built from sites.json and the Picarro site coordinates. Coordinates are
+held in a KD-tree (see spatial.py) for k-nearest and radius queries, and
+regions in a dictionary keyed on the normalised region name (sites.json
+mixes "Sydney South-west" and "Sydney south-west").
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from ghg_loader import PICARRO_SITES
+from obs_store import read_sites_json
+from spatial import EARTH_RADIUS_KM, chord_to_km, to_unit_vectors
+
+
+def region_key(region):
+    return " ".join(str(region or "").lower().split())
+
+
+class SiteCatalogue:
+    """
+    Sites with Site_Id, SiteName, Latitude, Longitude, Region and source
+    ("aqms" or "picarro"), indexed for spatial and region lookups.
+    """
+
+    def __init__(self, records):
+        self.sites = pd.DataFrame(records, columns=["Site_Id", "SiteName", "Latitude", "Longitude", "Region",
+                                                    "source"])
+        self.sites = self.sites.dropna(subset=["Latitude", "Longitude"]).reset_index(drop=True)
+        self.tree = cKDTree(to_unit_vectors(self.sites["Latitude"], self.sites["Longitude"]))
+
+        self.by_name = {name: i for i, name in enumerate(self.sites["SiteName"])}
+        self.by_region = {}
+        for i, region in enumerate(self.sites["Region"]):
+            self.by_region.setdefault(region_key(region), []).append(i)
+
+    @classmethod
+    def from_files(cls, sites_path="sites.json", picarro_sites=None):
+        records = [dict(s, source="aqms") for s in read_sites_json(sites_path)]
+        for name, (lat, lon) in (picarro_sites or PICARRO_SITES).items():
+            records.append({"Site_Id": None, "SiteName": name, "Latitude": lat, "Longitude": lon,
+                            "Region": "Picarro", "source": "picarro"})
+        return cls(records)
+
+    def __len__(self):
+        return len(self.sites)
+
+    def location(self, name):
+        row = self.sites.iloc[self.by_name[name]]
+        return row["Latitude"], row["Longitude"]
+
+    def _result(self, idx, dist_km):
+        result = self.sites.iloc[idx].copy()
+        result["distance_km"] = dist_km
+        return result.reset_index(drop=True)
+
+    def nearest(self, lat, lon, k=5, source=None, exclude=()):
+        """
+        The k closest sites to a point, optionally of one source, closest first.
+        """
+        # Ask for enough extra neighbours to cover the rows filtered out afterwards
+        skip = (self.sites["source"] != source).sum() if source else 0
+        n = int(min(len(self.sites), k + skip + len(exclude)))
+        if n == 0:
+            return self._result([], [])
+        dist, idx = self.tree.query(to_unit_vectors([lat], [lon]), k=n)
+        dist, idx = np.atleast_1d(dist.squeeze()), np.atleast_1d(idx.squeeze())
+
+        keep = np.ones(len(idx), dtype=bool)
+        if source:
+            keep &= (self.sites["source"].to_numpy()[idx] == source)
+        if exclude:
+            keep &= ~np.isin(self.sites["SiteName"].to_numpy()[idx], list(exclude))
+        idx, dist = idx[keep][:k], dist[keep][:k]
+        return self._result(idx, chord_to_km(dist))
+
+    def within_radius(self, lat, lon, radius_km, source=None):
+        """
+        Every site within radius_km of a point, closest first.
+        """
+        chord = 2 * np.sin(min(radius_km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+        idx = np.array(self.tree.query_ball_point(to_unit_vectors([lat], [lon])[0], r=chord), dtype=int)
+        if source and len(idx):
+            idx = idx[self.sites["source"].to_numpy()[idx] == source]
+        vectors = to_unit_vectors(self.sites["Latitude"].to_numpy()[idx], self.sites["Longitude"].to_numpy()[idx])
+        dist = chord_to_km(np.linalg.norm(vectors - to_unit_vectors([lat], [lon]), axis=1))
+        order = np.argsort(dist)
+        return self._result(idx[order], dist[order])
+
+    def near_site(self, name, k=5, source="aqms"):
+        """
+        The k sites of source closest to a named site (the site itself excluded).
+        """
+        lat, lon = self.location(name)
+        return self.nearest(lat, lon, k, source, exclude=(name,))
+
+    def in_region(self, region):
+        return self.sites.iloc[self.by_region.get(region_key(region), [])].reset_index(drop=True)
+
+    def regions(self, source="aqms"):
+        """
+        Region names (first spelling seen) for sites of a source.
+        """
+        sites = self.sites if source is None else self.sites[self.sites["source"] == source]
+        names = {}
+        for region in sites["Region"]:
+            names.setdefault(region_key(region), str(region).strip())
+        return sorted(names.values())
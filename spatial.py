@@ -0,0 +1,126 @@
+"""
+Spatial interpolation of AQMS station values onto a regular lat/lon grid.
+
+Station coordinates go into a KD-tree once (as 3-D unit vectors, so
+Euclidean distance ranks stations the same way great-circle distance
+does). The k nearest stations of every grid cell and their inverse
+distance weights are computed once per grid; interpolating any number of
+hourly frames is then one gather and weighted sum over a
+(frames x cells x k) array, skipping stations that are missing in a frame.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+# Default grid covering the NSW monitoring network
+NSW_BOUNDS = ((-37.6, 140.9), (-28.1, 153.7))  # (south, west), (north, east)
+
+
+def to_unit_vectors(lats, lons):
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class IDWGrid:
+    """
+    Inverse distance weighting from a fixed set of stations onto a fixed grid.
+    """
+
+    def __init__(self, site_ids, lats, lons, bounds=NSW_BOUNDS, resolution=0.05, k=8, power=2.0,
+                 max_distance_km=150.0):
+        self.site_ids = list(site_ids)
+        (south, west), (north, east) = bounds
+        self.bounds = bounds
+        self.grid_lats = np.arange(north, south, -resolution)  # image rows run north to south
+        self.grid_lons = np.arange(west, east, resolution)
+        self.power = power
+        self.k = min(k, len(self.site_ids))
+
+        self.tree = cKDTree(to_unit_vectors(lats, lons))
+        glon, glat = np.meshgrid(self.grid_lons, self.grid_lats)
+        dist, idx = self.tree.query(to_unit_vectors(glat.ravel(), glon.ravel()), k=self.k)
+        dist, idx = dist.reshape(len(glat.ravel()), self.k), idx.reshape(len(glat.ravel()), self.k)
+        dist_km = chord_to_km(dist)
+
+        self.neighbours = idx
+        with np.errstate(divide="ignore"):
+            weights = 1.0 / np.maximum(dist_km, 1e-3) ** power
+        weights[dist_km > max_distance_km] = 0.0
+        self.weights = weights
+
+    @property
+    def shape(self):
+        return len(self.grid_lats), len(self.grid_lons)
+
+    def interpolate(self, values):
+        """
+        values: array (n_stations,) or (n_frames, n_stations) in site_ids
+        order, NaN where a station has no data. Returns (n_frames, rows, cols),
+        NaN where no station with data is within reach.
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        gathered = values[:, self.neighbours]                  # frames x cells x k
+        valid = ~np.isnan(gathered)
+        w = np.where(valid, self.weights[None, :, :], 0.0)
+        total = w.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = (np.where(valid, gathered, 0.0) * w).sum(axis=2) / total
+        result[total == 0] = np.nan
+        return result.reshape((values.shape[0],) + self.shape)
+
+    def frame_matrix(self, obs):
+        """
+        (hours x stations) matrix from a normalized observation frame (see
+        obs_normalize) for one parameter, columns in site_ids order.
+        """
+        wide = obs.pivot_table(index="timestamp", columns="site", values="value", aggfunc="mean")
+        wide = wide.reindex(columns=self.site_ids)
+        return wide.index, wide.to_numpy(dtype=float)
+
+
+def grid_from_sites(sites, **kwargs):
+    """
+    IDWGrid over the stations in a sites.json style list.
+    """
+    sites = [s for s in sites if s.get("Latitude") is not None and s.get("Longitude") is not None]
+    return IDWGrid([s["Site_Id"] for s in sites], [s["Latitude"] for s in sites],
+                   [s["Longitude"] for s in sites], **kwargs)
+
+
+def frame_to_png(frame, vmin=None, vmax=None, cmap="viridis", alpha=0.6):
+    """
+    Render one interpolated frame as a transparent PNG (bytes) for an image overlay.
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    vmin = np.nanmin(frame) if vmin is None else vmin
+    vmax = np.nanmax(frame) if vmax is None else vmax
+    norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax)
+    rgba = matplotlib.colormaps[cmap](norm(frame))
+    rgba[..., 3] = np.where(np.isnan(frame), 0.0, alpha)
+
+    buf = io.BytesIO()
+    plt.imsave(buf, rgba, format="png")
+    return buf.getvalue()
+
+
+def day_frames(grid, obs, day):
+    """
+    Interpolate every hour of one day in a single call.
+    Returns (timestamps, frames) with frames shaped (24, rows, cols).
+    """
+    hours = pd.date_range(pd.Timestamp(day) + pd.Timedelta(hours=1), periods=24, freq="h")
+    index, matrix = grid.frame_matrix(obs)
+    matrix = pd.DataFrame(matrix, index=index).reindex(hours).to_numpy(dtype=float)
+    return hours, grid.interpolate(matrix)
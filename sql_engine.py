@@ -0,0 +1,223 @@
+"""
+Embedded SQL over the local archive (DuckDB, in-process, read-only).
+
+Each monthly CSV is mirrored once to a Parquet file under cache/sql/, with
+its original columns (units stripped from the Lidcombe names) plus a parsed
+"timestamp", sorted by time and written in small row groups. The mirror is
+refreshed per file when the CSV changes. Views over the mirrors:
+
+  lidcombe, stockton   hourly/monthly files in ghg_csv, one row per sample
+  stockton_minute      minute files in ghg_csv/minutedata (with "<column>-Flag" columns)
+  observations         source, site, variable, timestamp, value, unit, flag: the Picarro
+                       rows of the observation store snapshot (cache/store.parquet) and
+                       the AQMS pulls saved by the app and the ETL (cache/api/*.parquet)
+
+DuckDB scans Parquet column by column and checks row-group statistics, so
+a query reads only the columns it names and skips row groups (and files)
+outside its WHERE range on timestamp or any other column.
+
+    SELECT timestamp, NH3_Pic_0, WDR_0 FROM stockton
+    WHERE NH3_Pic_0 > 5 AND WDR_0 BETWEEN 90 AND 150
+      AND timestamp >= '2024-10-01' AND timestamp < '2024-11-01'
+
+Only SELECT (and EXPLAIN) statements are run, and the connection can only
+read files under the mirror directory and the cache.
+
+    python sql_engine.py "SELECT count(*) FROM stockton"
+"""
+
+import argparse
+import glob
+import os
+import threading
+
+import duckdb
+import pandas as pd
+
+from ghg_loader import CACHE_DIR, DATA_DIR, PICARRO_SITES, clean_columns, parse_datetime, site_files
+
+SQL_DIR = os.path.join(CACHE_DIR, "sql")
+ROW_GROUP_SIZE = 10_000
+ALLOWED_STATEMENTS = {"SELECT", "EXPLAIN"}
+DEFAULT_LIMIT = 100_000
+
+EXAMPLE_QUERY = """SELECT timestamp, NH3_Pic_0, WDR_0, WSP_0
+FROM stockton
+WHERE NH3_Pic_0 > 5 AND WDR_0 BETWEEN 90 AND 150
+  AND timestamp >= '2024-10-01' AND timestamp < '2024-11-01'
+ORDER BY timestamp"""
+
+
+class QueryError(ValueError):
+    pass
+
+
+def mirror_csv(path, output):
+    """
+    Write one Picarro CSV as Parquet with a parsed, sorted timestamp column.
+    """
+    df = clean_columns(pd.read_csv(path))
+    df.insert(0, "timestamp", parse_datetime(df))
+    df = df.dropna(subset=["timestamp"]).sort_values("timestamp", kind="stable")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    tmp = output + ".tmp"
+    df.to_parquet(tmp, index=False, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, output)
+
+
+def archive_tables(data_dir=DATA_DIR):
+    """
+    View name -> CSV files, for every Picarro site and the minute files.
+    """
+    tables = {site.lower(): site_files(site, data_dir) for site in PICARRO_SITES}
+    minute_dir = os.path.join(data_dir, "minutedata")
+    for site in PICARRO_SITES:
+        files = [p for p in site_files(site, minute_dir) if not p.endswith("_hour.csv")]
+        if files:
+            tables[f"{site.lower()}_minute"] = files
+    return {name: files for name, files in tables.items() if files}
+
+
+def sync_mirror(data_dir=DATA_DIR, sql_dir=SQL_DIR):
+    """
+    Bring the Parquet mirror in line with the CSVs: convert new or changed
+    files, delete mirrors of removed files. Returns view name -> Parquet
+    glob and the number of files converted.
+    """
+    views, converted = {}, 0
+    for name, files in archive_tables(data_dir).items():
+        directory = os.path.join(sql_dir, name)
+        wanted = set()
+        for path in files:
+            output = os.path.join(directory, os.path.basename(path)[:-len(".csv")] + ".parquet")
+            wanted.add(output)
+            if not os.path.exists(output) or os.path.getmtime(output) < os.path.getmtime(path):
+                mirror_csv(path, output)
+                converted += 1
+        for stale in set(glob.glob(os.path.join(directory, "*.parquet"))) - wanted:
+            os.remove(stale)
+        views[name] = os.path.join(directory, "*.parquet")
+    return views, converted
+
+
+def sql_literal(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+class SQLEngine:
+    """
+    DuckDB connection with the archive views registered. refresh() picks
+    up new files; query() runs one read-only statement.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, sql_dir=SQL_DIR, store_path=None, api_dir=None):
+        from obs_store import API_DIR, STORE_FILE
+
+        self.data_dir = data_dir
+        self.sql_dir = sql_dir
+        self.store_path = store_path or STORE_FILE
+        self.api_dir = api_dir or API_DIR
+        self.views = {}
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        connection = duckdb.connect()
+        for name, patterns in self.views.items():
+            files = "[" + ", ".join(sql_literal(p) for p in patterns) + "]"
+            connection.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet({files}, union_by_name = true)")
+        allowed = [os.path.abspath(d) + os.sep
+                   for d in (self.sql_dir, os.path.dirname(self.store_path), self.api_dir)]
+        connection.execute(f"SET allowed_directories = [{', '.join(sql_literal(d) for d in allowed)}]")
+        connection.execute("SET enable_external_access = false")
+        connection.execute("SET lock_configuration = true")
+        return connection
+
+    def refresh(self):
+        """
+        Sync the Parquet mirror and recreate the views; returns the files converted.
+        """
+        with self._lock:
+            views, converted = sync_mirror(self.data_dir, self.sql_dir)
+            views = {name: [pattern] for name, pattern in views.items()}
+            observations = [self.store_path] if os.path.exists(self.store_path) else []
+            if glob.glob(os.path.join(self.api_dir, "*.parquet")):
+                observations.append(os.path.join(self.api_dir, "*.parquet"))
+            if observations:
+                views["observations"] = observations
+            views = {name: [os.path.abspath(p) for p in patterns] for name, patterns in views.items()}
+            if views != self.views or self._connection is None:
+                self.views = views
+                if self._connection is not None:
+                    self._connection.close()
+                self._connection = self._connect()
+            return converted
+
+    def cursor(self):
+        if self._connection is None:
+            self.refresh()
+        with self._lock:
+            return self._connection.cursor()
+
+    def query(self, sql, limit=DEFAULT_LIMIT):
+        """
+        Result of one SELECT as a frame, at most limit rows.
+        """
+        cursor = self.cursor()
+        try:
+            statements = cursor.extract_statements(sql)
+        except duckdb.Error as e:
+            raise QueryError(str(e)) from e
+        if len(statements) != 1:
+            raise QueryError("Enter exactly one SQL statement")
+        kind = statements[0].type.name
+        if kind not in ALLOWED_STATEMENTS:
+            raise QueryError(f"Only SELECT queries are allowed, not {kind}")
+        try:
+            # Only the first batch of limit rows is materialised
+            reader = cursor.execute(sql).to_arrow_reader(limit)
+            try:
+                frame = reader.read_next_batch().to_pandas()
+            except StopIteration:
+                frame = reader.schema.empty_table().to_pandas()
+        except duckdb.Error as e:
+            raise QueryError(str(e)) from e
+        finally:
+            cursor.close()
+        return frame
+
+    def explain(self, sql):
+        """
+        DuckDB's physical plan, showing the projections and filters pushed into each scan.
+        """
+        plan = self.query(f"EXPLAIN {sql}")
+        return "\n".join(plan.iloc[:, -1])
+
+    def describe(self):
+        """
+        One row per view column: view, column, type.
+        """
+        frames = []
+        for name in self.views:
+            columns = self.query(f"DESCRIBE {name}")
+            frames.append(pd.DataFrame({"view": name, "column": columns["column_name"],
+                                        "type": columns["column_type"]}))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["view", "column", "type"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run SQL over the local archive")
+    parser.add_argument("sql", nargs="?", default=EXAMPLE_QUERY)
+    parser.add_argument("--explain", action="store_true", help="show the plan instead of the result")
+    parser.add_argument("--describe", action="store_true", help="list the views and their columns")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    engine = SQLEngine()
+    engine.refresh()
+    if args.describe:
+        print(engine.describe().to_string(index=False))
+    elif args.explain:
+        print(engine.explain(args.sql))
+    else:
+        print(engine.query(args.sql, args.limit).to_string(index=False))
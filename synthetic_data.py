@@ -0,0 +1,268 @@
+"""
+Synthetic Picarro and AQMS data for scale testing.
+
+Writes multi-year archives in the same layouts as the shipped files, one
+CSV per site and month so memory stays bounded however long the archive:
+
+  Lidcombe  DATE, TIME, EPOCH_TIME, CH4, CO2, H2O, N2O, NH3
+  Stockton  "Date Time", station columns, *_Pic_0 gases; minute files add
+            a "<column>-Flag" column after every measurement and go into
+            minutedata/, as in ghg_csv
+
+Gas series have a growth trend, a seasonal cycle, a night-time diurnal
+peak, noise and short plumes; wind direction is a random walk and wind
+speed peaks in the afternoon. Gaps remove whole runs of rows and a small
+fraction of minute values carry bad flags (value 0, as in the real files).
+get_Observations-shaped JSON is written with the mock server's record
+builder so it matches what the API path expects.
+
+    python synthetic_data.py --sites Lidcombe Stockton --start 2020-01 --months 48 --freq min
+    python synthetic_data.py --observations obs.json --obs-sites 39 107 --obs-parameters NO2 OZONE
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from mock_aqms_server import MockConfig, load_templates, synthetic_observations
+
+OUTPUT_DIR = os.path.join("synthetic", "ghg_csv")
+
+# Stockton station columns in file order
+STOCKTON_COLUMNS = [
+    "PM10_0", "RAIN_0", "HUMID_1", "TEMP_1", "WSP_0", "WDR_0", "SD1_0", "WGU_0", "PM2.5_0", "HUMID_0", "TEMP_0",
+    "DPTEMP_0", "H2O_0", "WBTEMP_0", "FPTEMP_0", "SO2_0", "NO_0", "NOX_0", "NO2_0", "NH3_0", "WSP_1", "WDR_1",
+    "SD1_1", "WGU_1", "N2O_Pic_0", "CH4_Pic_0", "CO2_Pic_0", "NH3_Pic_0", "H2O_Pic_0", "NO_1", "NOX_1", "NO2_1",
+    "NH3_1",
+]
+
+LIDCOMBE_GASES = ["CH4", "CO2", "H2O", "N2O", "NH3"]
+
+# gas -> (level, yearly growth, seasonal amplitude, night enhancement, noise sd)
+GAS_PROFILES = {
+    "CH4": (1.95, 0.010, 0.010, 0.08, 0.004),
+    "CO2": (420.0, 2.4, 3.0, 12.0, 0.8),
+    "N2O": (0.335, 0.001, 0.0005, 0.002, 0.0005),
+    "NH3": (3.0, 0.0, 0.5, 2.0, 0.4),
+    "H2O": (1.2, 0.0, 0.5, 0.1, 0.05),
+}
+
+# Station columns that are not gases: level and noise sd
+STATION_LEVELS = {
+    "PM10": (18.0, 6.0), "PM2.5": (7.0, 3.0), "RAIN": (0.05, 0.1), "HUMID": (65.0, 10.0), "TEMP": (18.0, 2.0),
+    "DPTEMP": (11.0, 2.0), "WBTEMP": (13.0, 2.0), "FPTEMP": (11.0, 2.0), "H2O": (8.0, 1.0), "SD1": (30.0, 8.0),
+    "SO2": (0.1, 0.05), "NO": (0.5, 0.3), "NOX": (1.5, 0.6), "NO2": (1.0, 0.4), "NH3": (2.0, 0.8),
+}
+
+BAD_FLAGS = ["B M", "B NR ", "B IA"]
+
+
+class GeneratorConfig:
+    """
+    Knobs controlling the generated archive.
+    """
+
+    def __init__(self, start="2023-01", months=12, freq="min", gap_rate=0.02, mean_gap_steps=120,
+                 bad_flag_rate=0.001, plume_rate=0.002, seed=0):
+        self.start = pd.Timestamp(start)
+        self.months = months                # number of monthly files per site
+        self.freq = freq                    # "min" or "h"
+        self.gap_rate = gap_rate            # fraction of time steps lost to gaps
+        self.mean_gap_steps = mean_gap_steps  # average gap length in time steps
+        self.bad_flag_rate = bad_flag_rate  # fraction of minute values with a bad flag
+        self.plume_rate = plume_rate        # chance per time step that a plume starts
+        self.seed = seed
+
+
+def month_index(month_start, freq):
+    end = month_start + pd.offsets.MonthBegin(1)
+    return pd.date_range(month_start, end, freq=freq, inclusive="left")
+
+
+def gap_mask(n, rng, gap_rate, mean_gap_steps):
+    """
+    Boolean keep-mask with runs of False covering about gap_rate of n steps.
+    """
+    keep = np.ones(n, dtype=bool)
+    if gap_rate <= 0 or n == 0:
+        return keep
+    n_gaps = rng.poisson(gap_rate * n / mean_gap_steps)
+    starts = rng.integers(0, n, n_gaps)
+    lengths = rng.geometric(1 / mean_gap_steps, n_gaps)
+    # Mark run boundaries and integrate, so overlapping gaps need no loop
+    delta = np.zeros(n + 1, dtype=int)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, np.minimum(starts + lengths, n), -1)
+    return np.cumsum(delta[:-1]) == 0
+
+
+def gas_series(index, gas, rng, plume_rate, origin):
+    """
+    Trend + seasonal + diurnal (night maximum) + noise + plumes for one gas.
+    """
+    level, growth, seasonal, night, noise = GAS_PROFILES[gas]
+    years = (index - origin).total_seconds().to_numpy() / (365.25 * 86400)
+    doy = index.dayofyear.to_numpy()
+    hour = index.hour.to_numpy() + index.minute.to_numpy() / 60
+
+    values = (level + growth * years
+              + seasonal * np.cos(2 * np.pi * (doy - 200) / 365.25)
+              + night * np.clip(np.cos(2 * np.pi * (hour - 4) / 24), 0, None)
+              + rng.normal(0, noise, len(index)))
+
+    # Plumes: exponentially decaying spikes started at random steps
+    spikes = np.where(rng.random(len(index)) < plume_rate, rng.exponential(2 * night + noise, len(index)), 0.0)
+    decay = 0.9
+    plumes = np.zeros(len(index))
+    if spikes.any():
+        steps = np.arange(len(index))
+        for i in np.flatnonzero(spikes):
+            span = steps[i:i + 60] - i
+            plumes[i:i + 60] += spikes[i] * decay ** span
+    return values + plumes
+
+
+def wind(index, rng, state=None):
+    """
+    Wind direction as a bounded random walk (degrees) and an afternoon-peaking
+    gamma wind speed (m/s). state carries the last direction between months.
+    """
+    step = 2.0 if len(index) > 1 and index[1] - index[0] < pd.Timedelta(hours=1) else 15.0
+    start = state if state is not None else rng.uniform(0, 360)
+    direction = (start + np.cumsum(rng.normal(0, step, len(index)))) % 360
+    hour = index.hour.to_numpy()
+    speed = rng.gamma(2.0, 1.2, len(index)) * (1 + 0.5 * np.sin(np.pi * np.clip(hour - 8, 0, 12) / 12))
+    return direction, speed
+
+
+def lidcombe_frame(index, rng, config):
+    frame = pd.DataFrame({
+        "DATE": index.strftime("%d/%m/%Y"),
+        "TIME": index.strftime("%H:%M:%S"),
+        "EPOCH_TIME": (index - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1),
+    })
+    for gas in LIDCOMBE_GASES:
+        frame[gas] = np.round(gas_series(index, gas, rng, config.plume_rate, config.start), 6)
+    return frame
+
+
+def stockton_frame(index, rng, config, minute, wind_state=None):
+    """
+    Stockton layout; returns (frame, last wind direction).
+    """
+    direction, speed = wind(index, rng, wind_state)
+    columns = {}
+    for column in STOCKTON_COLUMNS:
+        name, _ = column.rsplit("_", 1)
+        if column.endswith("_Pic_0"):
+            values = gas_series(index, column.split("_")[0], rng, config.plume_rate, config.start)
+        elif name == "WDR":
+            values = (direction + rng.normal(0, 3, len(index))) % 360
+        elif name == "WSP":
+            values = speed * rng.uniform(0.95, 1.05, len(index))
+        elif name == "WGU":
+            values = speed * rng.uniform(1.1, 1.6, len(index))
+        else:
+            level, noise = STATION_LEVELS[name]
+            values = np.clip(level + rng.normal(0, noise, len(index)), 0, None)
+        columns[column] = np.round(values, 3 if minute else 6)
+
+    frame = pd.DataFrame(columns)
+    frame.insert(0, "Date Time", index.strftime("%d/%m/%Y %H:%M" if minute else "%d-%m-%Y %H:%M"))
+
+    if minute:
+        # Flag column after every measurement; bad flags zero the value, as in the real files
+        ordered = {"Date Time": frame["Date Time"]}
+        for column in STOCKTON_COLUMNS:
+            bad = rng.random(len(frame)) < config.bad_flag_rate
+            flags = np.where(bad, rng.choice(BAD_FLAGS, len(frame)), "G")
+            ordered[column] = np.where(bad, 0.0, frame[column].to_numpy())
+            ordered[f"{column}-Flag"] = flags
+        frame = pd.DataFrame(ordered)
+    return frame, direction[-1] if len(direction) else wind_state
+
+
+def generate_site(site, config, output_dir=OUTPUT_DIR):
+    """
+    Write config.months monthly files for one site; returns their paths.
+    """
+    rng = np.random.default_rng([config.seed, sum(map(ord, site))])
+    layout = "stockton" if site.startswith("Stockton") else "lidcombe"
+    minute = config.freq == "min"
+    directory = os.path.join(output_dir, "minutedata") if layout == "stockton" and minute else output_dir
+    os.makedirs(directory, exist_ok=True)
+
+    paths, wind_state = [], None
+    month = config.start.to_period("M").to_timestamp()
+    for _ in range(config.months):
+        index = month_index(month, config.freq)
+        if layout == "stockton":
+            frame, wind_state = stockton_frame(index, rng, config, minute, wind_state)
+        else:
+            frame = lidcombe_frame(index, rng, config)
+        frame = frame[gap_mask(len(frame), rng, config.gap_rate, config.mean_gap_steps)]
+
+        path = os.path.join(directory, f"{site}_{month.strftime('%Y%m%d')}.csv")
+        frame.to_csv(path, index=False)
+        paths.append(path)
+        month += pd.offsets.MonthBegin(1)
+    return paths
+
+
+def write_observations(path, site_ids, parameter_codes, start, end, config=None):
+    """
+    Stream a get_Observations-shaped JSON array to path, one site and day
+    range at a time, using the mock server's records. Returns the record count.
+    """
+    sites, parameters = load_templates()
+    config = config or MockConfig()
+    count = 0
+    with open(path, "w") as f:
+        f.write("[")
+        for site_id in site_ids:
+            for month in pd.date_range(pd.Timestamp(start).to_period("M").to_timestamp(), end, freq="MS"):
+                month_start = max(month, pd.Timestamp(start))
+                month_end = min(month + pd.offsets.MonthEnd(0), pd.Timestamp(end))
+                records = synthetic_observations({
+                    "Sites": [site_id],
+                    "Parameters": list(parameter_codes),
+                    "StartDate": month_start.strftime("%Y-%m-%d"),
+                    "EndDate": month_end.strftime("%Y-%m-%d"),
+                }, sites, parameters, config)
+                for record in records:
+                    f.write(("," if count else "") + "\n" + json.dumps(record))
+                    count += 1
+        f.write("\n]\n")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Picarro archives and AQMS observation JSON")
+    parser.add_argument("--sites", nargs="*", default=["Lidcombe", "Stockton"])
+    parser.add_argument("--start", default="2023-01", help="first month, YYYY-MM")
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--freq", choices=["min", "h"], default="min")
+    parser.add_argument("--gap-rate", type=float, default=0.02)
+    parser.add_argument("--bad-flag-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--observations", help="also write get_Observations JSON to this file")
+    parser.add_argument("--obs-sites", type=int, nargs="+", default=[39])
+    parser.add_argument("--obs-parameters", nargs="+", default=["NO2"])
+    args = parser.parse_args()
+
+    config = GeneratorConfig(args.start, args.months, args.freq, args.gap_rate, bad_flag_rate=args.bad_flag_rate,
+                             seed=args.seed)
+    for site in args.sites:
+        paths = generate_site(site, config, args.output_dir)
+        size = sum(os.path.getsize(p) for p in paths)
+        print(f"{site}: {len(paths)} files, {size / 2 ** 20:.1f} MB")
+
+    if args.observations:
+        end = config.start + pd.offsets.MonthBegin(config.months) - pd.Timedelta(days=1)
+        n = write_observations(args.observations, args.obs_sites, args.obs_parameters, config.start, end,
+                               MockConfig(seed=args.seed))
+        print(f"Observations: {n} records -> {args.observations}")
@@ -0,0 +1,165 @@
+"""
+Long-term trend and seasonal-cycle fitting (Keeling-curve style).
+
+Each record is fitted with a polynomial in time plus annual harmonics,
+
+    y(t) = sum_k a_k t^k + sum_h [b_h sin(2 pi h t) + c_h cos(2 pi h t)]
+
+with t in decimal years, solved in one least-squares call on the design
+matrix. Fits are cached per (site, gas, data version) in cache/trend_fits.json
+and only redone when the data changes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ghg_loader import CACHE_DIR
+
+FITS_FILE = os.path.join(CACHE_DIR, "trend_fits.json")
+DEFAULT_DEGREE = 2
+DEFAULT_HARMONICS = 4
+T0 = pd.Timestamp("2000-01-01")
+
+
+def decimal_years(index):
+    return ((pd.DatetimeIndex(index) - T0) / pd.Timedelta(days=365.25)).to_numpy(dtype=float)
+
+
+def design_matrix(t, degree, harmonics):
+    columns = [t ** k for k in range(degree + 1)]
+    for h in range(1, harmonics + 1):
+        columns += [np.sin(2 * np.pi * h * t), np.cos(2 * np.pi * h * t)]
+    return np.column_stack(columns)
+
+
+def data_version(series):
+    """
+    Cheap fingerprint of a series; changes whenever values or timestamps do.
+    """
+    h = hashlib.sha1()
+    h.update(pd.util.hash_pandas_object(series, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def fit_trend(series, degree=DEFAULT_DEGREE, harmonics=DEFAULT_HARMONICS):
+    """
+    Fit polynomial + harmonics to a time-indexed series (daily means work best).
+
+    Short records cannot constrain the seasonal cycle: harmonics are only
+    used for records of at least a year and a quadratic needs two years,
+    so the model is reduced accordingly. Returns a dict that can be stored
+    as JSON.
+    """
+    series = series.dropna().sort_index()
+    if len(series) < 3:
+        raise ValueError("Not enough data to fit a trend.")
+
+    t = decimal_years(series.index)
+    span = t[-1] - t[0]
+    harmonics = harmonics if span >= 1 else 0
+    degree = min(degree, 1 if span < 2 else degree)
+
+    # Centre time for numerical conditioning of the polynomial terms
+    t_ref = float(t.mean())
+    X = design_matrix(t - t_ref, degree, 0)
+    if harmonics:
+        X = np.column_stack([X, design_matrix(t, 0, harmonics)[:, 1:]])
+    coef, _, rank, _ = np.linalg.lstsq(X, series.to_numpy(dtype=float), rcond=None)
+    residual = series.to_numpy(dtype=float) - X @ coef
+
+    return {
+        "degree": degree,
+        "harmonics": harmonics,
+        "t_ref": t_ref,
+        "coef": coef.tolist(),
+        "rmse": float(np.sqrt(np.mean(residual ** 2))),
+        "n": int(len(series)),
+        "start": series.index[0].isoformat(),
+        "end": series.index[-1].isoformat(),
+    }
+
+
+def evaluate(fit, index):
+    """
+    Fitted curve, polynomial trend and seasonal component at the given timestamps.
+    """
+    t = decimal_years(index)
+    coef = np.asarray(fit["coef"])
+    n_poly = fit["degree"] + 1
+    trend = design_matrix(t - fit["t_ref"], fit["degree"], 0) @ coef[:n_poly]
+    if fit["harmonics"]:
+        seasonal = design_matrix(t, 0, fit["harmonics"])[:, 1:] @ coef[n_poly:]
+    else:
+        seasonal = np.zeros_like(t)
+    return pd.DataFrame({"fit": trend + seasonal, "trend": trend, "seasonal": seasonal},
+                        index=pd.DatetimeIndex(index))
+
+
+def growth_rate(fit, when=None):
+    """
+    Growth rate of the polynomial trend (units per year) at a timestamp,
+    default the end of the record.
+    """
+    t = decimal_years([pd.Timestamp(when or fit["end"])])[0] - fit["t_ref"]
+    coef = fit["coef"][:fit["degree"] + 1]
+    return float(sum(k * c * t ** (k - 1) for k, c in enumerate(coef) if k > 0))
+
+
+def detrend(series, fit):
+    """
+    Series minus the polynomial trend (the seasonal cycle and noise remain).
+    """
+    return series - evaluate(fit, series.index)["trend"].to_numpy()
+
+
+class TrendCache:
+    """
+    Fits keyed by (site, gas), each remembering the data version it was made from.
+    """
+
+    def __init__(self, path=FITS_FILE):
+        self.path = path
+        self.fits = {}
+        # One cache is shared by all app sessions
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.fits = json.load(f)
+            except ValueError:
+                # Unreadable file: start empty, it is rewritten on the next fit
+                self.fits = {}
+
+    def get(self, site, gas, series, degree=DEFAULT_DEGREE, harmonics=DEFAULT_HARMONICS):
+        """
+        Cached fit for the series, refitted only if the data or model settings changed.
+        """
+        key = f"{site}|{gas}|{degree}|{harmonics}"
+        version = data_version(series)
+        with self._lock:
+            cached = self.fits.get(key)
+        if cached and cached["version"] == version:
+            return cached["fit"]
+
+        fit = fit_trend(series, degree, harmonics)
+        with self._lock:
+            self.fits[key] = {"version": version, "fit": fit}
+            self._save()
+        return fit
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        # Written to a temporary file and swapped in, so readers never see a partial file
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.fits, f, indent=2)
+        os.replace(tmp, self.path)
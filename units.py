@@ -0,0 +1,162 @@
+"""
+Unit registry and column-wise unit conversion.
+
+AQMS reports gases in pphm and particles in µg/m³ (the Units field of
+get_ParameterDetails / get_Observations), the Picarro files use ppm, ppb
+and % (GAS_UNITS in ghg_loader). Every unit is registered with its
+dimension and a linear conversion to that dimension's base unit, so a
+whole column is converted with one multiply-add, and a column holding
+mixed units is converted with one factor lookup per distinct unit.
+"""
+
+import numpy as np
+import pandas as pd
+
+from ghg_loader import GAS_UNITS
+
+# unit -> (dimension, scale, offset), where base = value * scale + offset
+UNITS = {
+    # mixing ratios, base mol/mol
+    "mol/mol": ("mixing ratio", 1.0, 0.0),
+    "%": ("mixing ratio", 1e-2, 0.0),
+    "ppm": ("mixing ratio", 1e-6, 0.0),
+    "pphm": ("mixing ratio", 1e-8, 0.0),
+    "ppb": ("mixing ratio", 1e-9, 0.0),
+    "ppt": ("mixing ratio", 1e-12, 0.0),
+    # mass concentrations, base µg/m³
+    "µg/m³": ("mass concentration", 1.0, 0.0),
+    "mg/m³": ("mass concentration", 1e3, 0.0),
+    "ng/m³": ("mass concentration", 1e-3, 0.0),
+    # temperature, base °C
+    "°C": ("temperature", 1.0, 0.0),
+    "K": ("temperature", 1.0, -273.15),
+    # relative humidity, not a mixing ratio: % on its own is the Picarro H2O fraction
+    "%RH": ("relative humidity", 1.0, 0.0),
+    # speed, base m/s
+    "m/s": ("speed", 1.0, 0.0),
+    "km/h": ("speed", 1 / 3.6, 0.0),
+    "knots": ("speed", 0.514444, 0.0),
+}
+
+# Other spellings seen in files and API responses
+ALIASES = {
+    "ug/m3": "µg/m³",
+    "µg/m3": "µg/m³",
+    "mg/m3": "mg/m³",
+    "ng/m3": "ng/m³",
+    "degc": "°C",
+    "deg c": "°C",
+    "kelvin": "K",
+    "ms-1": "m/s",
+    "m s-1": "m/s",
+    "kmh": "km/h",
+    "kt": "knots",
+    "percent": "%",
+    "%rh": "%RH",
+    "% rh": "%RH",
+}
+
+# AQMS parameters whose "%" is relative humidity
+RELATIVE_HUMIDITY_PARAMETERS = {"HUMID"}
+
+
+class UnitError(ValueError):
+    pass
+
+
+def canonical_unit(unit):
+    """
+    Registered spelling of a unit string, or the stripped input if unknown.
+    """
+    if unit is None or (isinstance(unit, float) and np.isnan(unit)):
+        return ""
+    unit = str(unit).strip()
+    if unit in UNITS:
+        return unit
+    return ALIASES.get(unit.lower(), unit)
+
+
+def dimension(unit):
+    unit = canonical_unit(unit)
+    return UNITS[unit][0] if unit in UNITS else None
+
+
+def compatible_units(unit):
+    """
+    Registered units with the same dimension as unit (just [unit] if unknown).
+    """
+    dim = dimension(unit)
+    if dim is None:
+        return [canonical_unit(unit)]
+    return [u for u, (d, _, _) in UNITS.items() if d == dim]
+
+
+def conversion(from_unit, to_unit):
+    """
+    (scale, offset) such that value_to = value_from * scale + offset.
+    """
+    from_unit, to_unit = canonical_unit(from_unit), canonical_unit(to_unit)
+    if from_unit == to_unit:
+        return 1.0, 0.0
+    if from_unit not in UNITS or to_unit not in UNITS:
+        raise UnitError(f"Cannot convert {from_unit!r} to {to_unit!r}: unknown unit")
+    dim_from, scale_from, offset_from = UNITS[from_unit]
+    dim_to, scale_to, offset_to = UNITS[to_unit]
+    if dim_from != dim_to:
+        raise UnitError(f"Cannot convert {from_unit!r} ({dim_from}) to {to_unit!r} ({dim_to})")
+    return scale_from / scale_to, (offset_from - offset_to) / scale_to
+
+
+def convert(values, from_unit, to_unit):
+    """
+    Convert an array or Series from one unit to another.
+    """
+    scale, offset = conversion(from_unit, to_unit)
+    if isinstance(values, (list, tuple)):
+        values = np.asarray(values, dtype=float)
+    if scale == 1.0 and offset == 0.0:
+        return values
+    return values * scale + offset
+
+
+def convert_mixed(values, units, to_unit):
+    """
+    Convert values whose unit is given per row (e.g. the unit column of the
+    observation store). Factors are looked up once per distinct unit and
+    applied as arrays. Rows with an empty unit (e.g. Stockton station
+    columns) cannot be converted and raise UnitError.
+    """
+    units = pd.Series(units, index=getattr(values, "index", None)).map(canonical_unit)
+    scales, offsets = {}, {}
+    for unit in units.unique():
+        if not unit:
+            raise UnitError(f"Cannot convert values with no unit to {canonical_unit(to_unit)!r}")
+        scales[unit], offsets[unit] = conversion(unit, to_unit)
+    scale = units.map(scales).to_numpy(dtype=float)
+    offset = units.map(offsets).to_numpy(dtype=float)
+    return values * scale + offset
+
+
+def parameter_unit(code, unit):
+    """
+    Registered unit of an AQMS parameter reported in unit; "%" humidity becomes "%RH".
+    """
+    unit = canonical_unit(unit)
+    if unit == "%" and str(code).upper() in RELATIVE_HUMIDITY_PARAMETERS:
+        return "%RH"
+    return unit
+
+
+def parameter_units(parameters):
+    """
+    ParameterCode -> unit for the hourly averages in get_ParameterDetails.
+    """
+    return {p["ParameterCode"]: parameter_unit(p["ParameterCode"], p["Units"]) for p in parameters
+            if p.get("Category") == "Averages" and p.get("SubCategory") == "Hourly"}
+
+
+def picarro_unit(column):
+    """
+    Unit of a harmonized Picarro column (CH4, CO2, ...), "" if unknown.
+    """
+    return GAS_UNITS.get(column, "")
@@ -0,0 +1,97 @@
+"""
+Interactive WebGL time-series charts for long Picarro series.
+
+The series is reduced to a fixed point budget on the server with min/max
+bucketing: the time axis is cut into equal-count buckets and the lowest
+and highest sample of each is kept, so spikes survive at any zoom level
+while the payload stays bounded. Times go to the browser as epoch
+milliseconds and values as float32, which plotly serialises as base64
+typed arrays rather than JSON number lists, and are drawn with Scattergl.
+
+Zoom and pan then happen in the browser without a rerun. For more detail
+the caller re-slices the full-resolution frame to the window of interest
+(ghg_loader.time_slice) and sends that at the same budget; below the
+budget the window is shown sample for sample.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+DEFAULT_MAX_POINTS = 4_000
+
+
+def minmax_indices(values, max_points):
+    """
+    Sorted positions of the minimum and maximum of each of max_points // 2
+    equal-count buckets of values. NaNs are skipped; all-NaN buckets
+    contribute nothing. Short series are returned whole.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max(max_points // 2, 1)
+    width = -(-n // buckets)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = values
+    blocks = padded.reshape(buckets, width)
+
+    valid = ~np.isnan(blocks).all(axis=1)
+    offsets = np.arange(buckets) * width
+    lo = np.where(np.isnan(blocks), np.inf, blocks).argmin(axis=1) + offsets
+    hi = np.where(np.isnan(blocks), -np.inf, blocks).argmax(axis=1) + offsets
+    return np.unique(np.concatenate([lo[valid], hi[valid]]))
+
+
+def downsample(df, column, max_points=DEFAULT_MAX_POINTS):
+    """
+    Rows of df (sorted by time) that keep the shape of column within max_points.
+    """
+    return df.iloc[minmax_indices(df[column].to_numpy(dtype=float, na_value=np.nan), max_points)]
+
+
+def epoch_ms(times):
+    """
+    Naive timestamps as float64 milliseconds since the epoch; a plotly date
+    axis shows them at the same wall-clock time.
+    """
+    times = pd.DatetimeIndex(times)
+    return ((times - pd.Timestamp("1970-01-01")) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.float64)
+
+
+def series_trace(df, column, name, max_points=DEFAULT_MAX_POINTS, time_column="datetime", **style):
+    """
+    Scattergl trace of one column, downsampled to max_points.
+    """
+    points = downsample(df, column, max_points)
+    return go.Scattergl(
+        x=epoch_ms(points[time_column]),
+        y=points[column].to_numpy(dtype=np.float32, na_value=np.nan),
+        name=name,
+        mode="lines",
+        **style,
+    )
+
+
+def time_series_figure(traces, title, y_label, bars=None, revision=None):
+    """
+    Figure on a date axis. bars: optional (times, values, name) drawn as a
+    translucent bar layer (daily means). revision keeps the user's zoom
+    across reruns until it changes.
+    """
+    fig = go.Figure(list(traces))
+    if bars is not None:
+        times, values, name = bars
+        fig.add_trace(go.Bar(x=epoch_ms(times), y=np.asarray(values, dtype=np.float32), name=name, opacity=0.3))
+    fig.update_layout(
+        title=title,
+        template="plotly_white",
+        xaxis=dict(type="date", title="Time"),
+        yaxis=dict(title=y_label),
+        hovermode="x unified",
+        uirevision=revision,
+        legend=dict(orientation="h", y=-0.2),
+    )
+    return fig